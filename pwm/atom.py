@@ -4,6 +4,11 @@
 from pwm.ffi.xcb import xcb
 
 _atom_cache = {}
+_name_cache = {}
+
+# Cache statistics, useful to check that we don't talk to the X server more
+# often than necessary.
+stats = {"hits": 0, "misses": 0}
 
 _NET_WM_STATE_REMOVE = 0  # remove/unset property
 _NET_WM_STATE_ADD = 1  # add/set property
@@ -19,20 +24,50 @@ def get(atom_name, only_if_exists=False):
     If 'only_if_exists' is false, then the atom is created if it does not exist
     already.
     """
-    global _atom_cache
-
     if atom_name in _atom_cache:
+        stats["hits"] += 1
         return _atom_cache[atom_name]
 
+    stats["misses"] += 1
     atom = xcb.core.intern_atom_unchecked(only_if_exists, len(atom_name),
                                           atom_name.encode("UTF-8"))
     atom = atom.reply().atom
-    _atom_cache[atom_name] = atom
+    _cache(atom_name, atom)
 
     return atom
 
 
+def prefetch(atom_names, only_if_exists=False):
+    """Query the X server for many ATOM identifiers at once.
+
+    All intern requests are sent before the first reply is waited for, which
+    means that the whole batch only costs a single round trip. Names which are
+    already cached are skipped.
+    """
+    cookies = []
+    for atom_name in atom_names:
+        if atom_name in _atom_cache:
+            continue
+
+        cookies.append((atom_name, xcb.core.intern_atom_unchecked(
+            only_if_exists, len(atom_name), atom_name.encode("UTF-8"))))
+
+    stats["misses"] += len(cookies)
+    for atom_name, cookie in cookies:
+        _cache(atom_name, cookie.reply().atom)
+
+
 def get_name(atom):
+    """Return the name of an ATOM identifier.
+
+    Names of atoms which were interned with get() or prefetch() are known
+    already, all others are queried once and cached afterwards.
+    """
+    if atom in _name_cache:
+        stats["hits"] += 1
+        return _name_cache[atom]
+
+    stats["misses"] += 1
     try:
         reply = xcb.core.get_atom_name(atom).reply()
     except:
@@ -43,4 +78,16 @@ def get_name(atom):
 
     name = xcb.ffi.string(xcb.get_atom_name_name(reply), reply.name_len)
     name = name.decode("UTF-8")
+    _cache(name, atom)
+
     return name
+
+
+def _cache(atom_name, atom):
+    """Remember the mapping in both directions."""
+    _atom_cache[atom_name] = atom
+
+    # ATOM_NONE is returned for every unknown name when only_if_exists is set,
+    # so it must not be mapped back to any of them.
+    if atom != xcb.ATOM_NONE:
+        _name_cache[atom] = atom_name
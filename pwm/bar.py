@@ -1,6 +1,9 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import math
+import time
+
 from pwm.config import config
 from pwm.ffi.xcb import xcb
 from pwm.ffi.cairo import cairo
@@ -8,10 +11,37 @@ import pwm.color as color
 import pwm.events
 import pwm.windows
 import pwm.widgets
+import pwm.scheduler
+import pwm.text
 
 primary = None
 
 
+class Segment:
+    """A part of the bar which is only redrawn if it changed.
+
+    The pixmap of the bar keeps the last drawing of every segment, so a
+    segment which did not change is neither drawn nor copied again.
+    """
+
+    def __init__(self, draw):
+        self.draw = draw
+        self.x = 0
+        self.width = 0
+        self.content = None
+        self.dirty = True
+
+    def update(self, x, width, content):
+        """Set the area and content, return true if it has to be redrawn."""
+        if (x, width, content) != (self.x, self.width, self.content):
+            self.x = x
+            self.width = width
+            self.content = content
+            self.dirty = True
+
+        return self.dirty
+
+
 class Bar:
     def __init__(self):
         self.x = 0
@@ -21,11 +51,24 @@ class Bar:
 
         self.workspaces_end = 0
         self.systray_width = 0
+        self.title = ""
+
+        # The bar is rendered at most once per frame interval.
+        self.frame_interval = getattr(config.bar, "frame_interval", 1/60)
+        self.last_render = None
+        self.render_pending = False
+
+        self.segments = [Segment(self.draw_open_workspaces),
+                         Segment(self.draw_window_text),
+                         Segment(self.draw_widgets),
+                         # The gap for the systray icons.
+                         Segment(None)]
 
         self.wid = self.create_window()
         self.pixmap = self.create_pixmap()
         self.gc = self.create_gc()
         (self.surface, self.ctx) = self.create_cairo_context()
+        self.font = (config.bar.font.face, config.bar.font.size)
         self.extents = self.font_extents()
         self.center_y = (self.height/2 - self.extents.descent +
                          self.extents.height/2)
@@ -44,6 +87,7 @@ class Bar:
                           self.handle_window_urgent_set)
 
     def destroy(self):
+        self.render_pending = False
         self.handlers.destroy()
         pwm.windows.destroy(self.wid)
         cairo.surface_destroy(self.surface)
@@ -109,40 +153,49 @@ class Bar:
         self.ctx.set_operator(cairo.OPERATOR_SOURCE)
         self.ctx.paint()
 
-    def draw_open_workspaces(self):
-        """Draw indicators for all open workspaces.
+    def workspace_boxes(self):
+        """Return the width of a workspace box and the state of all open
+        workspaces.
 
-        Each open workspace is represented by a little box with
-        a number in it.
+        The state is a list of (index, kind) tuples, where kind is one of
+        "urgent", "active" or "inactive".
         """
 
         # Figure out how big the boxes should be
         # Take the size of the text and add padding
-        # Note that we have to align everything on 0.5 to avoid blurring
         ws_chars = len("%d" % (len(pwm.workspaces.workspaces)-1))
         padding_left = 5
         box_width = self.extents.max_x_advance*ws_chars + 2*padding_left
-        padding_top = 0.5
-        box_height = self.height - 2*padding_top
 
-        left = 0.5
+        states = []
         for widx, ws in pwm.workspaces.opened():
-            fg = None
-            bg = None
-            border = None
-
             if ws.is_urgent():
-                fg = config.bar.urgent_workspace_foreground
-                bg = config.bar.urgent_workspace_background
-                border = config.bar.urgent_workspace_border
+                kind = "urgent"
             elif ws == pwm.workspaces.current():
-                fg = config.bar.active_workspace_foreground
-                bg = config.bar.active_workspace_background
-                border = config.bar.active_workspace_border
+                kind = "active"
             else:
-                fg = config.bar.inactive_workspace_foreground
-                bg = config.bar.inactive_workspace_background
-                border = config.bar.inactive_workspace_border
+                kind = "inactive"
+            states.append((widx, kind))
+
+        return box_width, tuple(states)
+
+    def draw_open_workspaces(self, segment):
+        """Draw indicators for all open workspaces.
+
+        Each open workspace is represented by a little box with
+        a number in it.
+        """
+
+        # Note that we have to align everything on 0.5 to avoid blurring
+        box_width, states = segment.content
+        padding_top = 0.5
+        box_height = self.height - 2*padding_top
+
+        left = 0.5
+        for widx, kind in states:
+            fg = getattr(config.bar, kind + "_workspace_foreground")
+            bg = getattr(config.bar, kind + "_workspace_background")
+            border = getattr(config.bar, kind + "_workspace_border")
 
             # Draw the box
             self.ctx.set_source_rgb(*color.get_rgb(bg))
@@ -160,7 +213,7 @@ class Bar:
             text = "%d" % (widx+1)
 
             center_x = left + box_width / 2
-            self.ctx.move_to(center_x - self.extents.max_x_advance*len(text)/2,
+            self.ctx.move_to(center_x - self.text_width(text)/2,
                              self.center_y)
             self.ctx.set_source_rgb(*color.get_rgb(fg))
             self.ctx.show_text(text)
@@ -168,29 +221,27 @@ class Bar:
             # Advance to the next position
             left += box_width + 2
 
-        self.workspaces_end = left
-
-    def draw_window_text(self):
-        if not pwm.windows.focused:
-            return
-
-        text = pwm.windows.get_name(pwm.windows.focused)
-        if text == "":
+    def draw_window_text(self, segment):
+        if not segment.content:
             return
 
         self.ctx.set_source_rgb(1, 1, 1)
         self.ctx.move_to(self.workspaces_end + 10, self.center_y)
-        self.ctx.show_text(text)
+        self.ctx.show_text(segment.content)
+
+    def text_width(self, text):
+        return pwm.text.extents(self.ctx, self.font, text).x_advance
 
-    def draw_widgets(self):
-        offset = self.systray_width + 5
-        for widget in reversed(pwm.widgets.output):
+    def draw_widgets(self, segment):
+        systray_width, widgets = segment.content
+        offset = systray_width + 5
+        for widget in reversed(widgets):
             col, text = widget
 
             if not col:
                 col = config.bar.foreground
 
-            width = self.extents.max_x_advance*len(text)
+            width = self.text_width(text)
             self.ctx.move_to(
                 self.width - offset - width,
                 self.center_y)
@@ -199,17 +250,105 @@ class Bar:
 
             offset += width + 2
 
-    def copy_pixmap(self):
+    def draw_segment(self, segment):
+        """Draw the background and content of a segment clipped to its area."""
+        self.ctx.save()
+        self.ctx.rectangle(segment.x, 0, segment.width, self.height)
+        self.ctx.clip()
+
+        self.draw_background()
+        if segment.draw:
+            segment.draw(segment)
+
+        self.ctx.restore()
+        segment.dirty = False
+
+    def copy_pixmap(self, x=0, width=None):
+        if width is None:
+            width = self.width
+
         xcb.core.copy_area(self.pixmap, self.wid, self.gc,
-                           0, 0, 0, 0, self.width, self.height)
+                           x, 0, x, 0, width, self.height)
+
+    def layout(self):
+        """Return the area and content of every segment.
+
+        The segments cover the whole bar from left to right, so if one of them
+        is moved or resized its neighbours change as well.
+        """
+        box_width, states = self.workspace_boxes()
+        self.workspaces_end = 0.5 + len(states)*(box_width + 2)
+        workspaces_width = math.ceil(self.workspaces_end)
+
+        widgets = tuple(pwm.widgets.output)
+        systray_x = self.width - self.systray_width
+        widgets_width = sum(self.text_width(text) + 2 for _, text in widgets)
+        # Text widths are fractional but copy_area() needs whole pixels.
+        widgets_x = math.floor(systray_x - 5 - widgets_width)
+        widgets_x = max(widgets_x, workspaces_width)
+
+        return [(0, workspaces_width, (box_width, states)),
+                (workspaces_width, widgets_x - workspaces_width, self.title),
+                (widgets_x, systray_x - widgets_x,
+                 (self.systray_width, widgets)),
+                (systray_x, self.systray_width, None)]
+
+    def invalidate(self):
+        """Redraw the whole bar with the next update."""
+        for segment in self.segments:
+            segment.dirty = True
 
     def update(self):
-        """Update the bar."""
-        self.draw_background()
-        self.draw_open_workspaces()
-        self.draw_widgets()
-        self.draw_window_text()
-        self.copy_pixmap()
+        """Update the bar.
+
+        If the bar was not rendered within the last frame interval it is
+        rendered right away, otherwise once the interval is over. Any further
+        updates until then are merged into that rendering.
+        """
+        if self.render_pending:
+            return
+
+        wait = 0
+        if self.last_render is not None:
+            wait = self.last_render + self.frame_interval - time.monotonic()
+
+        if wait <= 0:
+            self.render()
+        else:
+            self.render_pending = True
+            pwm.scheduler.call_later(wait, self.render_pending_frame)
+
+    def render_pending_frame(self):
+        # The bar might have been destroyed in the meantime.
+        if self.render_pending:
+            self.render_pending = False
+            self.render()
+
+    def render(self):
+        """Render the bar.
+
+        Only the segments whose area or content changed are redrawn and copied
+        to the window.
+        """
+        self.last_render = time.monotonic()
+
+        damaged = []
+        for segment, area in zip(self.segments, self.layout()):
+            if segment.update(*area):
+                self.draw_segment(segment)
+                damaged.append(segment)
+
+        for segment in damaged:
+            if segment.width > 0:
+                self.copy_pixmap(segment.x, segment.width)
+
+    def update_title(self):
+        """Read the name of the focused window and update the bar."""
+        if pwm.windows.focused:
+            self.title = pwm.windows.get_name(pwm.windows.focused)
+        else:
+            self.title = ""
+        self.update()
 
     def update_systray(self, width):
         self.systray_width = width
@@ -218,22 +357,23 @@ class Bar:
     def show(self):
         """Map the bar and update it."""
         xcb.core.map_window(self.wid)
-        self.update()
+        self.invalidate()
+        self.update_title()
 
     def handle_focus_changed(self, wid):
-        self.update()
+        self.update_title()
 
     def handle_window_name_changed(self, wid):
         if wid == pwm.windows.focused:
-            self.update()
+            self.update_title()
 
     def handle_window_unmapped(self, wid):
         # Even if it was not the focused window, closing this window
         # might have caused a workspace to be closed
-        self.update()
+        self.update_title()
 
     def handle_workspace_switched(self, idx):
-        self.update()
+        self.update_title()
 
     def handle_window_exposed(self, wid):
         if wid == self.wid:
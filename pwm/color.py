@@ -1,10 +1,94 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
-from pwm.ffi.xcb import xcb
+import logging
+
+from pwm.config import config
+from pwm.ffi.xcb import xcb, XcbError
+
+_pixel_cache = {}
+_rgb_cache = {}
+
+# Cache statistics, useful to check that we don't talk to the X server more
+# often than necessary.
+stats = {"hits": 0, "misses": 0}
+
+# The color options of the configuration, as (section, name) tuples.
+CONFIG_COLORS = [
+    ("bar", "background"),
+    ("bar", "foreground"),
+    ("bar", "active_workspace_foreground"),
+    ("bar", "active_workspace_background"),
+    ("bar", "active_workspace_border"),
+    ("bar", "inactive_workspace_foreground"),
+    ("bar", "inactive_workspace_background"),
+    ("bar", "inactive_workspace_border"),
+    ("bar", "urgent_workspace_foreground"),
+    ("bar", "urgent_workspace_background"),
+    ("bar", "urgent_workspace_border"),
+    ("bar", "separator"),
+    ("window", "focused"),
+    ("window", "unfocused"),
+    ("window", "urgent"),
+]
 
 
 def get_pixel(color):
+    """Return the pixel value of color.
+
+    The color is only allocated if it is not cached.
+    """
+    if color in _pixel_cache:
+        stats["hits"] += 1
+        return _pixel_cache[color]
+
+    stats["misses"] += 1
+    pixel = _request_pixel(color).reply().pixel
+    _pixel_cache[color] = pixel
+
+    return pixel
+
+
+def prefetch(colors):
+    """Allocate all given colors which are not cached yet.
+
+    All requests are sent before waiting for the first reply.
+    """
+    cookies = []
+    for color in set(colors):
+        if color in _pixel_cache:
+            continue
+
+        try:
+            cookies.append((color, _request_pixel(color)))
+        except ValueError:
+            # get_pixel() raises the error again once the color is used.
+            logging.error("Invalid color: {}".format(color))
+            continue
+
+        if color.startswith("#"):
+            get_rgb(color)
+
+    for color, cookie in cookies:
+        try:
+            _pixel_cache[color] = cookie.reply().pixel
+        except XcbError:
+            # E.g. an unknown color name, get_pixel() raises it again.
+            logging.error("Invalid color: {}".format(color))
+
+
+def prefetch_config():
+    """Prefetch every color of the bar and window configuration."""
+    colors = []
+    for section, name in CONFIG_COLORS:
+        value = getattr(getattr(config, section), name, None)
+        if isinstance(value, str):
+            colors.append(value)
+
+    prefetch(colors)
+
+
+def _request_pixel(color):
     if color.startswith("#"):
         if len(color) != 7:
             raise ValueError("Invalid color: %s" % color)
@@ -16,16 +100,21 @@ def get_pixel(color):
         g = x8to16(int(color[3] + color[4], 16))
         b = x8to16(int(color[5] + color[6], 16))
 
-        return xcb.core.alloc_color(xcb.screen.default_colormap,
-                                    r, g, b).reply().pixel
+        return xcb.core.alloc_color(xcb.screen.default_colormap, r, g, b)
     else:
         return xcb.core.alloc_named_color(xcb.screen.default_colormap,
-                                          len(color), color).reply().pixel
+                                          len(color), color)
 
 
 def get_rgb(color):
     """Convert a hex color value to a rgb tuple with range 0-1."""
+    if color in _rgb_cache:
+        return _rgb_cache[color]
+
     value = color.lstrip('#')
     lv = len(value)
     step = int(lv/3)
-    return tuple(int(value[i:i+step], 16)/255 for i in range(0, lv, step))
+    rgb = tuple(int(value[i:i+step], 16)/255 for i in range(0, lv, step))
+
+    _rgb_cache[color] = rgb
+    return rgb
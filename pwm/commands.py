@@ -1,6 +1,8 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import logging
+
 import pwm.windows
 import pwm.workspaces
 import pwm.menu
@@ -9,6 +11,7 @@ import pwm.worker
 import pwm.events
 import pwm.main
 import pwm.config
+import pwm.keymap
 
 
 @pwm.config.create_arguments
@@ -114,3 +117,30 @@ def toggle_fullscreen(focused, ws):
 def menu():
     """Show the application menu."""
     pwm.menu.show()
+
+
+@pwm.config.create_arguments
+def mode(name):
+    """Switch to the key mode with the given name.
+
+    The keys of the configuration belong to the mode "default".
+    """
+    pwm.keymap.set_mode(name)
+
+
+@pwm.config.create_arguments
+def toggle_profiling():
+    """Toggle profiling of event handlers on/off.
+
+    When turned off, the profile is logged and written to /tmp/pwm-profile.log.
+    """
+    pwm.events.profiling = not pwm.events.profiling
+
+    if pwm.events.profiling:
+        logging.info("Profiling event handlers...")
+        pwm.events.profile.clear()
+        pwm.events.timings.clear()
+    else:
+        for line in pwm.events.profile_report():
+            logging.info("Profile: {}".format(line))
+        pwm.events.dump_profile(pwm.events.PROFILE_PATH)
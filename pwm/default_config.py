@@ -15,8 +15,15 @@ class Values():
 # The log will be written to /tmp/pwm.log
 loglevel = "info"
 
+# The event loop, either "threaded" or "select".
+# The threaded loop hands every event to a worker thread. The select loop
+# handles events, timers and widget updates in a single thread.
+event_loop = "threaded"
+
 bar = Values(
     interval=1.0,
+    # The bar is redrawn at most once per frame_interval seconds.
+    frame_interval=1/60,
     font=Values(face="DejaVu Sans Mono", size=12),
 
     background="#222222",
@@ -77,6 +84,8 @@ workspaces = 10
 # Avaliable modifiers are:
 #    Control, Shift, Mod1, Mod2, Mod3, Mod4, Mod5
 # Whereas Mod4 is usually the Super/Windows key
+# Several of those separated by spaces form a key chord, e.g. "Mod4-x Mod4-c"
+# is triggered by pressing Mod4-x and then Mod4-c.
 #
 # The second value is the function to execute.
 keys = [
@@ -103,6 +112,7 @@ keys = [
     ("Control-Mod4-j", cmd.resize((0, 0.02))),
     ("Control-Mod4-k", cmd.resize((0, -0.02))),
     ("Control-Mod4-l", cmd.resize((0.02, 0))),
+    ("Mod4-r", cmd.mode("resize")),
 
     ("XF86AudioRaiseVolume", cmd.spawn("amixer -q set Master 2dB+ unmute")),
     ("XF86AudioLowerVolume", cmd.spawn("amixer -q set Master 2dB- unmute")),
@@ -120,12 +130,31 @@ for i in range(9):
 keys.append(("Mod4-0", cmd.switch_workspace(9)))
 keys.append(("Shift-Mod4-0", cmd.send_to_workspace(9)))
 
+# Seconds to wait for the next key of a chord.
+key_timeout = 1.0
+
+# Modes have their own keys, which replace the keys above while the mode is
+# active. The keys above belong to the mode "default".
+modes = {
+    "resize": [
+        ("h", cmd.resize((-0.02, 0))),
+        ("j", cmd.resize((0, 0.02))),
+        ("k", cmd.resize((0, -0.02))),
+        ("l", cmd.resize((0.02, 0))),
+        ("Escape", cmd.mode("default")),
+        ("Return", cmd.mode("default")),
+    ],
+}
+
 
 # You can define rules for some windows.
 # Each rule has a property and its value used to match a window.
 # There are three possible properties: class, role and name.
 # Use the xprop tool and look for WM_CLASS, WM_WINDOW_ROLE and _NET_WM_NAME
 # (or WM_NAME), to get the correct values.
+# A rule can make a window floating or place it on a given workspace, e.g.
+#     Rule("class", "firefox", workspace=1)
+# Note that workspace indices are zero-based.
 rules = [
     Rule("role", "preferences", floating=True),
     Rule("class", "truecrypt", floating=True),
@@ -3,32 +3,166 @@
 
 import logging
 import functools
+import os
+import re
+import selectors
+import threading
+import time
 
 from pwm.ffi.xcb import xcb, XcbError
 import pwm.atom
 import pwm.windows
 import pwm.workspaces
 import pwm.keybind
+import pwm.keymap
 import pwm.systray
 import pwm.menu
 import pwm.worker
+import pwm.scheduler
+import pwm.histogram
 
 
 shutdown = False
 
+# How many events were received from the X server and how many of them were
+# left to be handled after merging redundant ones.
+stats = {"received": 0, "handled": 0}
 
-class Event(set):
-    """Simple event class based on a set."""
+# If set, Event records how long its handlers take in profile, which maps
+# (event name, handler name) to a Histogram. The handler name None stands for
+# all handlers of an event together. The handlers of X events are recorded in
+# timings.
+profiling = False
+profile = {}
+PROFILE_PATH = "/tmp/pwm-profile.log"
+
+# Guards stats and the histograms in profile and timings, which are updated
+# by the event loop and the worker thread.
+_lock = threading.Lock()
+
+# Maps every event type to a list of (ctype, handler) tuples, see register().
+handlers = {}
+# The names of the event types and, while profiling, the time it took to
+# handle them.
+names = {}
+timings = {}
+
+
+class Event:
+    """Simple event class holding a set of handlers.
+
+    The handlers are stored in a tuple which is replaced whenever a handler is
+    added or removed, so firing needs no copy to enable manipulation during
+    firing.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.handlers = ()
+
+    def add(self, handler):
+        if handler not in self.handlers:
+            self.handlers = self.handlers + (handler,)
+
+    def remove(self, handler):
+        if handler not in self.handlers:
+            raise KeyError(handler)
+        self.handlers = tuple(h for h in self.handlers if h != handler)
+
+    def discard(self, handler):
+        if handler in self.handlers:
+            self.remove(handler)
+
+    def __contains__(self, handler):
+        return handler in self.handlers
+
+    def __iter__(self):
+        return iter(self.handlers)
+
+    def __len__(self):
+        return len(self.handlers)
 
     def fire(self, *args, **kargs):
         """Call all handlers."""
 
-        # Iterate over a copy to enable manipulation during firing
-        for handler in self.copy():
+        if profiling:
+            self._fire_profiled(args, kargs)
+            return
+
+        for handler in self.handlers:
             handler(*args, **kargs)
 
     __call__ = fire
 
+    def _fire_profiled(self, args, kargs):
+        """Call all handlers and record how long each of them took."""
+        start = time.perf_counter()
+
+        for handler in self.handlers:
+            handler_start = time.perf_counter()
+            try:
+                handler(*args, **kargs)
+            finally:
+                _record(profile, (self.name, _handler_name(handler)),
+                        time.perf_counter() - handler_start)
+
+        _record(profile, (self.name, None), time.perf_counter() - start)
+
+
+def _handler_name(handler):
+    name = getattr(handler, "__qualname__", None) or repr(handler)
+    module = getattr(handler, "__module__", None)
+    return "{}.{}".format(module, name) if module else name
+
+
+def _record(histograms, key, value):
+    """Add value to the histogram of key, create it if necessary."""
+    with _lock:
+        if key not in histograms:
+            histograms[key] = pwm.histogram.Histogram()
+        histograms[key].add(value)
+
+
+def profile_report():
+    """Return a line for every profiled event and handler.
+
+    Events are ordered by their total time, each one is followed by its
+    handlers ordered the same way.
+    """
+    def _total(item):
+        return item[1].total
+
+    with _lock:
+        events = sorted(((event, histogram)
+                         for (event, handler), histogram in profile.items()
+                         if handler is None), key=_total, reverse=True)
+
+        lines = []
+        for event, histogram in events:
+            lines.append("{}: {}".format(event, histogram.format()))
+
+            handlers = sorted(((handler, histogram)
+                               for (e, handler), histogram in profile.items()
+                               if e == event and handler is not None),
+                              key=_total, reverse=True)
+            for handler, histogram in handlers:
+                lines.append("    {}: {}".format(handler,
+                                                 histogram.format()))
+
+    return lines
+
+
+def dump_profile(path):
+    """Write the profile of all events and X event types to path."""
+    with open(path, "w") as f:
+        f.write("Events:\n")
+        for line in profile_report():
+            f.write(line + "\n")
+
+        f.write("\nX events:\n")
+        for line in timings_report():
+            f.write(line + "\n")
+
 
 class HandlerList:
     """A list of event handlers."""
@@ -46,22 +180,22 @@ class HandlerList:
 
 
 # handler(window)
-focus_changed = Event()
+focus_changed = Event("focus_changed")
 
 # handler(window)
-window_name_changed = Event()
+window_name_changed = Event("window_name_changed")
 
 # handler(window)
-window_unmapped = Event()
+window_unmapped = Event("window_unmapped")
 
 # handler(window)
-window_exposed = Event()
+window_exposed = Event("window_exposed")
 
 # handler(index)
-workspace_switched = Event()
+workspace_switched = Event("workspace_switched")
 
 # handler(window)
-window_urgent_set = Event()
+window_urgent_set = Event("window_urgent_set")
 
 
 def loop():
@@ -69,63 +203,318 @@ def loop():
         try:
             ev = xcb.core.wait_for_event()
             if ev:
-                pwm.worker.tasks.put(functools.partial(_handle, ev))
+                received = _drain(ev)
+                events = coalesce(received)
+                _count(received, events)
+
+                for ev in events:
+                    pwm.worker.tasks.put(functools.partial(_handle, ev))
         except XcbError:
             logging.exception("XCB Error")
 
 
+def select_loop():
+    """Handle events without the worker thread.
+
+    The connection is polled with a selector and every batch of events is
+    handled right away in this thread, followed by the due schedulers and
+    queued tasks. Requests are flushed once per batch. Tasks queued by other
+    threads wake up the selector through a pipe.
+    """
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    pwm.worker.tasks.wakeup = wakeup_write
+
+    selector = selectors.DefaultSelector()
+    selector.register(xcb.core.get_file_descriptor(), selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+
+    try:
+        while not shutdown:
+            pwm.scheduler.run_due()
+            pwm.worker.run_pending()
+
+            # Xcb might already have read events from the connection while
+            # waiting for a reply, those would not wake up the selector.
+            received = _poll()
+            events = coalesce(received)
+            _count(received, events)
+
+            for ev in events:
+                try:
+                    _handle(ev)
+                except:
+                    logging.exception("Event handling error")
+
+            xcb.core.flush()
+
+            if not (events or shutdown) and pwm.worker.tasks.empty():
+                ready = selector.select(pwm.scheduler.timeout())
+                if any(key.fd == wakeup_read for key, _ in ready):
+                    _read_all(wakeup_read)
+                elif ready and xcb.core.connection_has_error():
+                    logging.error("Lost the connection to the X server")
+                    break
+    finally:
+        pwm.worker.tasks.wakeup = None
+        selector.close()
+        os.close(wakeup_read)
+        os.close(wakeup_write)
+
+
+def _read_all(fd):
+    """Read everything available from a non-blocking file descriptor."""
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _count(received, handled):
+    """Add the received and handled events to stats."""
+    with _lock:
+        stats["received"] += len(received)
+        stats["handled"] += len(handled)
+
+
+def _poll():
+    """Return all events which are already available."""
+    events = []
+
+    event = xcb.core.poll_for_event()
+    while event:
+        events.append(event)
+        event = xcb.core.poll_for_event()
+
+    return events
+
+
+def _drain(event):
+    """Return the given event followed by all events already queued."""
+    return [event] + _poll()
+
+
+def coalesce(events):
+    """Merge redundant events and return the remaining ones.
+
+    Only the latest of these events is kept for every window:
+        - Property notifies about the name, handlers read the name anyway.
+        - Configure requests, the values of the dropped ones are merged into
+          the latest one.
+        - Exposes, the whole window gets redrawn anyway.
+    Events are never merged across a map request, unmap or destroy of their
+    window. The dropped events are freed.
+    """
+    survivors = []
+    # Maps (event type, window) to the index of the latest such event.
+    pending = {}
+
+    for event in events:
+        etype = event.response_type & ~0x80
+        key = _coalesce_key(etype, event)
+
+        if key is None:
+            wid = _lifecycle_window(etype, event)
+            if wid is not None:
+                for k in [k for k in pending if k[1] == wid]:
+                    del pending[k]
+
+            survivors.append(event)
+            continue
+
+        idx = pending.get(key)
+        if idx is not None:
+            earlier = survivors[idx]
+            if etype == xcb.CONFIGURE_REQUEST:
+                _merge_configure_request(earlier, event)
+            survivors[idx] = None
+            xcb.free(earlier)
+
+        pending[key] = len(survivors)
+        survivors.append(event)
+
+    return [ev for ev in survivors if ev is not None]
+
+
+def _coalesce_key(etype, event):
+    """Return the key under which this event can be merged or None."""
+    if etype == xcb.PROPERTY_NOTIFY:
+        event = xcb.ffi.cast("xcb_property_notify_event_t*", event)
+        if event.atom in (xcb.ATOM_WM_NAME, pwm.atom.get("_NET_WM_NAME")):
+            return (etype, event.window)
+
+    elif etype == xcb.CONFIGURE_REQUEST:
+        event = xcb.ffi.cast("xcb_configure_request_event_t*", event)
+        return (etype, event.window)
+
+    elif etype == xcb.EXPOSE:
+        event = xcb.ffi.cast("xcb_expose_event_t*", event)
+        return (etype, event.window)
+
+    return None
+
+
+def _lifecycle_window(etype, event):
+    """Return the window which is mapped, unmapped or destroyed by this event.
+
+    Return None for every other event.
+    """
+    if etype == xcb.MAP_REQUEST:
+        return xcb.ffi.cast("xcb_map_request_event_t*", event).window
+    elif etype == xcb.UNMAP_NOTIFY:
+        return xcb.ffi.cast("xcb_unmap_notify_event_t*", event).window
+    elif etype == xcb.DESTROY_NOTIFY:
+        return xcb.ffi.cast("xcb_destroy_notify_event_t*", event).window
+    return None
+
+
+def _merge_configure_request(earlier, later):
+    """Copy the values only requested by the earlier event into the later."""
+    earlier = xcb.ffi.cast("xcb_configure_request_event_t*", earlier)
+    later = xcb.ffi.cast("xcb_configure_request_event_t*", later)
+
+    fields = [(xcb.CONFIG_WINDOW_X, "x"),
+              (xcb.CONFIG_WINDOW_Y, "y"),
+              (xcb.CONFIG_WINDOW_WIDTH, "width"),
+              (xcb.CONFIG_WINDOW_HEIGHT, "height"),
+              (xcb.CONFIG_WINDOW_BORDER_WIDTH, "border_width"),
+              (xcb.CONFIG_WINDOW_SIBLING, "sibling"),
+              (xcb.CONFIG_WINDOW_STACK_MODE, "stack_mode")]
+
+    for mask, field in fields:
+        if earlier.value_mask & mask and not later.value_mask & mask:
+            setattr(later, field, getattr(earlier, field))
+            later.value_mask |= mask
+
+
+def register(etype, handler, ctype="xcb_generic_event_t*"):
+    """Call handler(event) for every event of the type etype.
+
+    The event is cast to ctype first. Handlers of the same type are called in
+    the order they were registered.
+    """
+    # Replace the list instead of changing it, so an event being handled
+    # in another thread is not affected.
+    handlers[etype] = handlers.get(etype, []) + [(ctype, handler)]
+    names.setdefault(etype, re.sub(r"^xcb_|_event_t\*$", "", ctype).upper())
+
+
+def unregister(etype, handler):
+    """Remove a handler added with register()."""
+    handlers[etype] = [(c, h) for c, h in handlers.get(etype, [])
+                       if h != handler]
+
+
+class AtomTable:
+    """Handlers for events which refer to an atom, such as client messages.
+
+    Handlers are registered with the atom or its name. The names are resolved
+    only once, when the first event is dispatched.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.table = None
+
+    def register(self, atom, handler):
+        self.handlers = self.handlers + [(atom, handler)]
+        self.table = None
+
+    def unregister(self, atom, handler):
+        self.handlers = [(a, h) for a, h in self.handlers
+                         if (a, h) != (atom, handler)]
+        self.table = None
+
+    def get(self, atom):
+        """Return the handlers for the atom."""
+        table = self.table
+        if table is None:
+            table = self.table = self._resolve()
+        return table.get(atom, ())
+
+    def _resolve(self):
+        table = {}
+        for atom, handler in self.handlers:
+            if isinstance(atom, str):
+                atom = pwm.atom.get(atom)
+            table.setdefault(atom, []).append(handler)
+        return table
+
+
 def _handle(event):
     etype = event.response_type & ~0x80
 
-    if etype == xcb.MAP_REQUEST:
-        event = xcb.ffi.cast("xcb_map_request_event_t*", event)
-        pwm.windows.manage(event.window)
+    try:
+        entries = handlers.get(etype)
+        if entries and profiling:
+            _handle_profiled(etype, entries, event)
+        elif entries:
+            for ctype, handler in entries:
+                handler(xcb.ffi.cast(ctype, event))
+    finally:
+        xcb.free(event)
 
-    elif etype == xcb.UNMAP_NOTIFY:
-        event = xcb.ffi.cast("xcb_unmap_notify_event_t*", event)
-        handle_unmap(event.window)
 
-    elif etype == xcb.DESTROY_NOTIFY:
-        event = xcb.ffi.cast("xcb_destroy_notify_event_t*", event)
-        handle_unmap(event.window)
+def _handle_profiled(etype, entries, event):
+    """Call the handlers of an X event and record how long they take."""
+    start = time.perf_counter()
 
-    elif etype == xcb.CONFIGURE_REQUEST:
-        event = xcb.ffi.cast("xcb_configure_request_event_t*", event)
-        logging.debug("CONFIGURE_REQUEST {}".format(event.window))
-        handle_configure_request(event)
+    for ctype, handler in entries:
+        handler(xcb.ffi.cast(ctype, event))
 
-    elif etype == xcb.EXPOSE:
-        event = xcb.ffi.cast("xcb_expose_event_t*", event)
-        window_exposed(event.window)
+    _record(timings, etype, time.perf_counter() - start)
 
-    elif etype == xcb.ENTER_NOTIFY:
-        event = xcb.ffi.cast("xcb_enter_notify_event_t*", event)
-        if event.event in pwm.windows.managed:
-            pwm.windows.focus(event.event)
 
-    elif etype == xcb.PROPERTY_NOTIFY:
-        event = xcb.ffi.cast("xcb_property_notify_event_t*", event)
-        handle_property_notify(event)
+def timings_report():
+    """Return a line for every handled event type, the slowest first."""
+    with _lock:
+        ordered = sorted(timings.items(), key=lambda t: t[1].total,
+                         reverse=True)
+        return ["{}: {}".format(names.get(etype, etype), histogram.format())
+                for etype, histogram in ordered]
 
-    elif etype == xcb.MAPPING_NOTIFY:
-        event = xcb.ffi.cast("xcb_mapping_notify_event_t*", event)
-        pwm.keybind.update_keyboard_mapping(event)
 
-    elif etype == xcb.KEY_PRESS:
-        event = xcb.ffi.cast("xcb_key_press_event_t*", event)
-        if pwm.menu.active:
-            pwm.menu.handle_key_press_event(event)
-        else:
-            pwm.config.handle_key_press_event(event)
+def handle_map_request(event):
+    pwm.windows.manage(event.window)
+
+
+def handle_unmap_notify(event):
+    handle_unmap(event.window)
+
+
+def handle_expose(event):
+    window_exposed(event.window)
+
+
+def handle_enter_notify(event):
+    if event.event in pwm.windows.managed:
+        pwm.windows.focus(event.event)
+
+
+def handle_mapping_notify(event):
+    pwm.keybind.update_keyboard_mapping(event)
+
+    if event.request == xcb.MAPPING_KEYBOARD:
+        # The keybindings may be mapped to other keycodes now.
+        pwm.keymap.setup()
+
 
-    elif etype == xcb.CLIENT_MESSAGE:
-        event = xcb.ffi.cast("xcb_client_message_event_t*", event)
-        if event.type == pwm.atom.get("_NET_SYSTEM_TRAY_OPCODE"):
-            pwm.systray.handle_client_message(event)
-        elif event.type == pwm.atom.get("_NET_WM_STATE"):
-            handle_wm_state(event)
+def handle_key_press(event):
+    if pwm.menu.active:
+        pwm.menu.handle_key_press_event(event)
+    else:
+        pwm.keymap.handle_key_press(event)
+
+
+def handle_client_message(event):
+    for handler in client_messages.get(event.type):
+        handler(event)
 
-    xcb.free(event)
+
+def handle_systray_opcode(event):
+    pwm.systray.handle_client_message(event)
 
 
 def handle_unmap(wid):
@@ -143,6 +532,7 @@ def handle_unmap(wid):
 def handle_configure_request(event):
     # See the spec for more about this event:
     # http://tronche.com/gui/x/icccm/sec-4.html#s-4.1.5
+    logging.debug("CONFIGURE_REQUEST %s", event.window)
 
     managed = event.window in pwm.windows.managed
 
@@ -187,12 +577,18 @@ def handle_configure_request(event):
 
 
 def handle_property_notify(event):
-    if event.atom == pwm.atom.get("_XEMBED_INFO"):
-        pwm.systray.handle_property_notify(event)
-    elif event.atom in (xcb.ATOM_WM_NAME, pwm.atom.get("_NET_WM_NAME")):
-        wid = event.window
-        if wid in pwm.windows.managed:
-            window_name_changed(wid)
+    for handler in properties.get(event.atom):
+        handler(event)
+
+
+def handle_xembed_info(event):
+    pwm.systray.handle_property_notify(event)
+
+
+def handle_name_change(event):
+    wid = event.window
+    if wid in pwm.windows.managed:
+        window_name_changed(wid)
 
 
 def handle_wm_state(event):
@@ -200,7 +596,10 @@ def handle_wm_state(event):
     type_fullscreen = pwm.atom.get("_NET_WM_STATE_FULLSCREEN")
     type_urgent = pwm.atom.get("_NET_WM_STATE_DEMANDS_ATTENTION")
 
-    logging.debug("{} for {}".format(pwm.atom.get_name(msgtype), event.window))
+    # Only look up the name if it will actually be logged.
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("{} for {}".format(pwm.atom.get_name(msgtype),
+                                         event.window))
 
     if event.format != 32 or msgtype not in (type_fullscreen, type_urgent):
         return
@@ -225,3 +624,31 @@ def handle_wm_state(event):
 
     elif toggle and msgtype == type_urgent:
         pwm.windows.toggle_urgent(wid)
+
+
+# Handlers for properties and client messages, by their atom.
+properties = AtomTable()
+client_messages = AtomTable()
+
+register(xcb.MAP_REQUEST, handle_map_request, "xcb_map_request_event_t*")
+register(xcb.UNMAP_NOTIFY, handle_unmap_notify, "xcb_unmap_notify_event_t*")
+register(xcb.DESTROY_NOTIFY, handle_unmap_notify,
+         "xcb_destroy_notify_event_t*")
+register(xcb.CONFIGURE_REQUEST, handle_configure_request,
+         "xcb_configure_request_event_t*")
+register(xcb.EXPOSE, handle_expose, "xcb_expose_event_t*")
+register(xcb.ENTER_NOTIFY, handle_enter_notify, "xcb_enter_notify_event_t*")
+register(xcb.PROPERTY_NOTIFY, handle_property_notify,
+         "xcb_property_notify_event_t*")
+register(xcb.MAPPING_NOTIFY, handle_mapping_notify,
+         "xcb_mapping_notify_event_t*")
+register(xcb.KEY_PRESS, handle_key_press, "xcb_key_press_event_t*")
+register(xcb.CLIENT_MESSAGE, handle_client_message,
+         "xcb_client_message_event_t*")
+
+properties.register("_XEMBED_INFO", handle_xembed_info)
+properties.register(xcb.ATOM_WM_NAME, handle_name_change)
+properties.register("_NET_WM_NAME", handle_name_change)
+
+client_messages.register("_NET_SYSTEM_TRAY_OPCODE", handle_systray_opcode)
+client_messages.register("_NET_WM_STATE", handle_wm_state)
@@ -1695,4 +1695,13 @@ cairo_move_to (cairo_t *cr, double x, double y);
 void
 cairo_show_text (cairo_t *cr, const char *utf8);
 
+void
+cairo_save (cairo_t *cr);
+
+void
+cairo_restore (cairo_t *cr);
+
+void
+cairo_clip (cairo_t *cr);
+
 """
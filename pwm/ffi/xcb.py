@@ -5,6 +5,7 @@ import functools
 import re
 
 import pwm.ffi.base
+import pwm.ffi.headers
 
 
 class XcbError(Exception):
@@ -39,16 +40,46 @@ class Cookie:
 
         return self.creply
 
+    def discard(self):
+        """Tell xcb that we are not interested in the reply."""
+        xcb.core.discard_reply(self.value.sequence)
+
     def check(self):
         error = xcb.core.request_check(self.value)
         if error != xcb.ffi.NULL:
             raise XcbError(error)
 
 
+# The names of all functions returning a cookie, read from their declarations.
+COOKIE_FUNCTIONS = frozenset(
+    re.findall(r"\b\w+_cookie_t\s+(\w+)\s*\(", pwm.ffi.headers.xcb))
+
+
+class Core:
+    """Calls xcb functions with the connection as first argument.
+
+    Calling core.foo(...) calls xcb_foo(conn, ...). The functions are bound
+    once per name and stored as attributes, so further lookups don't go
+    through __getattr__ anymore.
+    """
+
+    def __init__(self, xcb, conn):
+        self._xcb = xcb
+        self._conn = conn
+
+    def __getattr__(self, name):
+        func = self._xcb.bind(name, self._conn)
+        setattr(self, name, func)
+        return func
+
+
 class Xcb:
     """Wrapper class for the xcb functions.
 
-    XCB functions can be called on an instance of this class.
+    XCB functions can be called on an instance of this class, without the
+    xcb_ prefix. Functions which need the connection are called through core,
+    e.g. xcb.core.flush(). XCB_ constants are available without the prefix
+    as well.
     """
 
     def __init__(self):
@@ -59,49 +90,44 @@ class Xcb:
         self.setup = None
         self.screen = None
         self.screen_number = None
-        self.call_core = False
+        self.core = Core(self, None)
 
-    def __getattr__(self, name):
-        def request(func, *args, **kwargs):
-            retval = func(*args, **kwargs)
+    def bind(self, name, conn=None):
+        """Return a function calling xcb_<name>.
 
-            try:
-                ctype = self.ffi.getctype(self.ffi.typeof(retval))
-                ctype = ctype.rstrip(" *")
-
-                if ctype.endswith("cookie_t"):
-                    return Cookie(name, retval)
-            except:
-                pass
-
-            return retval
-
-        if name == "core":
-            self.call_core = True
-            return self
-
-        if self.call_core:
-            self.call_core = False
-            return functools.partial(
-                request,
-                functools.partial(getattr(self.lib, "xcb_%s" % name),
-                                  self.conn))
-        try:
-            return functools.partial(
-                request, getattr(self.lib, "xcb_%s" % name))
-        except:
-            pass
+        If conn is given it is passed as first argument. Functions returning a
+        cookie are wrapped to return a Cookie instead.
+        """
+        cname = "xcb_%s" % name
+        func = getattr(self.lib, cname)
+
+        if conn is not None:
+            func = functools.partial(func, conn)
 
+        if cname in COOKIE_FUNCTIONS:
+            def request(*args, **kwargs):
+                return Cookie(name, func(*args, **kwargs))
+            return request
+
+        return func
+
+    def __getattr__(self, name):
         try:
-            return getattr(self.lib, "XCB_%s" % name)
-        except:
-            pass
+            value = self.bind(name)
+        except AttributeError:
+            try:
+                value = getattr(self.lib, "XCB_%s" % name)
+            except AttributeError:
+                value = getattr(self.lib, name)
 
-        return functools.partial(request, getattr(self.lib, name))
+        setattr(self, name, value)
+        return value
 
     def connect(self, display=None):
         screen = self.ffi.new("int *")
         self.conn = self.lib.xcb_connect(display or self.ffi.NULL, screen)
+        # Functions bound to a previous connection must not be used anymore.
+        self.core = Core(self, self.conn)
         self.setup = self.core.get_setup()
         self.screen_number = screen[0]
         self.screen = self.core.aux_get_screen(self.screen_number)
@@ -0,0 +1,45 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+
+class Histogram:
+    """A histogram of durations.
+
+    Durations are counted in buckets of powers of two microseconds, bucket i
+    holds durations shorter than 2**i microseconds (and at least half that).
+    The last bucket holds everything longer.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        idx = int(seconds * 1000000).bit_length()
+        self.buckets[min(idx, self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Return the upper bound of the given percentile in seconds."""
+        rank = percent / 100 * self.count
+        seen = 0
+        for idx, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return (1 << idx) / 1000000
+        return 0.0
+
+    def format(self):
+        return "{} calls, {:.3f} ms total, {:.1f} us mean, p50 < {:.0f} us, " \
+               "p90 < {:.0f} us, p99 < {:.0f} us".format(
+                   self.count, self.total * 1000, self.mean() * 1000000,
+                   self.percentile(50) * 1000000,
+                   self.percentile(90) * 1000000,
+                   self.percentile(99) * 1000000)
@@ -13,10 +13,15 @@ from pwm.keysyms import keysyms, keysym_strings
 # https://github.com/BurntSushi/xpybutil/blob/master/xpybutil/keybind.py
 #
 
-__kbmap = None
 __keysmods = None
 
-__keybinds = defaultdict(list)
+# The keysyms of all keycodes as a flat table, the keysyms of a keycode are
+# found at (keycode - min_keycode) * _per + column.
+_keysyms = []
+_per = 0
+
+# Maps every keysym to the set of keycodes it is mapped to.
+_keycodes = defaultdict(set)
 
 TRIVIAL_MODS = [
     0,
@@ -134,10 +139,11 @@ def get_keysym(keycode, col=0, kbmap=None):
     :param kbmap: The keyboard mapping to use.
     :type kbmap: xcb.xproto.GetKeyboardMapingReply
     """
+    mn, mx = get_min_max_keycode()
+
     if kbmap is None:
-        kbmap = __kbmap
+        return _keysyms[(keycode - mn) * _per + col]
 
-    mn, mx = get_min_max_keycode()
     per = kbmap.keysyms_per_keycode
     ind = (keycode - mn) * per + col
 
@@ -158,24 +164,64 @@ def get_keysym_string(keysym):
 def get_keycode(keysym):
     """
     Given a keysym, find the keycode mapped to it in the current X environment.
-    It is necessary to search the keysym table in order to do this, including
-    all columns.
+    If it is mapped to several keycodes, in any column, the lowest one is
+    returned.
 
     :param keysym: An X keysym.
     :return: A keycode or None if one could not be found.
     :rtype: int
     """
-    mn, mx = get_min_max_keycode()
-    cols = __kbmap.keysyms_per_keycode
-    for i in range(mn, mx + 1):
-        for j in range(0, cols):
-            ks = get_keysym(i, col=j)
-            if ks == keysym:
-                return i
+    keycodes = _keycodes.get(keysym)
+    if keycodes:
+        return min(keycodes)
 
     return None
 
 
+def _set_keysyms(first, keysyms):
+    """
+    Replace the keysyms of the keycodes starting at the keycode first in the
+    flat table and update the keysym to keycode index accordingly.
+
+    :param first: The first keycode to replace.
+    :param keysyms: The new keysyms, _per of them for every keycode.
+    """
+    mn, mx = get_min_max_keycode()
+    start = (first - mn) * _per
+    end = start + len(keysyms)
+
+    for idx in range(start, min(end, len(_keysyms))):
+        keycodes = _keycodes.get(_keysyms[idx])
+        if keycodes:
+            keycodes.discard(mn + idx // _per)
+            if not keycodes:
+                del _keycodes[_keysyms[idx]]
+
+    _keysyms[start:end] = keysyms
+
+    for idx in range(start, end):
+        _keycodes[_keysyms[idx]].add(mn + idx // _per)
+
+
+def _load_keysyms(reply, count):
+    """Return the keysyms of a keyboard mapping reply for count keycodes."""
+    per = reply.keysyms_per_keycode
+    return list(xcb.get_keyboard_mapping_keysyms(reply)[0:count * per])
+
+
+def _load_keyboard_mapping():
+    """Fetch the whole keyboard mapping and build the table and index."""
+    global _keysyms, _per, _keycodes
+
+    mn, mx = get_min_max_keycode()
+    reply = get_keyboard_mapping().reply()
+
+    _keysyms = []
+    _per = reply.keysyms_per_keycode
+    _keycodes = defaultdict(set)
+    _set_keysyms(mn, _load_keysyms(reply, mx - mn + 1))
+
+
 def get_mod_for_key(keycode):
     """
     Finds the modifier that is mapped to the given keycode.
@@ -282,7 +328,8 @@ def grab_key(wid, modifiers, key):
     an effect on X events, but probably shouldn't effect key grabbing. (i.e.,
     whether num lock or caps lock is on.)
 
-    N.B. You should probably be using 'bind_key' or 'bind_global_key' instead.
+    N.B. To grab several keys use 'grab_keys', it avoids a round trip for
+    every key.
 
     :param wid: A window identifier.
     :type wid: int
@@ -292,16 +339,31 @@ def grab_key(wid, modifiers, key):
     :type key: int
     :rtype: bool
     """
-    try:
-        for mod in TRIVIAL_MODS:
-            xcb.core.grab_key_checked(True, wid,
-                                      modifiers | mod, key,
-                                      xcb.GRAB_MODE_ASYNC,
-                                      xcb.GRAB_MODE_ASYNC).check()
+    return not grab_keys(wid, [(modifiers, key)])
+
+
+def grab_keys(wid, keys):
+    """
+    Grabs several keys for a particular window like ``grab_key`` does.
+
+    All grab requests are sent before any of them is checked, so grabbing
+    any number of keys only waits for a single round trip.
+
+    :param wid: A window identifier.
+    :type wid: int
+    :param keys: (modifiers, keycode) tuples.
+    :type keys: [(int, int)]
+    :return: The (modifiers, keycode) tuples which could not be grabbed.
+    :rtype: [(int, int)]
+    """
+    cookies = [((modifiers, key),
+                [xcb.core.grab_key_checked(True, wid, modifiers | mod, key,
+                                           xcb.GRAB_MODE_ASYNC,
+                                           xcb.GRAB_MODE_ASYNC)
+                 for mod in TRIVIAL_MODS])
+               for modifiers, key in keys]
 
-        return True
-    except XcbError:
-        return False
+    return _check_all(cookies)
 
 
 def ungrab_key(wid, modifiers, key):
@@ -320,12 +382,50 @@ def ungrab_key(wid, modifiers, key):
     :type key: int
     :rtype: bool
     """
-    try:
-        for mod in TRIVIAL_MODS:
-            xcb.core.ungrab_key_checked(key, wid, modifiers | mod).check()
-        return True
-    except XcbError:
-        return False
+    return not ungrab_keys(wid, [(modifiers, key)])
+
+
+def ungrab_keys(wid, keys):
+    """
+    Ungrabs several keys that were grabbed by ``grab_keys``.
+
+    :param wid: A window identifier.
+    :type wid: int
+    :param keys: (modifiers, keycode) tuples.
+    :type keys: [(int, int)]
+    :return: The (modifiers, keycode) tuples which could not be ungrabbed.
+    :rtype: [(int, int)]
+    """
+    cookies = [((modifiers, key),
+                [xcb.core.ungrab_key_checked(key, wid, modifiers | mod)
+                 for mod in TRIVIAL_MODS])
+               for modifiers, key in keys]
+
+    return _check_all(cookies)
+
+
+def _check_all(cookies):
+    """
+    Check the cookies of already sent requests.
+
+    :param cookies: (key, [cookie]) tuples.
+    :return: The keys for which at least one request failed.
+    """
+    failed = []
+    for key, checks in cookies:
+        ok = True
+        for cookie in checks:
+            # Every cookie has to be checked, otherwise its error would
+            # stay in the queue of the connection.
+            try:
+                cookie.check()
+            except XcbError:
+                ok = False
+
+        if not ok:
+            failed.append(key)
+
+    return failed
 
 
 def update_keyboard_mapping(e=None):
@@ -334,51 +434,28 @@ def update_keyboard_mapping(e=None):
     to update xpybutil's internal representing of the current keysym table.
     Indeed, xpybutil will do this for you automatically.
 
-    Moreover, if something is changed that affects the current keygrabs,
-    xpybutil will initiate a regrab with the changed keycode.
+    Grabbed keys are not updated, see pwm.keymap.setup().
 
     :param e: The MappingNotify event.
     :type e: xcb.xproto.MappingNotifyEvent
     :rtype: void
     """
-    global __kbmap, __keysmods
-
-    newmap = get_keyboard_mapping().reply()
+    global __keysmods
 
     if e is None:
-        __kbmap = newmap
+        _load_keyboard_mapping()
         __keysmods = get_keys_to_mods()
         return
 
     if e.request == xcb.MAPPING_KEYBOARD:
-        changes = {}
-        for kc in range(*get_min_max_keycode()):
-            knew = get_keysym(kc, kbmap=newmap)
-            oldkc = get_keycode(knew)
-            if oldkc != kc:
-                changes[oldkc] = kc
-
-        __kbmap = newmap
-        __regrab(changes)
+        # Only the keycodes of the event changed, just fetch and replace them.
+        first, count = e.first_keycode, e.count
+        reply = xcb.core.get_keyboard_mapping(first, count).reply()
+
+        if reply.keysyms_per_keycode != _per:
+            # The layout of the whole table changed, reload it.
+            _load_keyboard_mapping()
+        else:
+            _set_keysyms(first, _load_keysyms(reply, count))
     elif e.request == xcb.MAPPING_MODIFIER:
         __keysmods = get_keys_to_mods()
-
-
-def __regrab(changes):
-    """
-    Takes a dictionary of changes (mapping old keycode to new keycode) and
-    regrabs any keys that have been changed with the updated keycode.
-
-    :param changes: Mapping of changes from old keycode to new keycode.
-    :type changes: dict
-    :rtype: void
-    """
-    for wid, mods, kc in __keybinds:
-        if kc in changes:
-            ungrab_key(wid, mods, kc)
-            grab_key(wid, mods, changes[kc])
-
-            old = (wid, mods, kc)
-            new = (wid, mods, changes[kc])
-            __keybinds[new] = __keybinds[old]
-            del __keybinds[old]
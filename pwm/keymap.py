@@ -0,0 +1,190 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import functools
+import logging
+import time
+
+from pwm.config import config
+from pwm.ffi.xcb import xcb
+import pwm.keybind
+import pwm.scheduler
+
+# Every mode maps its name to a trie of keystrokes. A keystroke is a tuple of
+# modifiers and keycode, the inner nodes of the trie are dicts and the leaves
+# are the keys from the configuration.
+modes = {}
+mode = "default"
+
+# The first-level keystrokes of the active mode, only those are grabbed.
+grabbed = []
+
+# The node of a key chord which was started but not finished yet.
+_pending = None
+# Incremented for every started or finished chord, so a timeout can tell
+# whether its chord is still pending.
+_generation = 0
+
+# Maps keystrokes to their description, for error messages.
+_names = {}
+
+
+def parse(keystr):
+    """Parse a key chord like "Mod4-x Mod4-c" into a tuple of keystrokes.
+
+    Return None if any of the keystrokes could not be parsed.
+    """
+    strokes = []
+    for part in keystr.split():
+        mods, keycode = pwm.keybind.parse_keystring(part)
+        if not keycode:
+            return None
+
+        strokes.append((mods, keycode))
+        _names[(mods, keycode)] = part
+
+    return tuple(strokes) or None
+
+
+def build(keys):
+    """Build the trie of keystrokes for the given keys."""
+    trie = {}
+    for key in keys:
+        strokes = parse(key[0])
+        if not strokes:
+            # This is not a critical error, we just can't respond to that key
+            logging.error("Could not parse keybinding: {}".format(key[0]))
+            continue
+
+        node = trie
+        for stroke in strokes[:-1]:
+            node = node.setdefault(stroke, {})
+            if not isinstance(node, dict):
+                break
+        else:
+            if not isinstance(node.get(strokes[-1], ()), dict):
+                node[strokes[-1]] = key
+                continue
+
+        # A single key can not both finish and start a chord.
+        logging.error("Conflicting keybinding: {}".format(key[0]))
+
+    return trie
+
+
+def setup():
+    """Build the tries of all modes and grab the keys of the active mode.
+
+    This has to be called again whenever the keyboard mapping changed, as the
+    tries contain keycodes. The active mode is kept if it still exists.
+    """
+    global mode
+    start = time.perf_counter()
+
+    modes.clear()
+    modes["default"] = build(config.keys)
+    for name, keys in getattr(config, "modes", {}).items():
+        if name != "default":
+            modes[name] = build(keys)
+
+    name = mode if mode in modes else "default"
+    mode = None
+    set_mode(name)
+
+    logging.info("Grabbed {} keys in {:.1f} ms".format(
+        len(grabbed), (time.perf_counter() - start) * 1000))
+
+
+def set_mode(name):
+    """Activate the mode with the given name.
+
+    The keys of the previous mode are ungrabbed and the first-level keys of the
+    new mode grabbed.
+    """
+    global mode, grabbed
+
+    if name not in modes:
+        logging.error("Unknown key mode: {}".format(name))
+        return
+
+    if _pending is not None:
+        _finish_chord()
+
+    if name == mode:
+        return
+
+    if mode is not None:
+        logging.info("Key mode: {}".format(name))
+
+    root = xcb.screen.root
+    if grabbed:
+        pwm.keybind.ungrab_keys(root, grabbed)
+
+    keys = list(modes[name])
+    failed = pwm.keybind.grab_keys(root, keys)
+    for stroke in failed:
+        # Most likely another client already grabbed this key.
+        logging.error("Could not grab keybinding: {}".format(_names[stroke]))
+
+    mode = name
+    grabbed = [stroke for stroke in keys if stroke not in failed]
+
+
+def handle_key_press(event):
+    """Continue or finish a key chord with this KeyPressEvent."""
+
+    # Strip out all trivial modifiers such as capslock or numlock.
+    stroke = (pwm.keybind.strip_trivial(event.state), event.detail)
+
+    if _pending is None:
+        node = modes[mode].get(stroke)
+    else:
+        # While the keyboard is grabbed the modifiers of the next stroke are
+        # reported too, they neither continue nor cancel the chord.
+        if pwm.keybind.get_mod_for_key(event.detail):
+            return
+
+        node = _pending.get(stroke)
+        _finish_chord()
+
+    if node is None:
+        return
+
+    if isinstance(node, dict):
+        _start_chord(node)
+        return
+
+    try:
+        node[1]()
+    except:
+        logging.exception("Command error")
+
+
+def _start_chord(node):
+    """Wait for the next keystroke of a chord, until the timeout expires."""
+    global _pending, _generation
+
+    if _pending is None:
+        # The strokes following the first one are not grabbed.
+        xcb.core.grab_keyboard(False, xcb.screen.root, xcb.CURRENT_TIME,
+                               xcb.GRAB_MODE_ASYNC,
+                               xcb.GRAB_MODE_ASYNC).discard()
+
+    _pending = node
+    _generation += 1
+    pwm.scheduler.call_later(getattr(config, "key_timeout", 1.0),
+                             functools.partial(_timeout, _generation))
+
+
+def _finish_chord():
+    global _pending, _generation
+
+    _pending = None
+    _generation += 1
+    xcb.core.ungrab_keyboard(xcb.CURRENT_TIME)
+
+
+def _timeout(generation):
+    if generation == _generation and _pending is not None:
+        logging.debug("Key chord timed out")
+        _finish_chord()
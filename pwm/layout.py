@@ -1,61 +1,194 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+from itertools import repeat
+
 from pwm.config import config
 from pwm.ffi.xcb import xcb
 import pwm.windows
+import pwm.record
+
+
+def split(total, fractions):
+    """Split total pixels into parts according to a list of fractions.
+
+    Instead of rounding every part on its own, the edges between the parts
+    are rounded. This way the parts always add up to exactly total pixels.
+    If the fractions add up to zero, all parts get an equal share.
+    Return a tuple of two lists, the start and the size of every part.
+    """
+    if not fractions:
+        return [], []
+
+    fraction_sum = sum(fractions)
+    if not fraction_sum:
+        # All fractions are zero, e.g. after restoring a broken state.
+        fractions = [1] * len(fractions)
+        fraction_sum = len(fractions)
+
+    scale = total / fraction_sum
+    starts = []
+    sizes = []
+    start = 0
+    edge = 0
+    for fraction in fractions:
+        edge += fraction
+        end = round(edge*scale)
+        starts.append(start)
+        sizes.append(end - start)
+        start = end
+
+    return starts, sizes
+
+
+def _equal_sizes(sizes):
+    """Give all columns or rows equal sizes.
+
+    This is used if all sizes are zero, e.g. after restoring a broken state.
+    """
+    sizes[:] = [1.0 / len(sizes) for _ in sizes]
 
 
-class Column:
+def _shrink(sizes, amount):
+    """Free the given amount of space by shrinking all sizes in place."""
+    sizes[:] = [size - size*amount for size in sizes]
+
+
+def _grow(sizes):
+    """Grow all sizes in place, so they add up to 1.0 again."""
+    total = sum(sizes)
+    if not total:
+        _equal_sizes(sizes)
+        return
+
+    amount = 1.0-total
+    sizes[:] = [size + amount*size/total for size in sizes]
+
+
+class Column(pwm.record.Record):
+    """A column of a tiling layout as it is stored in the state."""
+
+    __slots__ = ("size", "windows")
+
     def __init__(self, size, windows):
         self.size = size
         self.windows = windows
 
 
-class Window:
+class Window(pwm.record.Record):
+    """A row of a tiling column as it is stored in the state."""
+
+    __slots__ = ("size", "wid")
+
     def __init__(self, size, wid):
         self.size = size
         self.wid = wid
 
 
 class Tiling:
+    """Windows arranged in columns, and in rows within every column.
+
+    The layout is stored in flat lists: widths holds the fraction of the
+    workspace width of every column, heights and wids hold one list per
+    column with the fraction of the column height and the wid of every row.
+    """
+
     def __init__(self, workspace):
         self.workspace = workspace
-        self.columns = [Column(1.0, [])]
+        self.widths = [1.0]
+        self.heights = [[]]
+        self.wids = [[]]
         self.windows = []
 
-    def add_window(self, wid, column=0, row=-1):
+        # Maps every wid to its (column, row), see path().
+        self._paths = {}
+
+        # Maps every wid to the last geometry it was configured with, see
+        # arrange().
+        self._geometries = {}
+
+    def __getstate__(self):
+        # Store the layout as Column and Window records, the format states
+        # have always been stored in.
+        state = self.__dict__.copy()
+        for name in ("widths", "heights", "wids", "_paths", "_geometries"):
+            del state[name]
+
+        state["columns"] = [
+            Column(width, [Window(*row) for row in zip(heights, wids)])
+            for width, heights, wids in zip(self.widths, self.heights,
+                                            self.wids)]
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        columns = state.pop("columns")
+        self.__dict__.update(state)
+
+        self.widths = [col.size for col in columns]
+        self.heights = [[win.size for win in col.windows] for col in columns]
+        self.wids = [[win.wid for win in col.windows] for col in columns]
+
+        # A broken state may contain columns or rows with zero sizes.
+        for sizes in [self.widths] + self.heights:
+            if not sum(sizes):
+                _equal_sizes(sizes)
+
+        self._paths = {}
+        self._geometries = {}
+        self._update_paths()
+
+    def add_window(self, wid, column=0, row=-1, arrange=True):
         self.windows.append(wid)
 
-        if column >= len(self.columns):
-            self.columns.append(Column(1.0, [Window(1.0, wid)]))
+        if column >= len(self.widths):
+            column = len(self.widths)
+            self.widths.append(1.0)
+            self.heights.append([1.0])
+            self.wids.append([wid])
         else:
-            num_windows = len(self.columns[column].windows)
+            num_windows = len(self.wids[column])
             if row == -1:
                 row = num_windows
 
             size = 1.0 / (num_windows+1)
             self.make_row_space(column, size)
-            self.columns[column].windows.insert(row, Window(size, wid))
+            self.heights[column].insert(row, size)
+            self.wids[column].insert(row, wid)
+
+        self._update_paths(column, column+1)
 
         pwm.windows.configure(wid, stackmode=xcb.STACK_MODE_BELOW)
-        self.arrange()
+
+        if arrange:
+            self.arrange()
 
     def remove_window(self, wid):
         self.windows.remove(wid)
 
         column, row = self.path(wid)
-        del self.columns[column].windows[row]
+        del self.heights[column][row]
+        del self.wids[column][row]
+        del self._paths[wid]
+        self._geometries.pop(wid, None)
 
-        if len(self.columns) > 1 and not self.columns[column].windows:
+        if len(self.widths) > 1 and not self.wids[column]:
             # Don't leave empty columns behind
-            del self.columns[column]
-            self.distribute_free_column_space()
+            self._remove_column(column)
+            self._update_paths(column)
         else:
             self.distribute_free_row_space(column)
+            self._update_paths(column, column+1)
 
         self.arrange()
 
+    def _remove_column(self, column):
+        """Remove an empty column and give its space to the others."""
+        del self.widths[column]
+        del self.heights[column]
+        del self.wids[column]
+        self.distribute_free_column_space()
+
     def path(self, wid):
         """Find the window and return its column and row.
 
@@ -65,12 +198,20 @@ class Tiling:
         Raises:
             ValueError: The wid was not found.
         """
-        for cidx, col in enumerate(self.columns):
-            for widx, win in enumerate(col.windows):
-                if win.wid == wid:
-                    return (cidx, widx)
+        try:
+            return self._paths[wid]
+        except KeyError:
+            raise ValueError
+
+    def _update_paths(self, start=0, stop=None):
+        """Update the paths of all windows in the given range of columns.
 
-        raise ValueError
+        Has to be called whenever windows or columns are inserted, removed
+        or moved.
+        """
+        for cidx in range(start, len(self.wids) if stop is None else stop):
+            for widx, wid in enumerate(self.wids[cidx]):
+                self._paths[wid] = (cidx, widx)
 
     def move(self, wid, direction):
         getattr(self, "_move_{}".format(direction))(wid)
@@ -83,9 +224,12 @@ class Tiling:
         if row == 0:
             return
 
-        col = self.columns[column]
-        col.windows[row], col.windows[row-1] = (col.windows[row-1],
-                                                col.windows[row])
+        heights = self.heights[column]
+        wids = self.wids[column]
+        heights[row], heights[row-1] = heights[row-1], heights[row]
+        wids[row], wids[row-1] = wids[row-1], wids[row]
+        self._paths[wids[row]] = (column, row)
+        self._paths[wids[row-1]] = (column, row-1)
 
         self.arrange()
 
@@ -94,10 +238,10 @@ class Tiling:
 
         column, row = self.path(wid)
 
-        if row == len(self.columns[column].windows) - 1:
+        if row == len(self.wids[column]) - 1:
             return
 
-        bottom_wid = self.columns[column].windows[row+1].wid
+        bottom_wid = self.wids[column][row+1]
         self._move_up(bottom_wid)
 
     def _move_left(self, wid):
@@ -108,44 +252,50 @@ class Tiling:
 
     def _move_left_right(self, wid, offset):
         col_idx, row = self.path(wid)
-        column = self.columns[col_idx]
 
         move_left = (offset < 0)
         move_right = not move_left
 
         isleft = (col_idx == 0)
-        isright = (col_idx == len(self.columns)-1)
+        isright = (col_idx == len(self.widths)-1)
         isoutermost = ((move_left and isleft) or (move_right and isright))
 
-        if len(column.windows) == 1 and isoutermost:
+        if len(self.wids[col_idx]) == 1 and isoutermost:
             # If this window is already alone at the left/right, there is
             # no point in going further...
             return
         elif isoutermost:
             # ... but if we share the space with others, we will create a new
             # column for this window alone.
-            win = column.windows[row]
-            del column.windows[row]
+            del self.heights[col_idx][row]
+            del self.wids[col_idx][row]
             self.distribute_free_row_space(col_idx)
-            win.size = 1.0
 
-            size = 1.0/(len(self.columns)+1)
+            size = 1.0/(len(self.widths)+1)
             self.make_column_space(size)
-            self.columns.insert(max(0, col_idx+offset), Column(size, [win]))
+            new_idx = max(0, col_idx+offset)
+            self.widths.insert(new_idx, size)
+            self.heights.insert(new_idx, [1.0])
+            self.wids.insert(new_idx, [wid])
+            self._update_paths(max(0, min(col_idx, col_idx+offset)))
         else:
             # In all other cases we just shift the window.
-            win = column.windows[row]
-            del column.windows[row]
+            del self.heights[col_idx][row]
+            del self.wids[col_idx][row]
             self.distribute_free_row_space(col_idx)
 
-            win.size = 1.0 / (len(self.columns[col_idx+offset].windows)+1)
-            self.make_row_space(col_idx+offset, win.size)
-            self.columns[col_idx+offset].windows.append(win)
+            size = 1.0 / (len(self.wids[col_idx+offset])+1)
+            self.make_row_space(col_idx+offset, size)
+            self.heights[col_idx+offset].append(size)
+            self.wids[col_idx+offset].append(wid)
 
             # Make sure we don't leave empty columns behind.
-            if not column.windows:
-                del self.columns[col_idx]
-                self.distribute_free_column_space()
+            if not self.wids[col_idx]:
+                self._remove_column(col_idx)
+                self._update_paths(min(col_idx, col_idx+offset))
+            else:
+                self._update_paths(col_idx, col_idx+1)
+                self._update_paths(col_idx+offset, col_idx+offset+1)
 
         self.arrange()
 
@@ -159,7 +309,7 @@ class Tiling:
         If this window is the topmost window, return its wid.
         """
         column, row = self.path(wid)
-        return wid if row == 0 else self.columns[column].windows[row-1].wid
+        return wid if row == 0 else self.wids[column][row-1]
 
     def _relative_below(self, wid):
         """Find the window below the given wid.
@@ -167,8 +317,8 @@ class Tiling:
         If this window is the bottommost window, return its wid.
         """
         column, row = self.path(wid)
-        return (wid if row == len(self.columns[column].windows)-1
-                else self.columns[column].windows[row+1].wid)
+        wids = self.wids[column]
+        return wid if row == len(wids)-1 else wids[row+1]
 
     def _relative_left(self, wid):
         """Find the window left of the given wid.
@@ -180,8 +330,8 @@ class Tiling:
         if column == 0:
             return wid
         else:
-            left_col = self.columns[column-1]
-            return left_col.windows[min(row, len(left_col.windows)-1)].wid
+            left_wids = self.wids[column-1]
+            return left_wids[min(row, len(left_wids)-1)]
 
     def _relative_right(self, wid):
         """Find the window right of the given wid.
@@ -190,11 +340,11 @@ class Tiling:
         """
         column, row = self.path(wid)
 
-        if column == len(self.columns)-1:
+        if column == len(self.wids)-1:
             return wid
         else:
-            right_col = self.columns[column+1]
-            return right_col.windows[min(row, len(right_col.windows)-1)].wid
+            right_wids = self.wids[column+1]
+            return right_wids[min(row, len(right_wids)-1)]
 
     def make_row_space(self, column, amount):
         """Make space for a new row by reducing the size of the other rows.
@@ -203,8 +353,7 @@ class Tiling:
             column: The column in which the rows have to be resized.
             amount: The total amount of space to free.
         """
-        for win in self.columns[column].windows:
-            win.size -= win.size*amount
+        _shrink(self.heights[column], amount)
 
     def distribute_free_row_space(self, column):
         """Distribute all free space in a column among its rows.
@@ -212,11 +361,7 @@ class Tiling:
         Args:
             column: The column to check.
         """
-        total = sum(w.size for w in self.columns[column].windows)
-        amount = 1.0-total
-
-        for win in self.columns[column].windows:
-            win.size += amount*win.size/total
+        _grow(self.heights[column])
 
     def make_column_space(self, amount):
         """Make space for a new column by shrinking all columns.
@@ -224,16 +369,11 @@ class Tiling:
         Args:
             amount: The total amount of space to free.
         """
-        for col in self.columns:
-            col.size -= col.size*amount
+        _shrink(self.widths, amount)
 
     def distribute_free_column_space(self):
         """Distribute all free space among the columns."""
-        total = sum(c.size for c in self.columns)
-        amount = 1.0-total
-
-        for col in self.columns:
-            col.size += amount*col.size/total
+        _grow(self.widths)
 
     def resize(self, wid, delta):
         """Resize a window by a given delta.
@@ -249,49 +389,53 @@ class Tiling:
         # If there is only one column or only one window in the column
         # then we restrict resizing to prevent empty spaces
 
-        if dx != 0.0 and len(self.columns) > 1:
-            column = self.columns[col_idx]
-            column.size += dx
-
-            del self.columns[col_idx]
+        if dx != 0.0 and len(self.widths) > 1:
+            size = self.widths.pop(col_idx) + dx
             self.distribute_free_column_space()
-            self.make_column_space(column.size)
-            self.columns.insert(col_idx, column)
-
-        if dy != 0.0 and len(self.columns[col_idx].windows) > 1:
-            window = self.columns[col_idx].windows[row_idx]
-            window.size += dy
+            self.make_column_space(size)
+            self.widths.insert(col_idx, size)
 
-            del self.columns[col_idx].windows[row_idx]
+        if dy != 0.0 and len(self.wids[col_idx]) > 1:
+            size = self.heights[col_idx].pop(row_idx) + dy
             self.distribute_free_row_space(col_idx)
-            self.make_row_space(col_idx, window.size)
-            self.columns[col_idx].windows.insert(row_idx, window)
+            self.make_row_space(col_idx, size)
+            self.heights[col_idx].insert(row_idx, size)
 
         self.arrange()
 
+    def rectangles(self):
+        """Calculate the geometry of all windows in a single pass.
+
+        Return a list of (wid, x, y, width, height) tuples.
+        """
+        height = self.workspace.height
+
+        rects = []
+        extend = rects.extend
+        lefts, widths = split(self.workspace.width, self.widths)
+        for left, width, heights, wids in zip(lefts, widths, self.heights,
+                                              self.wids):
+            tops, heights = split(height, heights)
+            extend(zip(wids, repeat(left), tops, repeat(width), heights))
+
+        return rects
+
     def arrange(self, wid=None):
         """Apply layout structure to windows. Use geometry from workspace.
 
-        If wid is None all windows will be configured, otherwise only the one
-        with this wid.
+        If wid is None all windows whose geometry changed since the last call
+        will be configured, otherwise only the one with this wid (even if its
+        geometry did not change).
         """
 
-        left = 0
-        for col in self.columns:
-            top = 0
-            width = round(self.workspace.width*col.size)
-            for win in col.windows:
-                height = round(self.workspace.height*win.size)
-
-                if not wid or win.wid == wid:
-                    pwm.windows.configure(win.wid,
-                                          x=left,
-                                          y=top,
-                                          width=width,
-                                          height=height)
-
-                top += height
-            left += width
+        for win, x, y, width, height in self.rectangles():
+            geometry = (x, y, width, height)
+
+            if ((not wid and self._geometries.get(win) != geometry) or
+                    win == wid):
+                pwm.windows.configure(win, x=x, y=y,
+                                      width=width, height=height)
+                self._geometries[win] = geometry
 
 
 class Floating:
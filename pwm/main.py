@@ -11,14 +11,18 @@ import pwm
 from pwm.config import config
 from pwm.ffi.xcb import xcb
 import pwm.root
+import pwm.rules
 import pwm.events
 import pwm.bar
 import pwm.menu
 import pwm.systray
 import pwm.workspaces
 import pwm.keybind
+import pwm.keymap
 import pwm.state
 import pwm.worker
+import pwm.scheduler
+import pwm.xdg
 
 
 restart = False
@@ -36,6 +40,14 @@ def main():
                         help="automatically set when restarting",
                         action="store_true")
 
+    parser.add_argument("--loop", help="the event loop to use",
+                        choices=["threaded", "select"])
+
+    parser.add_argument("--profile",
+                        help="profile event handlers, the profile is written "
+                        "to {} on exit".format(pwm.events.PROFILE_PATH),
+                        action="store_true")
+
     parser.add_argument("--default",
                         help="use the default configuration",
                         action="store_true")
@@ -69,6 +81,19 @@ def main():
         logging.getLogger().setLevel(loglevel)
         console.setLevel(loglevel)
 
+    # The event loop passed via the command line has higher priority
+    loop = getattr(config, "event_loop", "threaded")
+    if args.loop:
+        loop = args.loop
+
+    pwm.events.profiling = args.profile
+
+    # The select loop runs all tasks and schedulers in the main thread.
+    threaded = loop != "select"
+    pwm.scheduler.inline = not threaded
+
+    pwm.rules.setup()
+
     logging.info("Startup...")
     xcb.connect()
     pwm.root.setup()
@@ -77,7 +102,7 @@ def main():
     pwm.menu.setup()
     pwm.systray.setup()
     pwm.keybind.update_keyboard_mapping()
-    pwm.config.setup_keys()
+    pwm.keymap.setup()
 
     # Restore has to be placed after the setups, otherwise the restored values
     # would be overwritten again.
@@ -89,12 +114,17 @@ def main():
     pwm.windows.manage_existing()
 
     logging.info("Starting threads...")
-    pwm.worker.start()
+    if threaded:
+        pwm.worker.start()
     pwm.widgets.start()
+    pwm.xdg.start_index()
 
     try:
-        logging.info("Entering main event loop...")
-        pwm.events.loop()
+        logging.info("Entering main event loop ({})...".format(loop))
+        if threaded:
+            pwm.events.loop()
+        else:
+            pwm.events.select_loop()
     except (KeyboardInterrupt, SystemExit):
         pass
     except:
@@ -105,8 +135,22 @@ def main():
         pwm.state.store()
 
     logging.info("Shutting down...")
+    for line in pwm.events.timings_report():
+        logging.debug("Event timing: {}".format(line))
+
+    if pwm.events.profiling:
+        logging.info("Writing profile to {}...".format(
+            pwm.events.PROFILE_PATH))
+        pwm.events.dump_profile(pwm.events.PROFILE_PATH)
+    pwm.xdg.stop_index()
     pwm.widgets.destroy()
-    pwm.worker.destroy()
+    pwm.scheduler.destroy()
+    if threaded:
+        pwm.worker.destroy()
+        logging.info(
+            "Worker: {:.2f} flushes/s, at most {} queued tasks".format(
+                pwm.worker.flushes_per_second(),
+                pwm.worker.stats["high_water"]))
     pwm.systray.destroy()
     pwm.menu.destroy()
     pwm.bar.destroy()
@@ -15,6 +15,7 @@ import pwm.xdg
 import pwm.spawn
 import pwm.bar
 import pwm.root
+import pwm.text
 
 
 active = False
@@ -96,7 +97,7 @@ def show():
     _typed = ""
 
     global _applications
-    _applications = pwm.xdg.applications()
+    _applications = pwm.xdg.snapshot()
     _filter_applist()
 
     xcb.core.map_window(_window)
@@ -186,22 +187,25 @@ def _draw():
     _ctx.paint()
 
     text = _typed+"|"
+    font = (config.bar.font.face, config.bar.font.size)
 
     font_ext = cairo.ffi.new("cairo_font_extents_t*")
     _ctx.font_extents(font_ext)
     pos_y = _height/2 - font_ext.descent + font_ext.height/2
 
-    text_extents = cairo.ffi.new("cairo_text_extents_t*")
-    _ctx.text_extents(text, text_extents)
-
     _ctx.move_to(0, pos_y)
     _ctx.set_source_rgb(*pwm.color.get_rgb(config.bar.foreground))
-    _ctx.show_text(_typed+"|")
+    _ctx.show_text(text)
 
-    left = max(font_ext.max_x_advance*20, text_extents.width+10)
+    left = max(font_ext.max_x_advance*20,
+               pwm.text.extents(_ctx, font, text).width+10)
 
     for idx, (_, _, _, app) in enumerate(_filtered):
-        _ctx.text_extents(app["name"], text_extents)
+        # There is no need to measure what does not fit anymore.
+        if left >= _width:
+            break
+
+        text_extents = pwm.text.extents(_ctx, font, app["name"])
 
         if idx == _selection:
             # Make the selected entry a bit nicer
@@ -218,7 +222,6 @@ def _draw():
         _ctx.move_to(left, pos_y)
         _ctx.show_text(app["name"])
 
-        _ctx.text_extents(app["name"], text_extents)
         left += text_extents.width + 10
 
     xcb.core.copy_area(_pixmap, _window, _gc, 0, 0, 0, 0, _width, _height)
@@ -0,0 +1,20 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+
+class Record:
+    """Base class for small objects which exist once per window.
+
+    Subclasses list their attributes in __slots__, which saves a __dict__ per
+    instance. They are pickled as a plain dict of their attributes, the same
+    way objects without __slots__ are, so stored states stay compatible.
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
@@ -6,6 +6,7 @@ import logging
 from pwm.ffi.xcb import xcb
 import pwm.windows
 import pwm.atom
+import pwm.color
 
 
 class Cursor:
@@ -26,6 +27,61 @@ EVENT_MASK = (xcb.EVENT_MASK_STRUCTURE_NOTIFY |
               xcb.EVENT_MASK_ENTER_WINDOW |
               xcb.EVENT_MASK_LEAVE_WINDOW)
 
+# Let the clients know what window properties we support.
+SUPPORTED = [
+    "_NET_SUPPORTED",
+    # "_NET_WM_STATE",
+    # "_NET_WM_STATE_FULLSCREEN"
+    "_NET_WM_NAME",
+    #"_NET_WM_STRUT_PARTIAL",
+    #"_NET_WM_ICON_NAME",
+    #"_NET_WM_VISIBLE_ICON_NAME",
+    #"_NET_WM_DESKTOP",
+    "_NET_WM_WINDOW_TYPE",
+    #"_NET_WM_WINDOW_TYPE_DESKTOP",
+    #"_NET_WM_WINDOW_TYPE_DOCK",
+    "_NET_WM_WINDOW_TYPE_TOOLBAR",
+    #"_NET_WM_WINDOW_TYPE_MENU",
+    "_NET_WM_WINDOW_TYPE_UTILITY",
+    "_NET_WM_WINDOW_TYPE_SPLASH",
+    "_NET_WM_WINDOW_TYPE_DIALOG",
+    #"_NET_WM_WINDOW_TYPE_DROPDOWN_MENU",
+    #"_NET_WM_WINDOW_TYPE_POPUP_MENU",
+    #"_NET_WM_WINDOW_TYPE_TOOLTIP",
+    #"_NET_WM_WINDOW_TYPE_NOTIFICATION",
+    #"_NET_WM_WINDOW_TYPE_COMBO",
+    #"_NET_WM_WINDOW_TYPE_DND",
+    "_NET_WM_WINDOW_TYPE_NORMAL",
+    #"_NET_WM_ICON",
+    #"_NET_WM_PID",
+    "_NET_WM_STATE",
+    #"_NET_WM_STATE_STICKY",
+    #"_NET_WM_STATE_SKIP_TASKBAR",
+    "_NET_WM_STATE_FULLSCREEN",
+    #"_NET_WM_STATE_MAXIMIZED_HORZ",
+    #"_NET_WM_STATE_MAXIMIZED_VERT",
+    #"_NET_WM_STATE_ABOVE",
+    #"_NET_WM_STATE_BELOW",
+    #"_NET_WM_STATE_MODAL",
+    #"_NET_WM_STATE_HIDDEN",
+    #"_NET_WM_STATE_DEMANDS_ATTENTION"
+]
+
+# All other atoms we use somewhere, they are interned together with the
+# supported ones during setup.
+ATOMS = [
+    "UTF8_STRING",
+    "WM_PROTOCOLS",
+    "WM_DELETE_WINDOW",
+    "WM_CLASS",
+    "WM_WINDOW_ROLE",
+    "_NET_WM_STATE_DEMANDS_ATTENTION",
+    "_NET_SYSTEM_TRAY_OPCODE",
+    "MANAGER",
+    "_XEMBED",
+    "_XEMBED_INFO",
+]
+
 
 def setup():
     """Setup the root window."""
@@ -36,6 +92,13 @@ def setup():
 
     cookie.check()
 
+    # Intern all atoms in one go instead of one round trip per atom.
+    pwm.atom.prefetch(SUPPORTED + ATOMS +
+                      ["_NET_SYSTEM_TRAY_S{}".format(xcb.screen_number)])
+
+    # The same goes for the colors, so focus changes need no round trips.
+    pwm.color.prefetch_config()
+
     try:
         # We have to set the cursor now, otherwise it will not show up until
         # the first client is launched.
@@ -67,45 +130,5 @@ def _set_properties():
     # The root window must set certain properties, see:
     # See http://standards.freedesktop.org/wm-spec/latest/ar01s03.html
 
-    # Let the clients know what window properties we support.
-    supported = [
-        "_NET_SUPPORTED",
-        # "_NET_WM_STATE",
-        # "_NET_WM_STATE_FULLSCREEN"
-        "_NET_WM_NAME",
-        #"_NET_WM_STRUT_PARTIAL",
-        #"_NET_WM_ICON_NAME",
-        #"_NET_WM_VISIBLE_ICON_NAME",
-        #"_NET_WM_DESKTOP",
-        "_NET_WM_WINDOW_TYPE",
-        #"_NET_WM_WINDOW_TYPE_DESKTOP",
-        #"_NET_WM_WINDOW_TYPE_DOCK",
-        "_NET_WM_WINDOW_TYPE_TOOLBAR",
-        #"_NET_WM_WINDOW_TYPE_MENU",
-        "_NET_WM_WINDOW_TYPE_UTILITY",
-        "_NET_WM_WINDOW_TYPE_SPLASH",
-        "_NET_WM_WINDOW_TYPE_DIALOG",
-        #"_NET_WM_WINDOW_TYPE_DROPDOWN_MENU",
-        #"_NET_WM_WINDOW_TYPE_POPUP_MENU",
-        #"_NET_WM_WINDOW_TYPE_TOOLTIP",
-        #"_NET_WM_WINDOW_TYPE_NOTIFICATION",
-        #"_NET_WM_WINDOW_TYPE_COMBO",
-        #"_NET_WM_WINDOW_TYPE_DND",
-        "_NET_WM_WINDOW_TYPE_NORMAL",
-        #"_NET_WM_ICON",
-        #"_NET_WM_PID",
-        "_NET_WM_STATE",
-        #"_NET_WM_STATE_STICKY",
-        #"_NET_WM_STATE_SKIP_TASKBAR",
-        "_NET_WM_STATE_FULLSCREEN",
-        #"_NET_WM_STATE_MAXIMIZED_HORZ",
-        #"_NET_WM_STATE_MAXIMIZED_VERT",
-        #"_NET_WM_STATE_ABOVE",
-        #"_NET_WM_STATE_BELOW",
-        #"_NET_WM_STATE_MODAL",
-        #"_NET_WM_STATE_HIDDEN",
-        #"_NET_WM_STATE_DEMANDS_ATTENTION"
-    ]
-
-    atoms = [pwm.atom.get(name) for name in supported]
+    atoms = [pwm.atom.get(name) for name in SUPPORTED]
     pwm.windows.set_property(xcb.screen.root, "_NET_SUPPORTED", atoms)
@@ -1,38 +1,313 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+from collections import defaultdict
+import fnmatch
+import logging
+import re
+
 from pwm.config import config
 import pwm.windows
 
+# The rules from the configuration compiled into a Matcher.
+_compiled = None
+_compiled_from = None
+
+FLAGS = re.IGNORECASE | re.DOTALL
+
+# The number of children of every node in the pattern tree of a Matcher.
+BRANCHES = 8
+
 
 class Rule:
-    def __init__(self, prop, value, floating=False, workspace=None):
+    """A rule for windows.
+
+    The value is matched against the property of a window depending on
+    match, which can be one of:
+        exact: The value has to be equal to the property.
+        glob:  The value is a shell-style pattern such as "gimp-*".
+        regex: The value is a regular expression.
+    All matches are case insensitive and have to match the whole property.
+    """
+
+    MATCHES = ("exact", "glob", "regex")
+
+    def __init__(self, prop, value, floating=False, workspace=None,
+                 match="exact"):
+        if match not in self.MATCHES:
+            raise ValueError("Invalid rule match: {}".format(match))
+
         self.prop = prop
-        self.value = value.lower()
+        self.match = match
+        # Lowering a regex could change its meaning (e.g. \S and \s), so
+        # patterns are compiled case insensitive instead.
+        self.value = value if match == "regex" else value.lower()
         self.floating = floating
         self.workspace = workspace
 
+        self.regex = None
+        if match != "exact":
+            # Every pattern is compiled on its own, so groups, backreferences
+            # and inline flags keep their meaning.
+            try:
+                self.regex = re.compile(self.pattern(), FLAGS)
+            except re.error as err:
+                raise ValueError("Invalid rule pattern {!r}: {}".format(
+                    value, err))
+
+    def pattern(self):
+        """Return the value as regular expression."""
+        if self.match == "glob":
+            pattern = fnmatch.translate(self.value)
+            # The (?s:...)\Z wrapper is redundant as patterns are compiled
+            # with DOTALL and fully matched, but it keeps the regex engine
+            # from skipping alternatives by their first character.
+            if pattern.startswith("(?s:") and pattern.endswith(")\\Z"):
+                pattern = pattern[len("(?s:"):-len(")\\Z")]
+            return pattern
+        elif self.match == "regex":
+            return self.value
+        return re.escape(self.value)
+
+
+def _combinable(rule):
+    """Return true if the pattern of rule can be part of an alternation.
+
+    Joining patterns would renumber their groups and inline flags are only
+    allowed at the start of a pattern, such patterns are matched on their own.
+    """
+    if rule.regex.groups or rule.regex.flags != re.compile("", FLAGS).flags:
+        return False
+
+    try:
+        re.compile("|(?:{})".format(rule.regex.pattern), FLAGS)
+    except re.error:
+        return False
+    return True
+
+
+def _tree(rules):
+    """Build a tree of (regex, children, rule) nodes for (index, rule) tuples.
+
+    The regex of a node matches if the pattern of any rule below it matches.
+    Leaves have the (index, rule) tuple and no children, inner nodes have up
+    to BRANCHES children and no rule.
+    """
+    if len(rules) == 1:
+        return (rules[0][1].regex, [], rules[0])
+
+    size = -(-len(rules) // BRANCHES)
+    children = [_tree(rules[i:i + size]) for i in range(0, len(rules), size)]
+    regex = re.compile("|".join("(?:{})".format(rule.regex.pattern)
+                                for _, rule in rules), FLAGS)
+    return (regex, children, None)
+
+
+def _literal_prefix(rule):
+    """Return the lowercase literal text every value matched by rule starts
+    with, it is empty if the pattern starts with a wildcard.
+
+    Regexes are only looked at up to the first special character and not at
+    all if they contain an alternation.
+    """
+    if rule.match == "glob":
+        return re.match(r"[^*?[]*", rule.value).group()
+
+    if "|" in rule.value:
+        return ""
+
+    prefix = []
+    pattern = rule.value
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == "\\" and pattern[i + 1:i + 2].isalnum():
+            break
+        elif pattern[i] == "\\":
+            char, i = pattern[i + 1:i + 2], i + 2
+        elif pattern[i].isalnum() or pattern[i] in "-_ ":
+            char, i = pattern[i], i + 1
+        else:
+            break
+
+        # A quantifier makes the character optional or repeats it.
+        if not char.isascii() or pattern[i:i + 1] in ("*", "+", "?", "{"):
+            break
+        prefix.append(char.lower())
+
+    return "".join(prefix)
+
+
+class Patterns:
+    """The glob and regex rules of one property compiled for fast matching.
+
+    Rules whose patterns start with literal text are stored in a dict which
+    maps that prefix to a list of (index, rule) tuples, so only the patterns
+    of the prefixes of a value are matched. The other rules are combined into
+    a tree of alternations, see _tree(). A value which matches none of them
+    only costs a single match against the root of the tree. Rules which can't
+    be combined are matched one after another.
+    """
+
+    def __init__(self, rules):
+        self.prefixes = defaultdict(list)
+        combined = []
+        self.separate = []
+
+        for idx, rule in rules:
+            prefix = _literal_prefix(rule)
+            if prefix:
+                self.prefixes[prefix].append((idx, rule))
+            elif _combinable(rule):
+                combined.append((idx, rule))
+            else:
+                self.separate.append((idx, rule))
+
+        self.prefixes = dict(self.prefixes)
+        self.lengths = sorted({len(prefix) for prefix in self.prefixes})
+        self.tree = _tree(combined) if combined else None
+
+    def match(self, value):
+        """Return the (index, rule) tuples of all rules matching value."""
+        found = [(idx, rule) for idx, rule in self.separate
+                 if rule.regex.fullmatch(value)]
+
+        for length in self.lengths:
+            for idx, rule in self.prefixes.get(value[:length], ()):
+                if rule.regex.fullmatch(value):
+                    found.append((idx, rule))
+
+        # Only follow the branches of the tree which match.
+        nodes = [self.tree] if self.tree else []
+        while nodes:
+            regex, children, entry = nodes.pop()
+            if regex.fullmatch(value):
+                if entry:
+                    found.append(entry)
+                nodes.extend(children)
+
+        return found
+
+
+class Matcher:
+    """A list of rules compiled for fast matching.
+
+    Exact rules are stored in a dict which maps (prop, value) to a list of
+    (index, rule) tuples, index being the position in the list of rules.
+    The glob and regex rules are compiled into Patterns per property.
+    """
+
+    def __init__(self, rules):
+        self.exact = defaultdict(list)
+        patterns = defaultdict(list)
+
+        for idx, rule in enumerate(rules):
+            if rule.match == "exact":
+                self.exact[(rule.prop, rule.value)].append((idx, rule))
+            else:
+                patterns[rule.prop].append((idx, rule))
+
+        self.exact = dict(self.exact)
+        self.patterns = {prop: Patterns(r) for prop, r in patterns.items()}
+
+        self.props = ({prop for prop, _ in self.exact} |
+                      set(self.patterns.keys()))
+
+    def match(self, values):
+        """Return all rules matching the given property values.
+
+        The rules are returned in the order they were defined.
+        """
+        found = []
+        for prop, value in values.items():
+            found.extend(self.exact.get((prop, value), []))
+
+            if value is not None and prop in self.patterns:
+                found.extend(self.patterns[prop].match(value))
+
+        return [rule for _, rule in sorted(found, key=lambda f: f[0])]
+
+
+def setup():
+    """Compile the rules of the configuration.
+
+    Invalid rules are reported once and no rules are used instead, so they
+    don't fail every time a window is managed.
+    """
+    global _compiled, _compiled_from
+
+    try:
+        _compiled = Matcher(config.rules)
+    except Exception as err:
+        logging.error("Invalid rules in configuration: {}".format(err))
+        _compiled = Matcher([])
+    _compiled_from = config.rules
+
+
+def _get_compiled():
+    """Return the compiled rules of the current configuration.
+
+    The rules are compiled by setup(), they are only compiled again here if
+    the configuration changed since.
+    """
+    if _compiled_from is not config.rules:
+        setup()
+
+    return _compiled
+
+
+def _find_rules(props):
+    """Return all rules matching the window in the order they are defined."""
 
-def _find_rules(wid):
     def _lower(s):
         return s.lower() if s else None
 
-    for rule in config.rules:
-        if ((rule.prop == "class" and
-             rule.value == _lower(pwm.windows.get_property(
-                 wid, "WM_CLASS"))) or
-            (rule.prop == "role" and
-             rule.value == _lower(pwm.windows.get_property(
-                 wid, "WM_WINDOW_ROLE"))) or
-            (rule.prop == "name" and
-             rule.value == _lower(pwm.windows.get_name(wid)))):
-            yield rule
+    matcher = _get_compiled()
+
+    # Only read the properties which are used by any rule, every one of them
+    # at most once.
+    values = {}
+    if "class" in matcher.props:
+        values["class"] = _lower(props.get("WM_CLASS"))
+    if "role" in matcher.props:
+        values["role"] = _lower(props.get("WM_WINDOW_ROLE"))
+    if "name" in matcher.props:
+        values["name"] = _lower(props.name())
+
+    return matcher.match(values)
+
+
+def floating(wid, props=None):
+    """Return true if this window has a floating rule.
 
+    If a property snapshot is given the properties are read from it.
+    """
 
-def floating(wid):
-    """Return true if this window has a floating rule."""
+    if props is None:
+        props = pwm.windows.Properties(wid, [])
 
-    for rule in _find_rules(wid):
+    for rule in _find_rules(props):
         if rule.floating:
             return True
     return False
+
+
+def workspace(wid, props=None):
+    """Return the workspace index this window should be placed on.
+
+    If there is no rule with a workspace for this window, return None.
+    If a property snapshot is given the properties are read from it.
+    """
+
+    if props is None:
+        props = pwm.windows.Properties(wid, [])
+
+    for rule in _find_rules(props):
+        if rule.workspace is None:
+            continue
+
+        if 0 <= rule.workspace < config.workspaces:
+            return rule.workspace
+
+        logging.error("Invalid workspace in rule: {}".format(rule.workspace))
+
+    return None
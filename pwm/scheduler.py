@@ -1,30 +1,119 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import heapq
+import itertools
 import threading
 import logging
+import time
+
+import pwm.worker
+
+# If set, schedulers do not start a thread but are run by the event loop
+# through run_due().
+inline = False
+timers = []
+
+# Calls scheduled by call_later() while running inline, a heap of
+# (due, sequence, func) tuples.
+calls = []
+_sequence = itertools.count()
+
+# The timers started by call_later() while running threaded, so they can be
+# cancelled by destroy().
+_pending = []
 
 
 class Scheduler:
     def __init__(self, func, interval):
         self.func = func
         self.interval = interval
+        self.due = None
 
         self.stop_event = threading.Event()
         self.thread = threading.Thread(target=self._loop)
         self.thread.daemon = True
 
     def start(self):
-        self.thread.start()
+        if inline:
+            self.due = time.monotonic()
+            timers.append(self)
+        else:
+            self.thread.start()
 
     def stop(self):
-        self.stop_event.set()
-        self.thread.join()
+        if self in timers:
+            timers.remove(self)
+        else:
+            self.stop_event.set()
+            # A scheduler may be stopped without having been started.
+            if self.thread.ident is not None:
+                self.thread.join()
+
+    def _run(self):
+        try:
+            self.func()
+        except:
+            logging.exception("Scheduler error")
 
     def _loop(self):
         while not self.stop_event.is_set():
-            try:
-                self.func()
-            except:
-                logging.exception("Scheduler error")
+            self._run()
             self.stop_event.wait(self.interval)
+
+
+def call_later(delay, func):
+    """Run func once after delay seconds.
+
+    func is run like a worker task, by the worker thread or by the event loop
+    if the schedulers run inline.
+    """
+    if inline:
+        heapq.heappush(calls,
+                       (time.monotonic() + delay, next(_sequence), func))
+    else:
+        _pending[:] = [t for t in _pending if t.is_alive()]
+
+        timer = threading.Timer(delay, pwm.worker.tasks.put, [func])
+        timer.daemon = True
+        timer.start()
+        _pending.append(timer)
+
+
+def destroy():
+    """Drop all calls which are not due yet."""
+    for timer in _pending:
+        timer.cancel()
+    _pending.clear()
+    calls.clear()
+
+
+def timeout():
+    """Return the seconds until the next inline scheduler or call is due.
+
+    Return None if there is none.
+    """
+    due = [t.due for t in timers]
+    if calls:
+        due.append(calls[0][0])
+
+    if not due:
+        return None
+    return max(0, min(due) - time.monotonic())
+
+
+def run_due():
+    """Run all inline schedulers and calls which are due."""
+    now = time.monotonic()
+    for timer in list(timers):
+        if timer.due <= now:
+            timer._run()
+            # Like the threaded loop, wait a whole interval after running.
+            timer.due = time.monotonic() + timer.interval
+
+    while calls and calls[0][0] <= now:
+        _, _, func = heapq.heappop(calls)
+        try:
+            func()
+        except:
+            logging.exception("Scheduler error")
@@ -0,0 +1,51 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+from collections import OrderedDict
+from collections import namedtuple
+
+from pwm.ffi.cairo import cairo
+
+TextExtents = namedtuple("TextExtents", ["x_bearing", "y_bearing", "width",
+                                         "height", "x_advance", "y_advance"])
+
+# The extents of recently measured texts, the least recently used are dropped
+# once there are more than max_entries.
+_cache = OrderedDict()
+max_entries = 1024
+
+# Cache statistics, useful to check that the same text is not measured over
+# and over again.
+stats = {"hits": 0, "misses": 0}
+
+
+def extents(ctx, font, text):
+    """Return the TextExtents of text drawn with font.
+
+    font is a (face, size) tuple which identifies the font currently selected
+    on the cairo context ctx. The text is only measured if it is not cached.
+    """
+    key = (font, text)
+
+    if key in _cache:
+        stats["hits"] += 1
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    stats["misses"] += 1
+    ext = cairo.ffi.new("cairo_text_extents_t*")
+    ctx.text_extents(text, ext)
+
+    ext = TextExtents(ext.x_bearing, ext.y_bearing, ext.width, ext.height,
+                      ext.x_advance, ext.y_advance)
+
+    _cache[key] = ext
+    if len(_cache) > max_entries:
+        _cache.popitem(last=False)
+
+    return ext
+
+
+def clear():
+    """Drop all cached extents."""
+    _cache.clear()
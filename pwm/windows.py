@@ -5,13 +5,14 @@ from contextlib import contextmanager
 from functools import wraps
 import struct
 
-from pwm.ffi.xcb import xcb
+from pwm.ffi.xcb import xcb, XcbError
 from pwm.config import config
 import pwm.atom
 import pwm.events
 import pwm.workspaces
 import pwm.color
 import pwm.rules
+import pwm.record
 
 
 managed = {}
@@ -21,8 +22,15 @@ MANAGED_EVENT_MASK = (xcb.EVENT_MASK_ENTER_WINDOW |
                       xcb.EVENT_MASK_FOCUS_CHANGE |
                       xcb.EVENT_MASK_PROPERTY_CHANGE)
 
+# All properties we need to know when we start to manage a window.
+MANAGE_PROPERTIES = ["_NET_WM_STATE", "_NET_WM_WINDOW_TYPE", "WM_CLASS",
+                     "WM_WINDOW_ROLE", "_NET_WM_NAME", xcb.ATOM_WM_NAME]
+
+
+class Info(pwm.record.Record):
+    __slots__ = ("ignore_unmaps", "floating", "fullscreen", "urgent",
+                 "workspace", "geometry")
 
-class Info:
     def __init__(self):
         # Some UnmapNotifyEvents, like those generated when switching
         # workspaces, have to be ignored. This indicates how many future
@@ -36,6 +44,42 @@ class Info:
         self.geometry = None
 
 
+class Properties:
+    """A snapshot of some properties of a window.
+
+    The requests for all properties are sent as soon as the snapshot is
+    created, but the replies are only waited for when a value is needed.
+    Creating snapshots for many windows at once therefore costs a single round
+    trip. Properties which were not requested are fetched on demand.
+    """
+
+    def __init__(self, wid, atoms):
+        self.wid = wid
+        self.values = {}
+        self.cookies = {atom: _request_property(wid, atom) for atom in atoms}
+
+    def get(self, atom):
+        """Return the value of the property."""
+        if atom not in self.values:
+            if atom in self.cookies:
+                reply = self.cookies.pop(atom).reply()
+                self.values[atom] = _property_value(reply)
+            else:
+                self.values[atom] = get_property(self.wid, atom)
+
+        return self.values[atom]
+
+    def name(self):
+        """Return the window name, see get_name()."""
+        return self.get("_NET_WM_NAME") or self.get(xcb.ATOM_WM_NAME) or ""
+
+    def discard(self):
+        """Discard the replies of all properties which were not used."""
+        for cookie in self.cookies.values():
+            cookie.discard()
+        self.cookies = {}
+
+
 def create(x, y, width, height, mask=None):
     """Create a new window and return its id."""
 
@@ -69,31 +113,97 @@ def manage(wid, only_if_mapped=False):
     if wid in managed:
         return
 
-    attr = xcb.core.get_window_attributes(wid).reply()
+    # Send all requests at once and wait for the replies afterwards, this
+    # way managing a window only costs a single round trip.
+    if (_adopt_requested(wid, _request(wid), only_if_mapped) and
+            managed[wid].workspace == pwm.workspaces.current()):
+        focus(wid)
+
 
+def _request(wid):
+    """Send all requests needed to manage the window.
+
+    Return a tuple of (attributes, geometry, properties).
+    """
+    return (xcb.core.get_window_attributes(wid),
+            xcb.core.get_geometry(wid),
+            Properties(wid, MANAGE_PROPERTIES))
+
+
+def _adopt_requested(wid, requests, only_if_mapped, arrange=True):
+    """Manage the window using the replies to the requests from _request().
+
+    Return True if the window is managed now.
+    """
+    attr, geometry, props = requests
+
+    try:
+        attr = attr.reply()
+        manage_it = _should_manage(attr, only_if_mapped)
+    except XcbError:
+        # The window is already gone.
+        manage_it = False
+
+    if not manage_it:
+        geometry.discard()
+        props.discard()
+        return False
+
+    _adopt(wid, should_float(wid, props),
+           _geometry_value(geometry.reply()),
+           props.get("_NET_WM_STATE"),
+           pwm.rules.workspace(wid, props),
+           attr.map_state == xcb.MAP_STATE_VIEWABLE,
+           arrange)
+
+    props.discard()
+    return True
+
+
+def _should_manage(attr, only_if_mapped):
     if only_if_mapped and attr.map_state != xcb.MAP_STATE_VIEWABLE:
-        return
+        return False
 
     # Don't manage windows with the override_redirect flag.
     if attr.override_redirect:
-        return
+        return False
+
+    return True
 
+
+def _adopt(wid, floating, geometry, state, workspace=None, mapped=False,
+           arrange=True):
+    """Start managing a window whose properties are already known.
+
+    The window is placed on the workspace with the given index or on the
+    current workspace if the index is None.
+    If arrange is False the tiling layout will not be arranged, the caller is
+    responsible to do this.
+    """
     info = Info()
     managed[wid] = info
 
-    info.floating = should_float(wid)
-    update_geometry(wid, force=True)
+    info.floating = floating
+    info.geometry = geometry
 
-    state = get_property(wid, "_NET_WM_STATE")
     if state and pwm.atom.get("_NET_WM_STATE_FULLSCREEN") in state:
         info.fullscreen = True
 
     change_attributes(wid, [(xcb.CW_EVENT_MASK, MANAGED_EVENT_MASK)])
 
-    pwm.workspaces.current().add_window(wid)
-    info.workspace = pwm.workspaces.current()
+    if workspace is None:
+        ws = pwm.workspaces.current()
+    else:
+        ws = pwm.workspaces.workspaces[workspace]
+
+    if mapped and ws != pwm.workspaces.current():
+        # The window belongs to a hidden workspace, so hide it without
+        # unmanaging it.
+        info.ignore_unmaps += 1
+        xcb.core.unmap_window(wid)
 
-    focus(wid)
+    ws.add_window(wid, arrange)
+    info.workspace = ws
 
 
 def unmanage(wid):
@@ -109,20 +219,47 @@ def unmanage(wid):
 
 
 def manage_existing():
-    """Go through all existing windows and manage them."""
+    """Go through all existing windows and manage them.
+
+    Instead of managing one window after the other, the requests for all
+    windows are sent first and the replies are collected afterwards. The
+    layout is arranged only once at the end.
+    """
 
     # Get the tree of windows whose parent is the root window (= all)
     reply = xcb.core.query_tree(xcb.screen.root).reply()
     children = xcb.query_tree_children(reply)
 
+    requests = []
     for i in range(xcb.query_tree_children_length(reply)):
-        manage(children[i], True)
+        wid = children[i]
+        if wid not in managed:
+            requests.append((wid, _request(wid)))
+
+    adopted = []
+    for wid, req in requests:
+        if _adopt_requested(wid, req, True, arrange=False):
+            adopted.append(wid)
 
+    for ws in {managed[wid].workspace for wid in adopted}:
+        ws.tiling.arrange()
 
-def should_float(wid):
-    """Try to determine if a window should be placed on the floating layer."""
+    current = [wid for wid in adopted
+               if managed[wid].workspace == pwm.workspaces.current()]
+    if current:
+        focus(current[-1])
 
-    if pwm.rules.floating(wid):
+
+def should_float(wid, props=None):
+    """Try to determine if a window should be placed on the floating layer.
+
+    If a property snapshot is given the properties are read from it.
+    """
+
+    if props is None:
+        props = Properties(wid, [])
+
+    if pwm.rules.floating(wid, props):
         return True
 
     # Check the _NET_WM_WINDOW_TYPE property to determine the type of this
@@ -130,7 +267,7 @@ def should_float(wid):
     # See the specification for more info:
     # http://standards.freedesktop.org/wm-spec/wm-spec-latest.html
 
-    wintype = get_property(wid, "_NET_WM_WINDOW_TYPE")
+    wintype = props.get("_NET_WM_WINDOW_TYPE")
 
     if not wintype:
         return False
@@ -177,12 +314,21 @@ def get_name(wid):
 def get_property(wid, atom):
     """Get a property of this window."""
 
+    return _property_value(_request_property(wid, atom).reply())
+
+
+def _request_property(wid, atom):
+    """Send the request for a property and return its cookie."""
+
     if isinstance(atom, str):
         atom = pwm.atom.get(atom)
 
-    reply = xcb.core.get_property(False, wid, atom,
-                                  xcb.GET_PROPERTY_TYPE_ANY, 0,
-                                  2 ** 32 - 1).reply()
+    return xcb.core.get_property(False, wid, atom,
+                                 xcb.GET_PROPERTY_TYPE_ANY, 0, 2 ** 32 - 1)
+
+
+def _property_value(reply):
+    """Turn a get_property reply into a python value."""
 
     # We want to turn the value into something useful.
     # In particular, if the format of the reply is 8, then assume that it is a
@@ -301,7 +447,11 @@ def get_geometry(wid, absolute=False):
     Return a tuple(x, y, width, height).
     """
 
-    geo = xcb.core.get_geometry(wid).reply()
+    return _geometry_value(xcb.core.get_geometry(wid).reply(), absolute)
+
+
+def _geometry_value(geo, absolute=False):
+    """Turn a get_geometry reply into a tuple(x, y, width, height)."""
 
     if not absolute:
         ws = pwm.workspaces.current()
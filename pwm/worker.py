@@ -1,15 +1,48 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
-from queue import Queue
+from queue import Queue, Empty
+import os
 import threading
 import logging
+import time
 
 from pwm.ffi.xcb import xcb
 
-tasks = Queue()
+
+class TaskQueue(Queue):
+    """A queue which can wake up a selector whenever a task is put.
+
+    If wakeup is set to the write end of a pipe, a byte is written to it for
+    every queued task, so the select loop notices tasks put by other threads.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.wakeup = None
+
+    def _put(self, item):
+        super()._put(item)
+
+        if self.wakeup is not None:
+            try:
+                os.write(self.wakeup, b"x")
+            except BlockingIOError:
+                # The pipe is full, the selector is woken up anyway.
+                pass
+
+
+tasks = TaskQueue()
 _thread = None
 
+# Tasks are run until the queue is empty before flushing the connection. To
+# still flush promptly if tasks keep coming, the connection is flushed at least
+# every max_latency seconds. None disables this.
+max_latency = 0.01
+
+# The number of flushes since start() and the most tasks ever queued at once.
+stats = {"flushes": 0, "high_water": 0, "started": None}
+
 
 class ExitWorker(Exception):
     pass
@@ -17,6 +50,10 @@ class ExitWorker(Exception):
 
 def start():
     global _thread
+    stats["flushes"] = 0
+    stats["high_water"] = 0
+    stats["started"] = time.monotonic()
+
     _thread = threading.Thread(target=_loop)
     _thread.daemon = True
     _thread.start()
@@ -27,16 +64,70 @@ def destroy():
     _thread.join()
 
 
+def flushes_per_second():
+    """Return the average number of flushes per second since start()."""
+    if stats["started"] is None:
+        return 0.0
+    elapsed = time.monotonic() - stats["started"]
+    return stats["flushes"] / elapsed if elapsed > 0 else 0.0
+
+
 def _loop():
     while True:
         try:
-            work = tasks.get()
-            if work is ExitWorker:
-                raise ExitWorker()
-            work()
-            xcb.core.flush()
-            tasks.task_done()
+            _drain(tasks.get())
         except ExitWorker:
             break
+        finally:
+            xcb.core.flush()
+            stats["flushes"] += 1
+
+
+def _drain(work):
+    """Run work and all further queued tasks.
+
+    Stop if the queue is empty or max_latency is exceeded.
+    """
+    start = time.monotonic()
+
+    while True:
+        # Plus one for the task just taken from the queue.
+        stats["high_water"] = max(stats["high_water"], tasks.qsize() + 1)
+
+        if work is ExitWorker:
+            tasks.task_done()
+            raise ExitWorker()
+
+        try:
+            work()
+        except:
+            logging.exception("Worker task error")
+        tasks.task_done()
+
+        if (max_latency is not None and
+                time.monotonic() - start >= max_latency):
+            return
+
+        try:
+            work = tasks.get_nowait()
+        except Empty:
+            return
+
+
+def run_pending():
+    """Run all queued tasks in the calling thread.
+
+    This is used by the select event loop, which runs without the worker
+    thread.
+    """
+    while True:
+        try:
+            work = tasks.get_nowait()
+        except Empty:
+            return
+
+        try:
+            work()
         except:
             logging.exception("Worker task error")
+        tasks.task_done()
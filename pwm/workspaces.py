@@ -40,7 +40,7 @@ class Workspace:
         for w in self.windows:
             xcb.core.map_window(w)
 
-    def add_window(self, wid):
+    def add_window(self, wid, arrange=True):
         with pwm.windows.no_enter_notify_event():
             if pwm.windows.managed[wid].fullscreen:
                 self.fullscreen.add_window(wid)
@@ -56,7 +56,7 @@ class Workspace:
                         row += 1
                         break
 
-                self.tiling.add_window(wid, column, row)
+                self.tiling.add_window(wid, column, row, arrange)
 
             self.windows.append(wid)
             if current() == self:
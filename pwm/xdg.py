@@ -2,12 +2,55 @@
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
 import os
+import ctypes
+import errno
 import glob
+import json
+import logging
 import re
+import select
+import struct
+import threading
 
 # The directories are defined in:
 # http://standards.freedesktop.org/basedir-spec/basedir-spec-latest.html
 
+# The version of the application cache format, files of another version are
+# ignored.
+CACHE_VERSION = 1
+
+# The parsed .desktop files. Maps every directory to a tuple of its mtime and
+# a dict, which maps the path of every .desktop file in it to a tuple of its
+# mtime and the parsed entry, None if the file could not be parsed.
+_cache = None
+_lock = threading.Lock()
+
+# The live index of applications, see start_index().
+index = None
+
+# Seconds between two scans of the index. With inotify the index only polls
+# while a missing directory has no existing parent which could be watched.
+POLL_INTERVAL = 5.0
+
+# From <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT = struct.Struct("iIII")
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+               IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# The parents of missing directories are watched for them to be created.
+_PARENT_MASK = IN_CREATE | IN_MOVED_TO
+
 
 def config_home():
     """Return the XDG_CONFIG_HOME directory."""
@@ -19,6 +62,11 @@ def data_home():
     return os.getenv("XDG_DATA_HOME", os.environ["HOME"] + "/.local/share")
 
 
+def cache_home():
+    """Return the XDG_CACHE_HOME directory."""
+    return os.getenv("XDG_CACHE_HOME", os.environ["HOME"] + "/.cache")
+
+
 def data_dirs():
     """Return the XDG_DATA_DIRS directory."""
     return os.getenv("XDG_DATA_DIRS", "/usr/local/share:/usr/share")
@@ -60,15 +108,324 @@ def _desktop_file_key(contents, key):
 
 
 def applications():
-    """Return a list of all applications found via .desktop files."""
+    """Return a list of all applications found via .desktop files.
+
+    The parsed files are cached on disk. A directory is only listed again if
+    its mtime changed. Only the files with a changed mtime are parsed, which
+    also catches files edited in place.
+    """
+    with _lock:
+        return _applications()
+
 
+def _applications():
+    global _cache
+
+    if _cache is None:
+        _cache = _load_cache()
+
+    dirs = {}
     applications = []
-    for path in find_desktop_files():
+    for d in desktop_file_dirs():
+        mtime = _mtime(d)
+        cached = _cache.get(d)
+
+        if mtime is None:
+            # The directory was removed, e.g. while inotify events were lost.
+            cached = (None, {})
+        elif cached is None or cached[0] != mtime:
+            cached = (mtime, _scan_dir(d, cached[1] if cached else {}))
+        else:
+            # Editing a file in place does not change the directory.
+            cached = (mtime, _scan_files(cached[1], cached[1]))
+
+        dirs[d] = cached
+        applications.extend(entry for _, entry in cached[1].values()
+                            if entry is not None)
+
+    if dirs != _cache:
+        _save_cache(dirs)
+    _cache = dirs
+
+    return applications
+
+
+def _invalidate(path=None):
+    """Make the next scan parse the .desktop file at path again.
+
+    Without a path, every directory is listed again.
+    """
+    with _lock:
+        if not _cache:
+            return
+
+        for d, (mtime, files) in _cache.items():
+            if path is None:
+                _cache[d] = (None, files)
+            elif os.path.dirname(path) == d:
+                files = dict(files)
+                files.pop(path, None)
+                _cache[d] = (None, files)
+
+
+def _mtime(path):
+    """Return the mtime of path in nanoseconds or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_dir(path, cached):
+    """Return the .desktop files of a directory as stored in the cache.
+
+    Only files which are not in cached or have another mtime are parsed.
+    """
+    return _scan_files(sorted(glob.glob(os.path.join(path, "*.desktop"))),
+                       cached)
+
+
+def _scan_files(paths, cached):
+    """Return the given .desktop files as stored in the cache.
+
+    Only files which are not in cached or have another mtime are parsed,
+    files which no longer exist are left out.
+    """
+    files = {}
+    for f in paths:
+        mtime = _mtime(f)
+        if mtime is None:
+            continue
+
+        if f in cached and cached[f][0] == mtime:
+            files[f] = cached[f]
+        else:
+            files[f] = (mtime, _parse_file(f))
+
+    return files
+
+
+def _parse_file(path):
+    """Parse a .desktop file, return None if it could not be parsed."""
+    try:
         with open(path) as f:
+            return parse_desktop_file(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def cache_file():
+    """Return the path of the application cache."""
+    return cache_home() + "/pwm/applications.json"
+
+
+def _load_cache():
+    """Load the application cache, return an empty one if there is none."""
+    try:
+        with open(cache_file()) as f:
+            version, dirs = json.load(f)
+        if version == CACHE_VERSION:
+            # JSON has no tuples, they are stored as lists.
+            return {d: (mtime, {path: tuple(entry)
+                                for path, entry in files.items()})
+                    for d, (mtime, files) in dirs.items()}
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logging.warning("Ignoring invalid application cache")
+
+    return {}
+
+
+def _save_cache(dirs):
+    """Write the application cache."""
+    path = cache_file()
+    try:
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+        # Write to another file first, so the cache is never left incomplete.
+        with open(path + ".tmp", "w") as f:
+            json.dump((CACHE_VERSION, dirs), f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        logging.exception("Could not write the application cache")
+
+
+def _inotify():
+    """Return inotify_init1, inotify_add_watch and inotify_rm_watch of the C
+    library.
+
+    Return None if inotify is not available.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        init, add_watch, rm_watch = (libc.inotify_init1,
+                                     libc.inotify_add_watch,
+                                     libc.inotify_rm_watch)
+    except (OSError, AttributeError):
+        return None
+
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return init, add_watch, rm_watch
+
+
+class Index:
+    """A list of all applications, kept up to date by a background thread.
+
+    The thread rescans the directories of .desktop files whenever inotify
+    reports a change in them. The parents of missing directories are watched
+    too, so a new directory is found right away. If inotify is not available
+    or the parent of a missing directory does not exist either, it polls
+    every poll_interval seconds.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.applications = ()
+
+        self.inotify = _inotify()
+        self.fd = None
+        self.watches = {}
+        self.parents = {}
+
+        # Whether a missing directory has no watched parent, see _watch().
+        self.unwatched = False
+
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self._stop_read, self._stop_write = os.pipe()
+
+    def start(self):
+        if self.inotify:
+            init, _, _ = self.inotify
+            self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+            if self.fd < 0:
+                logging.warning("Could not initialize inotify: {}".format(
+                    os.strerror(ctypes.get_errno())))
+                self.fd = None
+
+        self._watch()
+        self.update()
+        self.thread.start()
+
+    def stop(self):
+        os.write(self._stop_write, b"x")
+        self.thread.join()
+
+        for fd in (self._stop_read, self._stop_write, self.fd):
+            if fd is not None:
+                os.close(fd)
+
+    def update(self):
+        """Scan the directories and replace the list of applications."""
+        self.applications = tuple(applications())
+
+    def _watch(self):
+        """Watch every existing directory which is not yet watched.
+
+        The parent of every missing directory is watched instead.
+        """
+        if self.fd is None:
+            return
+
+        _, add_watch, rm_watch = self.inotify
+        watched = set(self.watches.values())
+        missing = set()
+        for d in desktop_file_dirs():
+            if d in watched:
+                continue
+
+            wd = -1
+            if os.path.isdir(d):
+                wd = add_watch(self.fd, os.fsencode(d), _WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = d
+                watched.add(d)
+            else:
+                missing.add(os.path.dirname(d))
+
+        for wd, parent in list(self.parents.items()):
+            if parent not in missing:
+                rm_watch(self.fd, wd)
+                del self.parents[wd]
+
+        for parent in missing - set(self.parents.values()):
+            if os.path.isdir(parent):
+                wd = add_watch(self.fd, os.fsencode(parent), _PARENT_MASK)
+                if wd >= 0:
+                    self.parents[wd] = parent
+
+        self.unwatched = bool(missing - set(self.parents.values()))
+
+    def _read_events(self):
+        """Read the pending inotify events and invalidate what changed."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                _invalidate()
+            elif mask & IN_IGNORED:
+                # The directory was removed, its parent is watched until it
+                # is created anew.
+                self.watches.pop(wd, None)
+                self.parents.pop(wd, None)
+            elif wd in self.watches and name:
+                _invalidate(os.path.join(self.watches[wd],
+                                         os.fsdecode(name)))
+
+    def _loop(self):
+        fds = [self._stop_read]
+        if self.fd is not None:
+            fds.append(self.fd)
+
+        while True:
+            # Without a timeout only inotify events wake the thread up.
+            timeout = (self.poll_interval
+                       if self.fd is None or self.unwatched else None)
+            ready, _, _ = select.select(fds, [], [], timeout)
+            if self._stop_read in ready:
+                break
+
             try:
-                parsed = parse_desktop_file(f.read())
-                applications.append(parsed)
+                if self.fd in ready:
+                    self._read_events()
+                self._watch()
+                self.update()
             except:
-                pass
+                logging.exception("Application index error")
 
-    return applications
+
+def start_index(poll_interval=POLL_INTERVAL):
+    """Start keeping the list of applications up to date in the background."""
+    global index
+    index = Index(poll_interval)
+    index.start()
+
+
+def stop_index():
+    global index
+    index.stop()
+    index = None
+
+
+def snapshot():
+    """Return the applications of the index without any I/O.
+
+    If the index was not started, scan for them instead.
+    """
+    if index is None:
+        return applications()
+    return index.applications
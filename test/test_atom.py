@@ -0,0 +1,59 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import unittest
+from unittest.mock import patch
+
+import pwm.atom
+import test.util as util
+
+
+class TestAtom(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+
+    def tearDown(self):
+        util.tear_down()
+
+    def test_prefetch(self):
+        names = ["_PWM_TEST_PREFETCH_A", "_PWM_TEST_PREFETCH_B"]
+        pwm.atom.prefetch(names)
+
+        for name in names:
+            self.assertIn(name, pwm.atom._atom_cache)
+
+    def test_prefetch_equals_get(self):
+        pwm.atom.prefetch(["_PWM_TEST_PREFETCH_C"])
+        atom = pwm.atom._atom_cache.pop("_PWM_TEST_PREFETCH_C")
+        self.assertEqual(pwm.atom.get("_PWM_TEST_PREFETCH_C"), atom)
+
+    def test_prefetch_skip_cached(self):
+        pwm.atom.get("_PWM_TEST_PREFETCH_D")
+
+        with patch.object(pwm.atom, "xcb") as xcb:
+            pwm.atom.prefetch(["_PWM_TEST_PREFETCH_D"])
+
+        self.assertFalse(xcb.core.intern_atom_unchecked.called)
+
+    def test_get_name(self):
+        atom = pwm.atom.get("_PWM_TEST_GET_NAME")
+        self.assertEqual(pwm.atom.get_name(atom), "_PWM_TEST_GET_NAME")
+
+    def test_get_name_cached(self):
+        atom = pwm.atom.get("_PWM_TEST_GET_NAME_CACHED")
+
+        with patch.object(pwm.atom, "xcb") as xcb:
+            name = pwm.atom.get_name(atom)
+
+        self.assertEqual(name, "_PWM_TEST_GET_NAME_CACHED")
+        self.assertFalse(xcb.core.get_atom_name.called)
+
+    def test_get_name_uncached(self):
+        atom = pwm.atom.get("_PWM_TEST_GET_NAME_UNCACHED")
+        del pwm.atom._name_cache[atom]
+        misses = pwm.atom.stats["misses"]
+
+        self.assertEqual(pwm.atom.get_name(atom),
+                         "_PWM_TEST_GET_NAME_UNCACHED")
+        self.assertEqual(pwm.atom.stats["misses"], misses+1)
+        self.assertIn(atom, pwm.atom._name_cache)
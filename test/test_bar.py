@@ -2,9 +2,12 @@
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
 import unittest
+from unittest.mock import patch
 
 import pwm.workspaces
 import pwm.bar
+import pwm.widgets
+import pwm.scheduler
 import test.util as util
 
 
@@ -13,9 +16,134 @@ class TestBar(unittest.TestCase):
         util.setup()
 
     def tearDown(self):
+        pwm.widgets.output = []
         util.tear_down()
 
+    def _update(self):
+        """Update the bar and return the redrawn segments and copied areas."""
+        bar = pwm.bar.primary
+        with patch.object(bar, "draw_segment",
+                          wraps=bar.draw_segment) as draw, \
+                patch.object(bar, "copy_pixmap") as copy:
+            bar.render()
+
+        drawn = [bar.segments.index(c[0][0]) for c in draw.call_args_list]
+        return drawn, copy.call_args_list
+
+    def test_update_clean(self):
+        drawn, copied = self._update()
+        self.assertEqual(drawn, [])
+        self.assertEqual(copied, [])
+
+    def test_update_widgets(self):
+        pwm.widgets.output = [(None, "12:00")]
+        self._update()
+
+        # The widgets did not grow, e.g. a clock tick.
+        pwm.widgets.output = [(None, "12:01")]
+        drawn, copied = self._update()
+
+        widgets = pwm.bar.primary.segments[2]
+        self.assertEqual(drawn, [2])
+        self.assertEqual(len(copied), 1)
+        self.assertEqual(copied[0][0], (widgets.x, widgets.width))
+
+    def test_update_title(self):
+        pwm.bar.primary.title = "title"
+        drawn, copied = self._update()
+
+        self.assertEqual(drawn, [1])
+        self.assertEqual(len(copied), 1)
+
+    def test_update_systray(self):
+        pwm.bar.primary.last_render = None
+        with patch.object(pwm.bar.primary, "copy_pixmap"):
+            pwm.bar.primary.update_systray(20)
+
+        systray = pwm.bar.primary.segments[3]
+        self.assertEqual(systray.x, pwm.bar.primary.width - 20)
+        self.assertEqual(systray.width, 20)
+
+    def test_invalidate(self):
+        pwm.bar.primary.invalidate()
+        drawn, _ = self._update()
+        self.assertEqual(drawn, [0, 1, 2, 3])
+
+    def test_segments_cover_bar(self):
+        pwm.widgets.output = [(None, "widget")]
+        pwm.bar.primary.systray_width = 20
+        pwm.bar.primary.render()
+
+        right = 0
+        for segment in pwm.bar.primary.segments:
+            self.assertEqual(segment.x, right)
+            right += segment.width
+        self.assertEqual(right, pwm.bar.primary.width)
+
+    def test_render_fractional_widgets(self):
+        # Text widths are fractional, the copied areas must be whole pixels.
+        pwm.widgets.output = [(None, "widget")]
+        bar = pwm.bar.primary
+        with patch.object(bar, "text_width", return_value=30.4):
+            bar.render()
+
+        for segment in bar.segments:
+            self.assertIsInstance(segment.x, int)
+            self.assertIsInstance(segment.width, int)
+
     #def test_show(self):
     #    # show() should already have been called in setUp
     #    attr = pwm.xcb.core.GetWindowAttributes(self.bar.wid).reply()
     #    self.assertEqual(attr.map_state, xproto.MapState.Viewable)
+
+
+class TestBarThrottle(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+        self.bar = pwm.bar.primary
+        self.bar.frame_interval = 10.0
+
+    def tearDown(self):
+        util.tear_down()
+
+    def test_idle(self):
+        self.bar.last_render = None
+
+        with patch.object(self.bar, "render") as render:
+            self.bar.update()
+
+        render.assert_called_once_with()
+        self.assertFalse(self.bar.render_pending)
+
+    def test_throttled(self):
+        self.bar.render()
+
+        with patch.object(self.bar, "render") as render, \
+                patch.object(pwm.scheduler, "call_later") as later:
+            self.bar.update()
+            self.bar.update()
+            self.bar.update()
+
+        self.assertFalse(render.called)
+        self.assertEqual(later.call_count, 1)
+        self.assertTrue(self.bar.render_pending)
+
+        delay, func = later.call_args[0]
+        self.assertGreater(delay, 9.0)
+
+        with patch.object(self.bar, "render") as render:
+            func()
+        render.assert_called_once_with()
+        self.assertFalse(self.bar.render_pending)
+
+    def test_pending_after_destroy(self):
+        self.bar.render_pending = True
+        self.bar.destroy()
+
+        with patch.object(self.bar, "render") as render:
+            self.bar.render_pending_frame()
+
+        self.assertFalse(render.called)
+
+        # tearDown destroys the primary bar again.
+        pwm.bar.primary = pwm.bar.Bar()
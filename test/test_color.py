@@ -2,8 +2,10 @@
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
 import unittest
+from unittest.mock import patch
 
-from pwm.ffi.xcb import xcb
+from pwm.config import config
+from pwm.ffi.xcb import xcb, XcbError
 import pwm.color
 import test.util as util
 
@@ -32,3 +34,76 @@ class TestColor(unittest.TestCase):
 
         self.assertAlmostEqual(
             pwm.color.get_rgb("#1793D1"), (23/255, 147/255, 209/255))
+
+    def test_get_pixel_cached(self):
+        pixel = pwm.color.get_pixel("#123456")
+
+        with patch.object(pwm.color, "xcb") as xcb:
+            self.assertEqual(pwm.color.get_pixel("#123456"), pixel)
+
+        self.assertFalse(xcb.core.alloc_color.called)
+
+    def test_get_rgb_cached(self):
+        rgb = pwm.color.get_rgb("#abcdef")
+        self.assertIs(pwm.color.get_rgb("#abcdef"), rgb)
+
+    def test_prefetch(self):
+        colors = ["#010203", "#040506", "#010203"]
+
+        with patch.object(pwm.color, "xcb") as xcb:
+            order = []
+            cookie = xcb.core.alloc_color.return_value
+            xcb.core.alloc_color.side_effect = \
+                lambda *args: order.append("request") or cookie
+            cookie.reply.side_effect = lambda: order.append("reply") or \
+                cookie.reply.return_value
+            pwm.color.prefetch(colors)
+
+        self.assertEqual(order, ["request", "request", "reply", "reply"])
+        for color in colors:
+            self.assertIn(color, pwm.color._pixel_cache)
+            self.assertIn(color, pwm.color._rgb_cache)
+
+    def test_prefetch_invalid(self):
+        with patch("logging.error") as log:
+            pwm.color.prefetch(["#12345"])
+
+        log.assert_called_once_with("Invalid color: #12345")
+        self.assertNotIn("#12345", pwm.color._pixel_cache)
+
+        with self.assertRaises(ValueError):
+            pwm.color.get_pixel("#12345")
+
+    def test_prefetch_unknown_name(self):
+        with patch.object(pwm.color, "xcb") as xcb, \
+                patch("logging.error") as log:
+            xcb.core.alloc_named_color.return_value.reply.side_effect = \
+                XcbError(None)
+            pwm.color.prefetch(["unknown", "#010203"])
+
+        log.assert_called_once_with("Invalid color: unknown")
+        self.assertNotIn("unknown", pwm.color._pixel_cache)
+        self.assertIn("#010203", pwm.color._pixel_cache)
+
+    def test_prefetch_config_colors_only(self):
+        with patch.object(config.bar, "title", "not a color", create=True), \
+                patch.object(pwm.color, "prefetch") as prefetch:
+            pwm.color.prefetch_config()
+
+        colors = prefetch.call_args[0][0]
+        self.assertIn(config.window.focused, colors)
+        self.assertIn(config.bar.separator, colors)
+        self.assertNotIn("not a color", colors)
+
+    def test_prefetch_config(self):
+        misses = pwm.color.stats["misses"]
+        pwm.color.prefetch_config()
+
+        with patch.object(pwm.color, "xcb") as xcb:
+            pwm.color.get_pixel(config.window.focused)
+            pwm.color.get_pixel(config.window.unfocused)
+            pwm.color.get_pixel(config.window.urgent)
+            pwm.color.get_pixel(config.bar.background)
+
+        self.assertFalse(xcb.core.alloc_color.called)
+        self.assertEqual(pwm.color.stats["misses"], misses)
@@ -114,3 +114,15 @@ class TestCommands(unittest.TestCase):
     def test_menu(self, menu):
         pwm.commands.menu()()
         menu.assert_called_once_with()
+
+    def test_toggle_profiling(self):
+        with patch.object(pwm.events, "dump_profile") as dump:
+            pwm.commands.toggle_profiling()()
+            self.assertTrue(pwm.events.profiling)
+            self.assertFalse(dump.called)
+
+            with patch("logging.info"):
+                pwm.commands.toggle_profiling()()
+            self.assertFalse(pwm.events.profiling)
+
+        dump.assert_called_once_with(pwm.events.PROFILE_PATH)
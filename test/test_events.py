@@ -1,13 +1,23 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+from pwm.ffi.xcb import xcb
 import pwm.atom
+import pwm.keybind
+import pwm.keymap
+import pwm.scheduler
 import pwm.systray
 import pwm.events
+import pwm.windows
+import pwm.worker
 import test.util as util
 
 
@@ -25,6 +35,97 @@ class TestEvent(unittest.TestCase):
 
         self.assertEqual(cnt, 1)
 
+    def test_fire_order(self):
+        calls = []
+        ev = pwm.events.Event()
+        ev.add(lambda: calls.append(1))
+        ev.add(lambda: calls.append(2))
+        ev()
+
+        self.assertEqual(calls, [1, 2])
+
+    def test_add_twice(self):
+        def _handler():
+            pass
+
+        ev = pwm.events.Event()
+        ev.add(_handler)
+        ev.add(_handler)
+        self.assertEqual(len(ev), 1)
+
+    def test_remove_while_firing(self):
+        calls = []
+        ev = pwm.events.Event()
+
+        def _first():
+            calls.append(1)
+            ev.remove(_second)
+
+        def _second():
+            calls.append(2)
+
+        ev.add(_first)
+        ev.add(_second)
+
+        # The handlers of this firing are not affected.
+        ev()
+        self.assertEqual(calls, [1, 2])
+        self.assertNotIn(_second, ev)
+
+    def test_remove_missing(self):
+        with self.assertRaises(KeyError):
+            pwm.events.Event().remove(lambda: None)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        pwm.events.profiling = True
+        pwm.events.profile.clear()
+
+    def tearDown(self):
+        pwm.events.profiling = False
+        pwm.events.profile.clear()
+
+    def test_fire(self):
+        def _handler(arg):
+            pass
+
+        ev = pwm.events.Event("test_event")
+        ev.add(_handler)
+        ev(1)
+        ev(2)
+
+        handler = "test.test_events.TestProfiling.test_fire.<locals>._handler"
+        self.assertEqual(pwm.events.profile[("test_event", None)].count, 2)
+        self.assertEqual(pwm.events.profile[("test_event", handler)].count, 2)
+
+        report = pwm.events.profile_report()
+        self.assertTrue(report[0].startswith("test_event: 2 calls"))
+        self.assertTrue(report[1].startswith("    " + handler))
+
+    def test_handler_error(self):
+        ev = pwm.events.Event("test_event")
+        ev.add(MagicMock(side_effect=ValueError, __qualname__="failing",
+                         __module__=None))
+
+        with self.assertRaises(ValueError):
+            ev()
+
+        self.assertEqual(pwm.events.profile[("test_event", "failing")].count,
+                         1)
+
+    def test_dump_profile(self):
+        ev = pwm.events.Event("test_event")
+        ev.add(lambda: None)
+        ev()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile")
+            pwm.events.dump_profile(path)
+
+            with open(path) as f:
+                self.assertIn("test_event: 1 calls", f.read())
+
 
 class TestHandlerList(unittest.TestCase):
     def test_add(self):
@@ -92,6 +193,19 @@ class TestEvents(unittest.TestCase):
 
         arr.assert_called_once_with(wid)
 
+    def test_handle_mapping_notify(self):
+        with patch.object(pwm.keybind, "update_keyboard_mapping") as update, \
+                patch.object(pwm.keymap, "setup") as setup:
+            event = MagicMock(request=xcb.MAPPING_MODIFIER)
+            pwm.events.handle_mapping_notify(event)
+            self.assertFalse(setup.called)
+
+            event = MagicMock(request=xcb.MAPPING_KEYBOARD)
+            pwm.events.handle_mapping_notify(event)
+
+        update.assert_called_with(event)
+        setup.assert_called_once_with()
+
     def test_handle_property_notify_xembed(self):
         event = MagicMock()
         event.atom = pwm.atom.get("_XEMBED_INFO")
@@ -161,3 +275,270 @@ class TestEvents(unittest.TestCase):
     def test_handle_wm_state_toggle_urgent(self):
         wid = util.create_window()
         self._test_wm_state_urgent(wid, pwm.atom._NET_WM_STATE_TOGGLE)
+
+
+class TestCoalesce(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+        # The owners of the event structs, which have to be kept alive.
+        self.owners = []
+
+    def tearDown(self):
+        util.tear_down()
+
+    def _event(self, ctype, etype, **fields):
+        event = xcb.ffi.new("{}*".format(ctype))
+        event.response_type = etype
+        for name, value in fields.items():
+            setattr(event, name, value)
+
+        self.owners.append(event)
+        return xcb.ffi.cast("xcb_generic_event_t*", event)
+
+    def _name(self, wid, atom=None):
+        return self._event("xcb_property_notify_event_t", xcb.PROPERTY_NOTIFY,
+                           window=wid, atom=atom or xcb.ATOM_WM_NAME)
+
+    def _configure(self, wid, mask, **fields):
+        return self._event("xcb_configure_request_event_t",
+                           xcb.CONFIGURE_REQUEST, window=wid,
+                           value_mask=mask, **fields)
+
+    def _expose(self, wid):
+        return self._event("xcb_expose_event_t", xcb.EXPOSE, window=wid)
+
+    def _coalesce(self, events):
+        with patch.object(xcb, "free") as free:
+            survivors = pwm.events.coalesce(events)
+        return survivors, free
+
+    def test_name(self):
+        first = self._name(1)
+        latest = self._name(1, pwm.atom.get("_NET_WM_NAME"))
+        other = self._name(2)
+
+        survivors, free = self._coalesce([first, other, latest])
+
+        self.assertEqual(survivors, [other, latest])
+        free.assert_called_once_with(first)
+
+    def test_other_property(self):
+        events = [self._name(1, pwm.atom.get("_XEMBED_INFO")),
+                  self._name(1, pwm.atom.get("_XEMBED_INFO"))]
+
+        survivors, free = self._coalesce(events)
+
+        self.assertEqual(survivors, events)
+        self.assertFalse(free.called)
+
+    def test_configure_request(self):
+        first = self._configure(1, xcb.CONFIG_WINDOW_X | xcb.CONFIG_WINDOW_Y,
+                                x=10, y=20)
+        latest = self._configure(1, xcb.CONFIG_WINDOW_X |
+                                 xcb.CONFIG_WINDOW_WIDTH, x=30, width=50)
+
+        survivors, _ = self._coalesce([first, latest])
+
+        self.assertEqual(survivors, [latest])
+        event = xcb.ffi.cast("xcb_configure_request_event_t*", latest)
+        self.assertEqual(event.value_mask,
+                         xcb.CONFIG_WINDOW_X | xcb.CONFIG_WINDOW_Y |
+                         xcb.CONFIG_WINDOW_WIDTH)
+        self.assertEqual((event.x, event.y, event.width), (30, 20, 50))
+
+    def test_expose(self):
+        events = [self._expose(1), self._expose(2), self._expose(1)]
+
+        survivors, _ = self._coalesce(events)
+
+        self.assertEqual(survivors, events[1:])
+
+    def test_unmap_barrier(self):
+        unmap = self._event("xcb_unmap_notify_event_t", xcb.UNMAP_NOTIFY,
+                            window=1)
+        events = [self._configure(1, xcb.CONFIG_WINDOW_X, x=10), unmap,
+                  self._configure(1, xcb.CONFIG_WINDOW_X, x=20)]
+
+        survivors, _ = self._coalesce(events)
+
+        self.assertEqual(survivors, events)
+
+
+class TestSelectLoop(unittest.TestCase):
+    def setUp(self):
+        # A connection which never becomes readable.
+        self.read, self.write = os.pipe()
+        self.patchers = [patch.object(pwm.events, "xcb"),
+                         patch.object(pwm.scheduler, "timeout",
+                                      return_value=None)]
+        xcb = self.patchers[0].start()
+        self.patchers[1].start()
+        xcb.core.get_file_descriptor.return_value = self.read
+        xcb.core.poll_for_event.return_value = None
+        pwm.events.shutdown = False
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+        pwm.events.shutdown = False
+        os.close(self.read)
+        os.close(self.write)
+
+    def test_wakeup(self):
+        thread = threading.Thread(target=pwm.events.select_loop, daemon=True)
+        thread.start()
+        time.sleep(0.05)
+
+        # A task from another thread wakes up the selector.
+        pwm.worker.tasks.put(lambda: setattr(pwm.events, "shutdown", True))
+        thread.join(2)
+
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(pwm.worker.tasks.empty())
+        self.assertIsNone(pwm.worker.tasks.wakeup)
+
+
+@util.benchmark
+class TestLoopBenchmark(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+        self.wid = pwm.windows.create(0, 0, 1, 1)
+
+    def tearDown(self):
+        xcb.core.destroy_window(self.wid)
+        util.tear_down()
+
+    def _send(self):
+        event = pwm.windows.create_client_message(
+            self.wid, pwm.atom.get("_PWM_BENCHMARK"))
+        xcb.core.send_event(False, self.wid, xcb.EVENT_MASK_NO_EVENT, event)
+
+    def _ping_pong(self, loop, count=1000):
+        """Return the average time an event takes to be sent and handled.
+
+        Every handled client message sends the next one.
+        """
+        handled = 0
+        handle = pwm.events._handle
+
+        def _pong(event):
+            nonlocal handled
+            if event.response_type & ~0x80 == xcb.CLIENT_MESSAGE:
+                handled += 1
+                if handled == count:
+                    pwm.events.shutdown = True
+                # One more to wake up a loop waiting for events.
+                if handled <= count:
+                    self._send()
+            handle(event)
+
+        with patch.object(pwm.events, "_handle", _pong):
+            self._send()
+            xcb.core.flush()
+
+            start = time.perf_counter()
+            try:
+                loop()
+            finally:
+                pwm.events.shutdown = False
+
+        return (time.perf_counter() - start) / count
+
+    def test_threaded(self):
+        pwm.worker.start()
+        try:
+            latency = self._ping_pong(pwm.events.loop)
+        finally:
+            pwm.worker.destroy()
+        util.report("threaded loop event latency", latency)
+
+    def test_select(self):
+        util.report("select loop event latency",
+                    self._ping_pong(pwm.events.select_loop))
+
+
+class TestDispatch(unittest.TestCase):
+    ETYPE = 99
+
+    def tearDown(self):
+        pwm.events.handlers.pop(self.ETYPE, None)
+        pwm.events.names.pop(self.ETYPE, None)
+        pwm.events.timings.pop(self.ETYPE, None)
+
+    def _handle(self, etype):
+        event = MagicMock(response_type=etype)
+        with patch.object(pwm.events, "xcb") as xcb:
+            pwm.events._handle(event)
+
+        xcb.free.assert_called_once_with(event)
+        return xcb.ffi.cast
+
+    def test_register(self):
+        calls = []
+        pwm.events.register(self.ETYPE, lambda e: calls.append(1),
+                            "xcb_foo_bar_event_t*")
+        pwm.events.register(self.ETYPE, lambda e: calls.append(2))
+
+        cast = self._handle(self.ETYPE | 0x80)
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(cast.call_args_list[0][0][0], "xcb_foo_bar_event_t*")
+        self.assertEqual(pwm.events.names[self.ETYPE], "FOO_BAR")
+        self.assertNotIn(self.ETYPE, pwm.events.timings)
+
+    def test_timings_profiling(self):
+        calls = []
+        pwm.events.register(self.ETYPE, lambda e: calls.append(1))
+
+        with patch.object(pwm.events, "profiling", True):
+            self._handle(self.ETYPE)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(pwm.events.timings[self.ETYPE].count, 1)
+
+    def test_unregister(self):
+        handler = MagicMock()
+        pwm.events.register(self.ETYPE, handler)
+        pwm.events.unregister(self.ETYPE, handler)
+
+        self._handle(self.ETYPE)
+
+        self.assertFalse(handler.called)
+
+    def test_free_on_error(self):
+        pwm.events.register(self.ETYPE, MagicMock(side_effect=ValueError))
+
+        with self.assertRaises(ValueError):
+            self._handle(self.ETYPE)
+
+    def test_timings_report(self):
+        pwm.events.register(self.ETYPE, MagicMock(), "xcb_foo_event_t*")
+        with patch.object(pwm.events, "profiling", True):
+            self._handle(self.ETYPE)
+
+        self.assertTrue(any(line.startswith("FOO: 1 calls")
+                            for line in pwm.events.timings_report()))
+
+
+class TestAtomTable(unittest.TestCase):
+    def test_resolve_once(self):
+        table = pwm.events.AtomTable()
+        handler = MagicMock()
+        table.register("_PWM_TEST_ATOM_TABLE", handler)
+        table.register(39, handler)
+
+        with patch.object(pwm.atom, "get", return_value=500) as get:
+            self.assertEqual(table.get(500), [handler])
+            self.assertEqual(table.get(39), [handler])
+            self.assertEqual(table.get(1), ())
+
+        get.assert_called_once_with("_PWM_TEST_ATOM_TABLE")
+
+    def test_unregister(self):
+        table = pwm.events.AtomTable()
+        handler = MagicMock()
+        table.register(39, handler)
+        table.get(39)
+        table.unregister(39, handler)
+
+        self.assertEqual(table.get(39), ())
@@ -0,0 +1,41 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import unittest
+
+from pwm.histogram import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    def test_add(self):
+        histogram = Histogram()
+        histogram.add(0.000003)
+        histogram.add(0.000003)
+        histogram.add(0.001)
+
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.total, 0.001006)
+        # 3 us are in the bucket below 4 us, 1000 us below 1024 us.
+        self.assertEqual(histogram.buckets[2], 2)
+        self.assertEqual(histogram.buckets[10], 1)
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.add(0.000003)
+        for _ in range(10):
+            histogram.add(0.001)
+
+        self.assertEqual(histogram.percentile(50), 0.000004)
+        self.assertEqual(histogram.percentile(90), 0.000004)
+        self.assertEqual(histogram.percentile(99), 0.001024)
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.mean(), 0.0)
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+    def test_long(self):
+        histogram = Histogram()
+        histogram.add(10**6)
+        self.assertEqual(histogram.buckets[-1], 1)
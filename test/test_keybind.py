@@ -0,0 +1,216 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+from collections import defaultdict
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from pwm.config import config
+from pwm.ffi.xcb import xcb
+from pwm.ffi.xcb import XcbError
+import pwm.keybind
+import test.util as util
+
+MIN_KEYCODE = 8
+MAX_KEYCODE = 255
+PER = 4
+
+
+def _keysyms(offset=0):
+    """Return a keyboard mapping, every keycode has keysyms based on itself.
+
+    The keysym in the second column of every keycode is the same.
+    """
+    keysyms = []
+    for kc in range(MIN_KEYCODE, MAX_KEYCODE + 1):
+        keysyms.extend([0x1000 + kc + offset, 0xff, 0x2000 + kc, 0])
+    return keysyms
+
+
+class KeymapTestCase(unittest.TestCase):
+    """Base class for tests using the keyboard mapping from _keysyms()."""
+
+    def setUp(self):
+        self.patcher = patch.object(pwm.keybind, "get_min_max_keycode",
+                                    return_value=(MIN_KEYCODE, MAX_KEYCODE))
+        self.patcher.start()
+
+        pwm.keybind._keysyms = []
+        pwm.keybind._per = PER
+        pwm.keybind._keycodes = defaultdict(set)
+        pwm.keybind._set_keysyms(MIN_KEYCODE, _keysyms())
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def _mapping_notify(self, first, keysyms):
+        """Call update_keyboard_mapping with a MAPPING_NOTIFY event.
+
+        keysyms are the new keysyms of the keycodes starting at first.
+        """
+        with patch.object(pwm.keybind, "xcb") as xcb:
+            reply = xcb.core.get_keyboard_mapping.return_value.reply()
+            reply.keysyms_per_keycode = PER
+            xcb.get_keyboard_mapping_keysyms.return_value = keysyms
+
+            event = MagicMock(request=xcb.MAPPING_KEYBOARD,
+                              first_keycode=first,
+                              count=len(keysyms) // PER)
+            pwm.keybind.update_keyboard_mapping(event)
+
+        xcb.core.get_keyboard_mapping.assert_called_once_with(
+            first, len(keysyms) // PER)
+
+
+class TestKeybind(KeymapTestCase):
+    def test_get_keysym(self):
+        self.assertEqual(pwm.keybind.get_keysym(10), 0x1000 + 10)
+        self.assertEqual(pwm.keybind.get_keysym(10, col=2), 0x2000 + 10)
+
+    def test_get_keycode(self):
+        self.assertEqual(pwm.keybind.get_keycode(0x1000 + 10), 10)
+        self.assertEqual(pwm.keybind.get_keycode(0x2000 + 20), 20)
+        self.assertIsNone(pwm.keybind.get_keycode(0x9999))
+
+    def test_get_keycode_lowest(self):
+        self.assertEqual(pwm.keybind.get_keycode(0xff), MIN_KEYCODE)
+
+    def test_remap(self):
+        # Swap the first keysyms of keycode 10 and 11.
+        self._mapping_notify(10, [0x1000 + 11, 0xff, 0x2000 + 10, 0,
+                                  0x1000 + 10, 0xff, 0x2000 + 11, 0])
+
+        self.assertEqual(pwm.keybind.get_keysym(10), 0x1000 + 11)
+        self.assertEqual(pwm.keybind.get_keycode(0x1000 + 11), 10)
+        self.assertEqual(pwm.keybind.get_keycode(0x1000 + 10), 11)
+        # Keycodes outside of the event are left alone.
+        self.assertEqual(pwm.keybind.get_keycode(0x1000 + 12), 12)
+        self.assertEqual(len(pwm.keybind._keysyms),
+                         (MAX_KEYCODE - MIN_KEYCODE + 1) * PER)
+
+    def test_remap_removes_keysym(self):
+        self._mapping_notify(MIN_KEYCODE, [0x1000 + MIN_KEYCODE, 0, 0, 0])
+
+        self.assertIsNone(pwm.keybind.get_keycode(0x2000 + MIN_KEYCODE))
+        self.assertEqual(pwm.keybind.get_keycode(0xff), MIN_KEYCODE + 1)
+
+    def test_remap_keysyms_per_keycode(self):
+        # A new layout with two keysyms per keycode, keycodes 10 and 20 are
+        # swapped.
+        keysyms = []
+        for kc in range(MIN_KEYCODE, MAX_KEYCODE + 1):
+            keysyms.extend([0x1000 + {10: 20, 20: 10}.get(kc, kc), 0])
+
+        with patch.object(pwm.keybind, "xcb") as xcb:
+            reply = xcb.core.get_keyboard_mapping.return_value.reply()
+            reply.keysyms_per_keycode = 2
+            xcb.get_keyboard_mapping_keysyms.return_value = keysyms
+
+            pwm.keybind.update_keyboard_mapping(
+                MagicMock(request=xcb.MAPPING_KEYBOARD, first_keycode=10,
+                          count=1))
+
+        self.assertEqual(pwm.keybind._per, 2)
+        self.assertEqual(pwm.keybind.get_keycode(0x1000 + 10), 20)
+
+
+class TestGrabKeys(unittest.TestCase):
+    def setUp(self):
+        self.patcher = patch.object(pwm.keybind, "xcb")
+        self.xcb = self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_grab_keys_pipelined(self):
+        calls = []
+        cookie = MagicMock()
+        cookie.check.side_effect = lambda: calls.append("check")
+        self.xcb.core.grab_key_checked.side_effect = (
+            lambda *args: calls.append("grab") or cookie)
+
+        failed = pwm.keybind.grab_keys(1, [(0, 10), (0, 11), (4, 12)])
+
+        self.assertEqual(failed, [])
+        n = 3 * len(pwm.keybind.TRIVIAL_MODS)
+        self.assertEqual(calls, ["grab"] * n + ["check"] * n)
+
+    def test_grab_keys_failed(self):
+        def _grab(owner, wid, mods, key, *args):
+            cookie = MagicMock()
+            if key == 11:
+                cookie.check.side_effect = XcbError(None)
+            return cookie
+        self.xcb.core.grab_key_checked.side_effect = _grab
+
+        failed = pwm.keybind.grab_keys(1, [(0, 10), (0, 11), (4, 12)])
+
+        self.assertEqual(failed, [(0, 11)])
+
+    def test_grab_key(self):
+        self.xcb.core.grab_key_checked.return_value.check.side_effect = (
+            XcbError(None))
+        self.assertFalse(pwm.keybind.grab_key(1, 0, 10))
+
+
+def _reference_remap(keysyms, new):
+    """The keycodes changed by new keysyms, searched without an index."""
+    def _get_keycode(keysym):
+        for i in range(MIN_KEYCODE, MAX_KEYCODE + 1):
+            for j in range(PER):
+                if keysyms[(i - MIN_KEYCODE) * PER + j] == keysym:
+                    return i
+        return None
+
+    changes = {}
+    for kc in range(MIN_KEYCODE, MAX_KEYCODE):
+        oldkc = _get_keycode(new[(kc - MIN_KEYCODE) * PER])
+        if oldkc != kc:
+            changes[oldkc] = kc
+    return changes
+
+
+@util.benchmark
+class TestKeybindBenchmark(KeymapTestCase):
+    def test_remap_latency(self):
+        new = _keysyms(offset=1)
+
+        util.report("remap without index",
+                    util.measure(lambda: _reference_remap(_keysyms(), new)))
+
+        def _remap():
+            pwm.keybind._set_keysyms(MIN_KEYCODE, _keysyms())
+            self._mapping_notify(MIN_KEYCODE, new)
+
+        util.report("remap with index", util.measure(_remap, 10))
+
+
+@util.benchmark
+class TestGrabBenchmark(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+        pwm.keybind.update_keyboard_mapping()
+        self.keys = [pwm.keybind.parse_keystring(key[0])
+                     for key in config.keys]
+        self.keys = [key for key in self.keys if key[1]]
+
+    def tearDown(self):
+        pwm.keybind.ungrab_keys(xcb.screen.root, self.keys)
+        util.tear_down()
+
+    def test_grab_latency(self):
+        root = xcb.screen.root
+
+        def _sequential():
+            for mods, keycode in self.keys:
+                for mod in pwm.keybind.TRIVIAL_MODS:
+                    xcb.core.grab_key_checked(
+                        True, root, mods | mod, keycode,
+                        xcb.GRAB_MODE_ASYNC, xcb.GRAB_MODE_ASYNC).check()
+
+        util.report("grab {} keys one by one".format(len(self.keys)),
+                    util.measure(_sequential, 10))
+        util.report("grab {} keys pipelined".format(len(self.keys)),
+                    util.measure(
+                        lambda: pwm.keybind.grab_keys(root, self.keys), 10))
@@ -0,0 +1,246 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from pwm.config import config
+import pwm.keybind
+import pwm.keymap
+import pwm.scheduler
+
+MOD4 = 64
+
+
+def _parse_keystring(keystr):
+    """Parse "Mod4-a" like keystrings, a key has the keycode of its letter."""
+    mods = 0
+    if keystr.startswith("Mod4-"):
+        mods, keystr = MOD4, keystr[len("Mod4-"):]
+    if len(keystr) != 1:
+        return mods, None
+    return mods, ord(keystr)
+
+
+_stroke = _parse_keystring
+
+
+class TestKeymap(unittest.TestCase):
+    def setUp(self):
+        config.load(default=True)
+
+        self.patchers = [
+            patch.object(pwm.keymap, "xcb"),
+            patch.object(pwm.keybind, "parse_keystring", _parse_keystring),
+            patch.object(pwm.keybind, "strip_trivial", lambda mods: mods),
+            patch.object(pwm.keybind, "get_mod_for_key", return_value=0),
+            patch.object(pwm.keybind, "grab_keys", return_value=[]),
+            patch.object(pwm.keybind, "ungrab_keys", return_value=[]),
+            patch.object(pwm.scheduler, "call_later"),
+            patch.object(config, "data"),
+        ]
+        mocks = [p.start() for p in self.patchers]
+        self.xcb = mocks[0]
+        self.grab_keys = mocks[4]
+        self.ungrab_keys = mocks[5]
+        self.call_later = mocks[6]
+        self.data = mocks[7]
+
+        self.data.key_timeout = 1.0
+        self.data.modes = {}
+
+        pwm.keymap._pending = None
+
+    def tearDown(self):
+        pwm.keymap._pending = None
+        pwm.keymap.grabbed = []
+        pwm.keymap.mode = "default"
+        for p in self.patchers:
+            p.stop()
+
+    def _setup(self, keys, modes=None):
+        self.data.keys = keys
+        self.data.modes = modes or {}
+        pwm.keymap.setup()
+
+    def _press(self, keystr):
+        mods, keycode = _stroke(keystr)
+        pwm.keymap.handle_key_press(MagicMock(state=mods, detail=keycode))
+
+    def test_build(self):
+        a, b, c = ("Mod4-a", 1), ("Mod4-x a", 2), ("Mod4-x Mod4-b c", 3)
+        trie = pwm.keymap.build([a, b, c])
+
+        self.assertEqual(trie[_stroke("Mod4-a")], a)
+        self.assertEqual(trie[_stroke("Mod4-x")][_stroke("a")], b)
+        self.assertEqual(
+            trie[_stroke("Mod4-x")][_stroke("Mod4-b")][_stroke("c")], c)
+
+    def test_build_errors(self):
+        with self.assertLogs(level="ERROR") as logs:
+            trie = pwm.keymap.build([("Mod4-a", 1), ("Mod4-a b", 2),
+                                     ("Mod4-x a", 3), ("Mod4-x", 4),
+                                     ("Mod4-unknown", 5)])
+
+        self.assertEqual(trie[_stroke("Mod4-a")], ("Mod4-a", 1))
+        self.assertEqual(trie[_stroke("Mod4-x")],
+                         {_stroke("a"): ("Mod4-x a", 3)})
+        self.assertEqual(logs.output, [
+            "ERROR:root:Conflicting keybinding: Mod4-a b",
+            "ERROR:root:Conflicting keybinding: Mod4-x",
+            "ERROR:root:Could not parse keybinding: Mod4-unknown"])
+
+    def test_setup_grabs_first_level(self):
+        # Many chords only need a passive grab for their common prefix.
+        keys = [("Mod4-a", None)]
+        keys.extend(("Mod4-x {} {}".format(chr(i), chr(j)), None)
+                    for i in range(ord("a"), ord("z") + 1)
+                    for j in range(ord("a"), ord("z") + 1))
+        self._setup(keys, {"other": [("b", None)]})
+
+        self.grab_keys.assert_called_once_with(
+            self.xcb.screen.root, [_stroke("Mod4-a"), _stroke("Mod4-x")])
+        self.assertEqual(pwm.keymap.grabbed,
+                         [_stroke("Mod4-a"), _stroke("Mod4-x")])
+
+    def test_setup_grab_failed(self):
+        self.grab_keys.return_value = [_stroke("Mod4-b")]
+        with self.assertLogs(level="ERROR") as logs:
+            self._setup([("Mod4-a", None), ("Mod4-b", None)])
+
+        self.assertEqual(logs.output,
+                         ["ERROR:root:Could not grab keybinding: Mod4-b"])
+        self.assertEqual(pwm.keymap.grabbed, [_stroke("Mod4-a")])
+
+    def test_set_mode(self):
+        self._setup([("Mod4-a", None)], {"other": [("b", None), ("c", None)]})
+        self.grab_keys.reset_mock()
+
+        pwm.keymap.set_mode("other")
+
+        self.ungrab_keys.assert_called_once_with(self.xcb.screen.root,
+                                                 [_stroke("Mod4-a")])
+        self.grab_keys.assert_called_once_with(
+            self.xcb.screen.root, [_stroke("b"), _stroke("c")])
+        self.assertEqual(pwm.keymap.mode, "other")
+
+    def test_setup_remapped(self):
+        self._setup([("Mod4-a", None)], {"other": [("b", None)]})
+        pwm.keymap.set_mode("other")
+        self.grab_keys.reset_mock()
+        self.ungrab_keys.reset_mock()
+
+        # After a new keyboard mapping "b" is found at another keycode.
+        remapped = {"b": (0, 1)}
+        with patch.object(pwm.keybind, "parse_keystring",
+                          lambda keystr: remapped.get(
+                              keystr, _parse_keystring(keystr))):
+            pwm.keymap.setup()
+
+        self.ungrab_keys.assert_called_once_with(self.xcb.screen.root,
+                                                 [_stroke("b")])
+        self.grab_keys.assert_called_once_with(self.xcb.screen.root,
+                                               [(0, 1)])
+        self.assertEqual(pwm.keymap.mode, "other")
+
+    def test_set_mode_unknown(self):
+        self._setup([("Mod4-a", None)])
+        with self.assertLogs(level="ERROR"):
+            pwm.keymap.set_mode("unknown")
+        self.assertEqual(pwm.keymap.mode, "default")
+
+    def test_key(self):
+        cmd = Mock()
+        self._setup([("Mod4-a", cmd)])
+
+        self._press("Mod4-a")
+        cmd.assert_called_once_with()
+        self.assertFalse(self.xcb.core.grab_keyboard.called)
+
+    def test_chord(self):
+        cmd = Mock()
+        self._setup([("Mod4-x Mod4-c", cmd)])
+
+        self._press("Mod4-x")
+        self.assertFalse(cmd.called)
+        self.assertTrue(self.xcb.core.grab_keyboard.called)
+
+        self._press("Mod4-c")
+        cmd.assert_called_once_with()
+        self.assertTrue(self.xcb.core.ungrab_keyboard.called)
+        self.assertIsNone(pwm.keymap._pending)
+
+    def test_chord_ignores_modifiers(self):
+        cmd = Mock()
+        self._setup([("Mod4-x c", cmd)])
+
+        self._press("Mod4-x")
+        with patch.object(pwm.keybind, "get_mod_for_key", return_value=MOD4):
+            self._press("Mod4-x")
+        self._press("c")
+        cmd.assert_called_once_with()
+
+    def test_chord_cancel(self):
+        cmd = Mock()
+        self._setup([("Mod4-x c", cmd), ("Mod4-a", cmd)])
+
+        self._press("Mod4-x")
+        self._press("d")
+        self.assertIsNone(pwm.keymap._pending)
+
+        # The next key starts from the top of the trie again.
+        self._press("c")
+        self.assertFalse(cmd.called)
+        self._press("Mod4-a")
+        cmd.assert_called_once_with()
+
+    def test_chord_timeout(self):
+        cmd = Mock()
+        self._setup([("Mod4-x c", cmd)])
+
+        self._press("Mod4-x")
+        delay, timeout = self.call_later.call_args[0]
+        self.assertEqual(delay, 1.0)
+
+        timeout()
+        self.assertIsNone(pwm.keymap._pending)
+        self.assertTrue(self.xcb.core.ungrab_keyboard.called)
+
+        self._press("c")
+        self.assertFalse(cmd.called)
+
+    def test_chord_timeout_expired(self):
+        cmd = Mock()
+        self._setup([("Mod4-x c", cmd), ("Mod4-y c", cmd)])
+
+        self._press("Mod4-x")
+        timeout = self.call_later.call_args[0][1]
+        self._press("c")
+        self._press("Mod4-y")
+
+        # The timeout of the finished chord must not cancel the new one.
+        timeout()
+        self._press("c")
+        self.assertEqual(cmd.call_count, 2)
+
+    def test_mode_keys(self):
+        cmd = Mock()
+        self._setup([("Mod4-r", lambda: pwm.keymap.set_mode("resize"))],
+                    {"resize": [("h", cmd),
+                                ("Mod4-r", lambda: pwm.keymap.set_mode(
+                                    "default"))]})
+
+        self._press("h")
+        self.assertFalse(cmd.called)
+
+        self._press("Mod4-r")
+        self._press("h")
+        self._press("h")
+        self.assertEqual(cmd.call_count, 2)
+
+        self._press("Mod4-r")
+        self.assertEqual(pwm.keymap.mode, "default")
+        self._press("h")
+        self.assertEqual(cmd.call_count, 2)
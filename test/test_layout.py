@@ -1,6 +1,7 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import pickle
 import unittest
 from unittest.mock import patch
 
@@ -21,16 +22,16 @@ class TestTiling(unittest.TestCase):
         util.tear_down()
 
     def test_init(self):
-        self.assertEqual(len(self.tiling.columns), 1)
-        self.assertEqual(self.tiling.columns[0].size, 1.0)
-        self.assertEqual(len(self.tiling.columns[0].windows), 0)
+        self.assertEqual(self.tiling.widths, [1.0])
+        self.assertEqual(self.tiling.heights, [[]])
+        self.assertEqual(self.tiling.wids, [[]])
 
     def test_add_window(self):
         wid = self.wid[0]
         self.tiling.add_window(wid)
 
-        self.assertEqual(len(self.tiling.columns[0].windows), 1)
-        self.assertEqual(self.tiling.columns[0].windows[0].wid, wid)
+        self.assertEqual(self.tiling.wids, [[wid]])
+        self.assertEqual(self.tiling.heights, [[1.0]])
 
     def test_add_window_set_column(self):
         self.tiling.add_window(self.wid[0])
@@ -52,18 +53,18 @@ class TestTiling(unittest.TestCase):
     def test_remove_window(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.remove_window(self.wid[0])
-        self.assertEqual(len(self.tiling.columns[0].windows), 0)
+        self.assertEqual(self.tiling.wids, [[]])
 
     def test_remove_window_remove_column(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
         self.tiling.remove_window(self.wid[1])
-        self.assertEqual(len(self.tiling.columns), 1)
+        self.assertEqual(len(self.tiling.widths), 1)
 
     def test_remove_window_remove_last_column(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.remove_window(self.wid[0])
-        self.assertEqual(len(self.tiling.columns), 1)
+        self.assertEqual(len(self.tiling.widths), 1)
 
     def test_path(self):
         self.tiling.add_window(self.wid[0])
@@ -119,13 +120,13 @@ class TestTiling(unittest.TestCase):
         self.tiling.move(self.wid[1], "left")
         self.assertEqual(self.tiling.path(self.wid[0]), (0, 0))
         self.assertEqual(self.tiling.path(self.wid[1]), (0, 1))
-        self.assertEqual(len(self.tiling.columns), 1)
+        self.assertEqual(len(self.tiling.widths), 1)
 
     def test_move_left_merge_remove_column(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
         self.tiling.move(self.wid[1], "left")
-        self.assertEqual(len(self.tiling.columns), 1)
+        self.assertEqual(len(self.tiling.widths), 1)
 
     def test_move_left_resize_rows(self):
         self.tiling.add_window(self.wid[0])
@@ -137,17 +138,15 @@ class TestTiling(unittest.TestCase):
         self.tiling.move(self.wid[3], "left")
         path = self.tiling.path(self.wid[3])
 
-        self.assertEqual(self.tiling.columns[path[0]].windows[path[1]].size,
-                         0.25)
-        self.assertEqual(self.tiling.columns[1].windows[0].size, 1.0)
+        self.assertEqual(self.tiling.heights[path[0]][path[1]], 0.25)
+        self.assertEqual(self.tiling.heights[1][0], 1.0)
 
     def test_move_left_resize_columns(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1])
         self.tiling.move(self.wid[0], "left")
 
-        self.assertEqual(self.tiling.columns[0].size, 0.5)
-        self.assertEqual(self.tiling.columns[1].size, 0.5)
+        self.assertEqual(self.tiling.widths, [0.5, 0.5])
 
     def test_move_right(self):
         self.tiling.add_window(self.wid[0])
@@ -173,7 +172,7 @@ class TestTiling(unittest.TestCase):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
         self.tiling.move(self.wid[0], "right")
-        self.assertEqual(len(self.tiling.columns), 1)
+        self.assertEqual(len(self.tiling.widths), 1)
 
     def test_move_right_resize_rows(self):
         self.tiling.add_window(self.wid[0])
@@ -185,17 +184,15 @@ class TestTiling(unittest.TestCase):
         self.tiling.move(self.wid[3], "right")
         path = self.tiling.path(self.wid[3])
 
-        self.assertEqual(self.tiling.columns[path[0]].windows[path[1]].size,
-                         0.5)
-        self.assertEqual(self.tiling.columns[0].windows[0].size, 1.0/3)
+        self.assertEqual(self.tiling.heights[path[0]][path[1]], 0.5)
+        self.assertEqual(self.tiling.heights[0][0], 1.0/3)
 
     def test_move_right_resize_columns(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1])
         self.tiling.move(self.wid[1], "right")
 
-        self.assertEqual(self.tiling.columns[0].size, 0.5)
-        self.assertEqual(self.tiling.columns[1].size, 0.5)
+        self.assertEqual(self.tiling.widths, [0.5, 0.5])
 
     def test_relative_above_topmost(self):
         self.tiling.add_window(self.wid[0])
@@ -262,93 +259,293 @@ class TestTiling(unittest.TestCase):
     def test_make_row_space_one(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.make_row_space(0, 0.3)
-        self.assertEqual(self.tiling.columns[0].windows[0].size, 0.7)
+        self.assertEqual(self.tiling.heights[0][0], 0.7)
 
     def test_make_row_space_two(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1])
 
-        column = self.tiling.columns[0]
-        column.windows[0].size = 0.8
-        column.windows[1].size = 0.2
+        heights = self.tiling.heights[0]
+        heights[:] = [0.8, 0.2]
 
         self.tiling.make_row_space(0, 0.4)
-        self.assertAlmostEqual(column.windows[0].size, 0.8-(0.8*0.4))
-        self.assertAlmostEqual(column.windows[1].size, 0.2-(0.2*0.4))
+        self.assertAlmostEqual(heights[0], 0.8-(0.8*0.4))
+        self.assertAlmostEqual(heights[1], 0.2-(0.2*0.4))
 
     def test_distribute_free_row_space(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1])
 
-        column = self.tiling.columns[0]
-        column.windows[0].size = 0.6
-        column.windows[1].size = 0.2
+        heights = self.tiling.heights[0]
+        heights[:] = [0.6, 0.2]
 
         self.tiling.distribute_free_row_space(0)
-        self.assertAlmostEqual(column.windows[0].size, 0.6+(0.2*0.6/0.8))
-        self.assertAlmostEqual(column.windows[1].size, 0.2+(0.2*0.2/0.8))
+        self.assertAlmostEqual(heights[0], 0.6+(0.2*0.6/0.8))
+        self.assertAlmostEqual(heights[1], 0.2+(0.2*0.2/0.8))
+
+    def test_distribute_free_row_space_zero(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1])
+        self.tiling.add_window(self.wid[2])
+
+        self.tiling.heights[0][:] = [0.0, 1.0, 0.0]
+        self.tiling.remove_window(self.wid[1])
+        self.assertEqual(self.tiling.heights[0], [0.5, 0.5])
 
     def test_make_column_space_one(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.make_column_space(0.3)
-        self.assertEqual(self.tiling.columns[0].size, 0.7)
+        self.assertEqual(self.tiling.widths, [0.7])
 
     def test_make_column_space_two(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
 
-        columns = self.tiling.columns
-        columns[0].size = 0.8
-        columns[1].size = 0.2
+        widths = self.tiling.widths
+        widths[:] = [0.8, 0.2]
 
         self.tiling.make_column_space(0.4)
-        self.assertAlmostEqual(columns[0].size, 0.8-(0.8*0.4))
-        self.assertAlmostEqual(columns[1].size, 0.2-(0.2*0.4))
+        self.assertAlmostEqual(widths[0], 0.8-(0.8*0.4))
+        self.assertAlmostEqual(widths[1], 0.2-(0.2*0.4))
 
     def test_distribute_free_column_space(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
 
-        columns = self.tiling.columns
-        columns[0].size = 0.6
-        columns[1].size = 0.2
+        widths = self.tiling.widths
+        widths[:] = [0.6, 0.2]
 
         self.tiling.distribute_free_column_space()
-        self.assertAlmostEqual(columns[0].size, 0.6+(0.2*0.6/0.8))
-        self.assertAlmostEqual(columns[1].size, 0.2+(0.2*0.2/0.8))
+        self.assertAlmostEqual(widths[0], 0.6+(0.2*0.6/0.8))
+        self.assertAlmostEqual(widths[1], 0.2+(0.2*0.2/0.8))
 
     def test_resize_column(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1], 1)
 
-        self.tiling.columns[0].size = 0.5
-        self.tiling.columns[1].size = 0.5
+        self.tiling.widths[:] = [0.5, 0.5]
 
         self.tiling.resize(self.wid[0], (0.3, 0))
-        self.assertAlmostEqual(self.tiling.columns[0].size, 0.8)
-        self.assertAlmostEqual(self.tiling.columns[1].size, 0.2)
+        self.assertAlmostEqual(self.tiling.widths[0], 0.8)
+        self.assertAlmostEqual(self.tiling.widths[1], 0.2)
 
     def test_resize_column_single(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.resize(self.wid[0], (0.3, 0))
-        self.assertAlmostEqual(self.tiling.columns[0].size, 1.0)
+        self.assertAlmostEqual(self.tiling.widths[0], 1.0)
 
     def test_resize_row(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.add_window(self.wid[1])
 
-        windows = self.tiling.columns[0].windows
-        windows[0].size = 0.5
-        windows[0].size = 0.5
+        heights = self.tiling.heights[0]
+        heights[:] = [0.5, 0.5]
 
         self.tiling.resize(self.wid[0], (0.0, 0.3))
-        self.assertAlmostEqual(windows[0].size, 0.8)
-        self.assertAlmostEqual(windows[1].size, 0.2)
+        self.assertAlmostEqual(heights[0], 0.8)
+        self.assertAlmostEqual(heights[1], 0.2)
 
     def test_resize_row_single(self):
         self.tiling.add_window(self.wid[0])
         self.tiling.resize(self.wid[0], (0, 0.3))
-        self.assertAlmostEqual(self.tiling.columns[0].windows[0].size, 1.0)
+        self.assertAlmostEqual(self.tiling.heights[0][0], 1.0)
+
+    def test_path_not_found(self):
+        self.tiling.add_window(self.wid[0])
+        self.assertRaises(ValueError, self.tiling.path, self.wid[1])
+
+    def test_path_after_remove(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1], 1)
+        self.tiling.add_window(self.wid[2], 2)
+        self.tiling.remove_window(self.wid[1])
+
+        self.assertRaises(ValueError, self.tiling.path, self.wid[1])
+        self.assertEqual(self.tiling.path(self.wid[2]), (1, 0))
+
+    def test_path_pickle(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1], 1)
+
+        # The index is not stored but rebuilt when unpickling.
+        state = self.tiling.__getstate__()
+        self.assertNotIn("_paths", state)
+        self.assertEqual(state["columns"][1].windows[0].wid, self.wid[1])
+
+        tiling = pickle.loads(pickle.dumps(self.tiling))
+        self.assertEqual(tiling.path(self.wid[1]), (1, 0))
+
+    def test_arrange_unchanged(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1])
+
+        with patch.object(pwm.windows, "configure") as conf:
+            self.tiling.arrange()
+
+        self.assertFalse(conf.called)
+
+    def test_arrange_wid_unchanged(self):
+        self.tiling.add_window(self.wid[0])
+
+        # Clients have to be informed about their geometry even if it did not
+        # change.
+        with patch.object(pwm.windows, "configure") as conf:
+            self.tiling.arrange(self.wid[0])
+
+        conf.assert_called_once()
+
+    def test_arrange_move(self):
+        for wid in self.wid:
+            self.tiling.add_window(wid)
+
+        with patch.object(pwm.windows, "configure") as conf:
+            self.tiling.move(self.wid[5], "up")
+
+        self.assertEqual(conf.call_count, 2)
+
+    def test_arrange_resize_other_column(self):
+        for wid in self.wid[:5]:
+            self.tiling.add_window(wid)
+        for wid in self.wid[5:]:
+            self.tiling.add_window(wid, 1)
+
+        with patch.object(pwm.windows, "configure") as conf:
+            self.tiling.resize(self.wid[6], (0, 0.05))
+
+        configured = {call[0][0] for call in conf.call_args_list}
+        self.assertFalse(configured & set(self.wid[:5]))
+
+    def test_arrange_after_remove(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.remove_window(self.wid[0])
+
+        with patch.object(pwm.windows, "configure") as conf:
+            self.tiling.add_window(self.wid[0])
+
+        conf.assert_any_call(self.wid[0], x=0, y=0,
+                             width=self.tiling.workspace.width,
+                             height=self.tiling.workspace.height)
+
+    def test_rectangles(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1])
+        self.tiling.add_window(self.wid[2], 1)
+
+        ws = self.tiling.workspace
+        left = ws.width // 2
+        top = ws.height // 2
+        self.assertEqual(self.tiling.rectangles(), [
+            (self.wid[0], 0, 0, left, top),
+            (self.wid[1], 0, top, left, ws.height - top),
+            (self.wid[2], left, 0, ws.width - left, ws.height)])
+
+    def test_rectangles_exact(self):
+        for wid in self.wid[:7]:
+            self.tiling.add_window(wid)
+        for wid in self.wid[7:]:
+            self.tiling.add_window(wid, 1)
+        self.tiling.resize(self.wid[3], (0.0123, 0.0456))
+
+        rects = self.tiling.rectangles()
+        ws = self.tiling.workspace
+
+        # No pixel may get lost by rounding.
+        for left in {r[1] for r in rects}:
+            self.assertEqual(sum(r[4] for r in rects if r[1] == left),
+                             ws.height)
+        self.assertEqual(sum({r[1]: r[3] for r in rects}.values()), ws.width)
+
+    def test_split(self):
+        self.assertEqual(pwm.layout.split(100, [1/3, 1/3, 1/3]),
+                         ([0, 33, 67], [33, 34, 33]))
+        self.assertEqual(pwm.layout.split(10, [0.5, 0.5]), ([0, 5], [5, 5]))
+        self.assertEqual(pwm.layout.split(10, []), ([], []))
+
+    def test_split_zero(self):
+        self.assertEqual(pwm.layout.split(10, [0, 0]), ([0, 5], [5, 5]))
+
+    def test_rectangles_zero(self):
+        self.tiling.add_window(self.wid[0])
+        self.tiling.add_window(self.wid[1])
+        self.tiling.heights[0][:] = [0, 0]
+        self.tiling.widths[0] = 0
+
+        # Broken sizes are fixed when the state is restored.
+        tiling = pickle.loads(pickle.dumps(self.tiling))
+        self.assertEqual(tiling.widths, [1.0])
+        self.assertEqual(tiling.heights, [[0.5, 0.5]])
+
+        ws = tiling.workspace
+        top = round(ws.height / 2)
+        self.assertEqual(tiling.rectangles(), [
+            (self.wid[0], 0, 0, ws.width, top),
+            (self.wid[1], 0, top, ws.width, ws.height - top)])
+
+    def test_split_sum(self):
+        _, sizes = pwm.layout.split(1079, [1/7]*7)
+        self.assertEqual(sum(sizes), 1079)
+
+
+@util.benchmark
+class TestTilingBenchmark(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+
+        # Only measure the layout itself, not the X server.
+        self.patch = patch.object(pwm.windows, "configure")
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        util.tear_down()
+
+    def _tiling(self, count):
+        tiling = pwm.layout.Tiling(pwm.workspaces.current())
+        for wid in range(count):
+            tiling.add_window(wid, wid % 4, arrange=False)
+        return tiling
+
+    def test_path(self):
+        for count in (10, 100, 1000):
+            tiling = self._tiling(count)
+            last = count - 1
+
+            elapsed = util.measure(lambda: tiling.path(last), 10000)
+            util.report("path with {} windows".format(count), elapsed)
+
+    def test_relative(self):
+        for count in (10, 100, 1000):
+            tiling = self._tiling(count)
+            last = count - 1
+
+            elapsed = util.measure(lambda: tiling.relative(last, "above"),
+                                   10000)
+            util.report("relative with {} windows".format(count), elapsed)
+
+    def test_rectangles(self):
+        for count in (10, 100, 1000):
+            tiling = self._tiling(count)
+
+            elapsed = util.measure(tiling.rectangles, 100)
+            util.report("rectangles with {} windows".format(count), elapsed)
+
+            columns = tiling.__getstate__()["columns"]
+            elapsed = util.measure(
+                lambda: _reference_rectangles(tiling.workspace, columns), 100)
+            util.report("reference with {} windows".format(count), elapsed)
+
+    def test_move(self):
+        for count in (10, 100, 1000):
+            tiling = self._tiling(count)
+            tiling.arrange = lambda wid=None: None
+            last = count - 1
+
+            def _move():
+                tiling.move(last, "up")
+                tiling.move(last, "down")
+
+            elapsed = util.measure(_move, 1000)
+            util.report("move with {} windows".format(count), elapsed)
 
 
 class TestFloating(unittest.TestCase):
@@ -444,3 +641,18 @@ class TestFullscreen(unittest.TestCase):
             self.fullscreen.add_window(wid)
 
         conf.assert_called_once()
+
+
+def _reference_rectangles(workspace, columns):
+    """The layout calculation as it was done before Tiling.rectangles()."""
+    rects = []
+    left = 0
+    for col in columns:
+        top = 0
+        width = round(workspace.width*col.size)
+        for win in col.windows:
+            height = round(workspace.height*win.size)
+            rects.append((win.wid, left, top, width, height))
+            top += height
+        left += width
+    return rects
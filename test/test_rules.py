@@ -7,6 +7,7 @@ from unittest.mock import patch
 import pwm.rules
 import pwm.windows
 from pwm.config import config
+import test.util as util
 
 
 class TestRules(unittest.TestCase):
@@ -20,3 +21,213 @@ class TestRules(unittest.TestCase):
             with patch.object(pwm.windows, "get_property",
                               return_value="Vlc"):
                 self.assertTrue(pwm.rules.floating(0))
+
+    def test_floating_props(self):
+        rule = pwm.rules.Rule("role", "preferences", floating=True)
+        props = pwm.windows.Properties(0, [])
+        props.values = {"WM_CLASS": "Firefox",
+                        "WM_WINDOW_ROLE": "Preferences"}
+
+        with patch.object(config, "rules", [rule]):
+            with patch.object(pwm.windows, "get_property") as get:
+                self.assertTrue(pwm.rules.floating(0, props))
+
+        # The name was not part of the snapshot, the others were.
+        for call in get.call_args_list:
+            self.assertNotIn(call[0][1], ("WM_CLASS", "WM_WINDOW_ROLE"))
+
+    def test_properties_fetched_once(self):
+        rules = [pwm.rules.Rule("class", "vlc{}".format(i)) for i in range(50)]
+
+        with patch.object(config, "rules", rules):
+            with patch.object(pwm.windows, "get_property",
+                              return_value="Vlc") as get:
+                self.assertFalse(pwm.rules.floating(0))
+
+        self.assertLessEqual(get.call_count, 4)
+
+    def test_workspace(self):
+        rules = [pwm.rules.Rule("class", "firefox"),
+                 pwm.rules.Rule("class", "Firefox", workspace=2),
+                 pwm.rules.Rule("class", "firefox", workspace=3)]
+
+        with patch.object(config, "rules", rules):
+            with patch.object(pwm.windows, "get_property",
+                              return_value="Firefox"):
+                self.assertEqual(pwm.rules.workspace(0), 2)
+
+    def test_workspace_none(self):
+        rule = pwm.rules.Rule("class", "vlc", floating=True)
+
+        with patch.object(config, "rules", [rule]):
+            with patch.object(pwm.windows, "get_property",
+                              return_value="Vlc"):
+                self.assertIsNone(pwm.rules.workspace(0))
+
+    def test_matcher_exact(self):
+        rules = [pwm.rules.Rule("class", "Vlc"),
+                 pwm.rules.Rule("role", "preferences"),
+                 pwm.rules.Rule("class", "vlc")]
+
+        matcher = pwm.rules.Matcher(rules)
+        self.assertEqual(matcher.match({"class": "vlc"}),
+                         [rules[0], rules[2]])
+        self.assertEqual(matcher.match({"role": "preferences"}), [rules[1]])
+        self.assertEqual(matcher.match({"class": "mpv"}), [])
+
+    def test_matcher_glob(self):
+        rule = pwm.rules.Rule("class", "Gimp-*", match="glob")
+        matcher = pwm.rules.Matcher([rule])
+
+        self.assertEqual(matcher.match({"class": "gimp-2.8"}), [rule])
+        self.assertEqual(matcher.match({"class": "gimp"}), [])
+
+    def test_matcher_regex(self):
+        rule = pwm.rules.Rule("name", r"\S+ - Mozilla Firefox", match="regex")
+        matcher = pwm.rules.Matcher([rule])
+
+        self.assertEqual(matcher.match({"name": "pwm - mozilla firefox"}),
+                         [rule])
+        self.assertEqual(matcher.match({"name": "a b - mozilla firefox"}),
+                         [])
+
+    def test_matcher_regex_groups(self):
+        rules = [pwm.rules.Rule("class", "(a)(b)", match="regex"),
+                 pwm.rules.Rule("class", "(c|d)+", match="regex")]
+        matcher = pwm.rules.Matcher(rules)
+
+        self.assertEqual(matcher.match({"class": "ab"}), [rules[0]])
+        self.assertEqual(matcher.match({"class": "cdc"}), [rules[1]])
+
+    def test_matcher_order(self):
+        rules = [pwm.rules.Rule("class", "u*", match="glob", floating=True),
+                 pwm.rules.Rule("class", "urxvt"),
+                 pwm.rules.Rule("class", "term*", match="glob"),
+                 pwm.rules.Rule("class", "u.*", match="regex", workspace=2)]
+        matcher = pwm.rules.Matcher(rules)
+
+        # Every matching pattern counts, not only the first.
+        self.assertEqual(matcher.match({"class": "urxvt"}),
+                         [rules[0], rules[1], rules[3]])
+
+    def test_matcher_prefixes(self):
+        rules = [pwm.rules.Rule("class", "*t", match="glob"),
+                 pwm.rules.Rule("class", "URx*", match="glob"),
+                 pwm.rules.Rule("class", "ur.*", match="regex"),
+                 pwm.rules.Rule("class", "(u)rxvt", match="regex"),
+                 pwm.rules.Rule("class", "urz*", match="glob")]
+        matcher = pwm.rules.Matcher(rules)
+
+        self.assertEqual(matcher.match({"class": "urxvt"}), rules[:4])
+        self.assertEqual(matcher.match({"class": "u"}), [])
+
+    def test_matcher_tree(self):
+        # Enough patterns without a prefix for several levels of the tree.
+        rules = [pwm.rules.Rule("class", "*{}*".format(i), match="glob")
+                 for i in range(100)]
+        matcher = pwm.rules.Matcher(rules)
+
+        self.assertEqual(matcher.match({"class": "a12"}),
+                         [rules[1], rules[2], rules[12]])
+        self.assertEqual(matcher.match({"class": "a"}), [])
+
+    def test_literal_prefix(self):
+        def _prefix(value, match="regex"):
+            return pwm.rules._literal_prefix(
+                pwm.rules.Rule("class", value, match=match))
+
+        self.assertEqual(_prefix("Gimp-*", "glob"), "gimp-")
+        self.assertEqual(_prefix("a?c", "glob"), "a")
+        self.assertEqual(_prefix("[ab]c", "glob"), "")
+        self.assertEqual(_prefix("Gimp-.*"), "gimp-")
+        self.assertEqual(_prefix(r"a\.b\S"), "a.b")
+        self.assertEqual(_prefix("abc?"), "ab")
+        self.assertEqual(_prefix("ab{2}"), "a")
+        self.assertEqual(_prefix("ab|cd"), "")
+        self.assertEqual(_prefix("(?x) a b"), "")
+
+    def test_matcher_regex_backreference(self):
+        rules = [pwm.rules.Rule("class", "x", match="regex"),
+                 pwm.rules.Rule("class", r"(a)\1", match="regex")]
+        matcher = pwm.rules.Matcher(rules)
+
+        self.assertEqual(matcher.match({"class": "aa"}), [rules[1]])
+
+    def test_matcher_regex_inline_flags(self):
+        rules = [pwm.rules.Rule("class", "x", match="regex"),
+                 pwm.rules.Rule("class", "(?x) a b", match="regex")]
+        matcher = pwm.rules.Matcher(rules)
+
+        self.assertEqual(matcher.match({"class": "ab"}), [rules[1]])
+
+    def test_invalid_pattern(self):
+        self.assertRaises(ValueError, pwm.rules.Rule, "class", "(a",
+                          match="regex")
+
+    def test_setup(self):
+        rules = [pwm.rules.Rule("class", "vlc")]
+        with patch.object(config, "rules", rules):
+            pwm.rules.setup()
+
+            with patch.object(pwm.rules, "Matcher") as matcher:
+                pwm.rules._get_compiled()
+            self.assertFalse(matcher.called)
+
+    def test_setup_invalid(self):
+        rule = pwm.rules.Rule("class", "vlc")
+        rule.prop = ["class"]
+
+        with patch.object(config, "rules", [rule]):
+            with self.assertLogs(level="ERROR"):
+                pwm.rules.setup()
+
+            # The error is not raised again for every window.
+            with patch.object(pwm.windows, "get_property",
+                              return_value="Vlc"):
+                self.assertFalse(pwm.rules.floating(0))
+
+    def test_invalid_match(self):
+        self.assertRaises(ValueError, pwm.rules.Rule, "class", "vlc",
+                          match="fuzzy")
+
+    def test_floating_glob(self):
+        rule = pwm.rules.Rule("class", "v?c", floating=True, match="glob")
+
+        with patch.object(config, "rules", [rule]):
+            with patch.object(pwm.windows, "get_property",
+                              return_value="VLC"):
+                self.assertTrue(pwm.rules.floating(0))
+
+
+@util.benchmark
+class TestRulesBenchmark(unittest.TestCase):
+    def setUp(self):
+        config.load(default=True)
+
+    def _snapshot(self, cls):
+        props = pwm.windows.Properties(0, [])
+        props.values = {"WM_CLASS": cls}
+        return props
+
+    def test_match(self):
+        windows = [self._snapshot("class{}".format(i)) for i in range(10000)]
+
+        for match in ("exact", "glob", "regex"):
+            for count in (5, 1000):
+                pattern = "class{}" if match == "exact" else "class{}*"
+                if match == "regex":
+                    pattern = "class{}.*"
+
+                rules = [pwm.rules.Rule("class", pattern.format(i),
+                                        floating=True, match=match)
+                         for i in range(count)]
+
+                def _match():
+                    for props in windows:
+                        pwm.rules.floating(0, props)
+
+                with patch.object(config, "rules", rules):
+                    elapsed = util.measure(_match)
+
+                util.report("{} rules ({}), {} windows".format(
+                    count, match, len(windows)), elapsed)
@@ -0,0 +1,86 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pwm.scheduler
+import pwm.worker
+
+
+class TestInlineScheduler(unittest.TestCase):
+    def setUp(self):
+        pwm.scheduler.inline = True
+
+    def tearDown(self):
+        pwm.scheduler.inline = False
+        pwm.scheduler.timers = []
+        pwm.scheduler.calls = []
+
+    def test_start_stop(self):
+        scheduler = pwm.scheduler.Scheduler(MagicMock(), 1.0)
+        scheduler.start()
+        self.assertIn(scheduler, pwm.scheduler.timers)
+        self.assertFalse(scheduler.thread.is_alive())
+
+        scheduler.stop()
+        self.assertNotIn(scheduler, pwm.scheduler.timers)
+
+    def test_stop_not_started(self):
+        scheduler = pwm.scheduler.Scheduler(MagicMock(), 1.0)
+        scheduler.stop()
+        self.assertFalse(scheduler.thread.is_alive())
+
+    def test_run_due(self):
+        func = MagicMock()
+        scheduler = pwm.scheduler.Scheduler(func, 10.0)
+        scheduler.start()
+
+        pwm.scheduler.run_due()
+        pwm.scheduler.run_due()
+
+        func.assert_called_once_with()
+        self.assertGreater(pwm.scheduler.timeout(), 9.0)
+
+    def test_run_due_error(self):
+        func = MagicMock(side_effect=ValueError)
+        pwm.scheduler.Scheduler(func, 10.0).start()
+
+        with patch("logging.exception") as log:
+            pwm.scheduler.run_due()
+
+        log.assert_called_once_with("Scheduler error")
+
+    def test_timeout(self):
+        self.assertIsNone(pwm.scheduler.timeout())
+
+        pwm.scheduler.Scheduler(MagicMock(), 1.0).start()
+        self.assertEqual(pwm.scheduler.timeout(), 0)
+
+    def test_call_later(self):
+        func = MagicMock()
+        pwm.scheduler.call_later(0, func)
+        pwm.scheduler.call_later(10.0, func)
+        self.assertEqual(pwm.scheduler.timeout(), 0)
+
+        pwm.scheduler.run_due()
+
+        func.assert_called_once_with()
+        self.assertGreater(pwm.scheduler.timeout(), 9.0)
+
+
+class TestCallLater(unittest.TestCase):
+    def tearDown(self):
+        pwm.scheduler.destroy()
+
+    def test_destroy(self):
+        func = MagicMock()
+        with patch.object(pwm.worker.tasks, "put") as put:
+            pwm.scheduler.call_later(0.05, func)
+            pwm.scheduler.destroy()
+            time.sleep(0.1)
+
+        self.assertFalse(put.called)
+        self.assertEqual(pwm.scheduler._pending, [])
@@ -0,0 +1,64 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import unittest
+
+import pwm.text
+
+
+class _Context:
+    """A cairo context with a proportional font, every "i" is 2 wide and all
+    other characters are 8 wide."""
+
+    def __init__(self):
+        self.measured = []
+
+    def text_extents(self, text, ext):
+        self.measured.append(text)
+        ext.x_bearing = 0
+        ext.y_bearing = -10
+        ext.width = ext.x_advance = sum(2 if c == "i" else 8 for c in text)
+        ext.height = 10
+        ext.y_advance = 0
+
+
+class TestText(unittest.TestCase):
+    def setUp(self):
+        pwm.text.clear()
+        self.ctx = _Context()
+        self.font = ("DejaVu Sans", 12)
+
+    def tearDown(self):
+        pwm.text.max_entries = 1024
+        pwm.text.clear()
+
+    def test_extents(self):
+        self.assertEqual(pwm.text.extents(self.ctx, self.font, "iii").width, 6)
+        self.assertEqual(pwm.text.extents(self.ctx, self.font, "www").width,
+                         24)
+
+    def test_cached(self):
+        for _ in range(3):
+            ext = pwm.text.extents(self.ctx, self.font, "load 0.15")
+
+        self.assertEqual(self.ctx.measured, ["load 0.15"])
+        self.assertEqual(ext.x_advance, 72)
+
+    def test_font_in_key(self):
+        pwm.text.extents(self.ctx, self.font, "text")
+        pwm.text.extents(self.ctx, ("DejaVu Sans", 14), "text")
+
+        self.assertEqual(self.ctx.measured, ["text", "text"])
+
+    def test_lru(self):
+        pwm.text.max_entries = 2
+
+        pwm.text.extents(self.ctx, self.font, "a")
+        pwm.text.extents(self.ctx, self.font, "b")
+        pwm.text.extents(self.ctx, self.font, "a")
+        # Drops "b", the least recently used.
+        pwm.text.extents(self.ctx, self.font, "c")
+        pwm.text.extents(self.ctx, self.font, "a")
+        pwm.text.extents(self.ctx, self.font, "b")
+
+        self.assertEqual(self.ctx.measured, ["a", "b", "c", "b"])
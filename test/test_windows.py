@@ -1,8 +1,15 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import pickle
+import tracemalloc
 import unittest
+from unittest.mock import patch
 
+from pwm.config import config
+from pwm.ffi.xcb import xcb
+import pwm.rules
+import pwm.layout
 import pwm.workspaces
 import pwm.windows
 import test.util as util
@@ -48,3 +55,142 @@ class TestWindow(unittest.TestCase):
 
         pwm.windows.focus(None)
         self.assertEqual(pwm.windows.focused, None)
+
+    def test_manage_workspace_rule(self):
+        rule = pwm.rules.Rule("name", "pwm-test", workspace=1)
+        wid = pwm.windows.create(0, 0, 100, 100)
+        pwm.windows.set_property(wid, "_NET_WM_NAME", "pwm-test")
+
+        with patch.object(config, "rules", [rule]):
+            pwm.windows.manage(wid)
+
+        self.assertIn(wid, pwm.workspaces.workspaces[1].windows)
+        self.assertNotEqual(wid, pwm.windows.focused)
+
+        pwm.windows.unmanage(wid)
+        pwm.windows.destroy(wid)
+
+    def test_manage_existing(self):
+        wid = pwm.windows.create(0, 0, 100, 100)
+        xcb.core.map_window(wid)
+
+        pwm.windows.manage_existing()
+        self.assertIn(wid, pwm.windows.managed)
+        self.assertIn(wid, pwm.workspaces.current().windows)
+        self.assertEqual(wid, pwm.windows.focused)
+
+        pwm.windows.unmanage(wid)
+        pwm.windows.destroy(wid)
+
+    def test_manage_existing_unmapped(self):
+        wid = pwm.windows.create(0, 0, 100, 100)
+
+        pwm.windows.manage_existing()
+        self.assertNotIn(wid, pwm.windows.managed)
+
+        pwm.windows.destroy(wid)
+
+
+class TestInfo(unittest.TestCase):
+    def test_slots(self):
+        self.assertFalse(hasattr(pwm.windows.Info(), "__dict__"))
+
+    def test_pickle(self):
+        info = pwm.windows.Info()
+        info.urgent = True
+        info.geometry = (1, 2, 3, 4)
+
+        restored = pickle.loads(pickle.dumps(info))
+        self.assertTrue(restored.urgent)
+        self.assertEqual(restored.geometry, (1, 2, 3, 4))
+        self.assertFalse(restored.floating)
+
+    def test_unpickle_dict(self):
+        # This is how Info was stored before it used __slots__.
+        info = pwm.windows.Info.__new__(pwm.windows.Info)
+        info.__setstate__({"ignore_unmaps": 2, "floating": True,
+                           "fullscreen": False, "urgent": False,
+                           "workspace": None, "geometry": None})
+
+        self.assertEqual(info.ignore_unmaps, 2)
+        self.assertTrue(info.floating)
+
+
+class _DictInfo:
+    """Info, Column and Window as they were before they used __slots__."""
+    def __init__(self):
+        self.ignore_unmaps = 0
+        self.floating = False
+        self.fullscreen = False
+        self.urgent = False
+        self.workspace = None
+        self.geometry = None
+
+
+class _DictLayout:
+    def __init__(self, size, value):
+        self.size = size
+        self.value = value
+
+
+@util.benchmark
+class TestWindowBenchmark(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+
+    def tearDown(self):
+        util.tear_down()
+
+    def test_manage_existing(self):
+        for count in (10, 30, 60, 120):
+            wids = [pwm.windows.create(0, 0, 100, 100) for _ in range(count)]
+            for wid in wids:
+                xcb.core.map_window(wid)
+
+            elapsed = util.measure(pwm.windows.manage_existing)
+            util.report("manage_existing with {} windows".format(count),
+                        elapsed)
+
+            for wid in wids:
+                pwm.windows.unmanage(wid)
+                pwm.windows.destroy(wid)
+
+    def test_manage_rules(self):
+        for count in (0, 10, 100, 1000):
+            rules = [pwm.rules.Rule("class", "class{}".format(i))
+                     for i in range(count)]
+
+            def _manage():
+                wid = pwm.windows.create(0, 0, 100, 100)
+                pwm.windows.manage(wid)
+                pwm.windows.unmanage(wid)
+                pwm.windows.destroy(wid)
+
+            with patch.object(config, "rules", rules):
+                elapsed = util.measure(_manage, 20)
+
+            util.report("manage with {} rules".format(count), elapsed)
+
+    def test_memory(self):
+        count = 5000
+
+        def _measure(info, column, window):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+
+            # Every window needs an Info and a layout Window, every column
+            # is shared by a few windows.
+            columns = [column(0.25, []) for _ in range(count // 10)]
+            objects = [(info(), window(1.0, wid)) for wid in range(count)]
+
+            size = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+
+            del columns, objects
+            return size / count
+
+        util.report("bytes per window (dict)",
+                    _measure(_DictInfo, _DictLayout, _DictLayout), "bytes")
+        util.report("bytes per window (slots)",
+                    _measure(pwm.windows.Info, pwm.layout.Column,
+                             pwm.layout.Window), "bytes")
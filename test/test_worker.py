@@ -0,0 +1,66 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pwm.worker
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        pwm.worker.stats["flushes"] = 0
+        pwm.worker.stats["high_water"] = 0
+
+    def tearDown(self):
+        pwm.worker.max_latency = 0.01
+
+    def _run(self, *work):
+        """Queue work and run the worker loop until it exits."""
+        for w in work:
+            pwm.worker.tasks.put(w)
+        pwm.worker.tasks.put(pwm.worker.ExitWorker)
+
+        with patch.object(pwm.worker, "xcb") as xcb:
+            pwm.worker._loop()
+
+        self.assertTrue(pwm.worker.tasks.empty())
+        return xcb.core.flush
+
+    def test_flush_once_per_drain(self):
+        calls = []
+        flush = self._run(*[lambda i=i: calls.append(i) for i in range(3)])
+
+        self.assertEqual(calls, [0, 1, 2])
+        flush.assert_called_once_with()
+        self.assertEqual(pwm.worker.stats["flushes"], 1)
+        self.assertEqual(pwm.worker.stats["high_water"], 4)
+
+    def test_max_latency(self):
+        pwm.worker.max_latency = 0
+        flush = self._run(MagicMock(), MagicMock())
+
+        # Once after every task and once when exiting.
+        self.assertEqual(flush.call_count, 3)
+
+    def test_task_error(self):
+        task = MagicMock()
+
+        with patch("logging.exception") as log:
+            self._run(MagicMock(side_effect=ValueError), task)
+
+        log.assert_called_once_with("Worker task error")
+        task.assert_called_once_with()
+
+    def test_run_pending(self):
+        calls = []
+        pwm.worker.tasks.put(lambda: calls.append(1))
+        pwm.worker.tasks.put(MagicMock(side_effect=ValueError))
+        pwm.worker.tasks.put(lambda: calls.append(2))
+
+        with patch("logging.exception"):
+            pwm.worker.run_pending()
+
+        self.assertEqual(calls, [1, 2])
+        self.assertTrue(pwm.worker.tasks.empty())
@@ -47,7 +47,7 @@ class TestWorkspace(unittest.TestCase):
 
     def test_add_window_tiling_empty(self):
         window = util.create_window()
-        self.tiling.add_window.assert_called_once_with(window, 0, -1)
+        self.tiling.add_window.assert_called_once_with(window, 0, -1, True)
 
     def test_add_window_tiling_below_focus(self):
         wid = util.create_window()
@@ -59,7 +59,7 @@ class TestWorkspace(unittest.TestCase):
             window = util.create_window()
 
         path.assert_called_once_with(wid)
-        self.tiling.add_window.assert_called_once_with(window, 1, 3)
+        self.tiling.add_window.assert_called_once_with(window, 1, 3, True)
 
     def test_add_window_added(self):
         window = util.create_window()
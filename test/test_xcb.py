@@ -0,0 +1,66 @@
+# Copyright (c) 2013 Michael Bitzi
+# Licensed under the MIT license http://opensource.org/licenses/MIT
+
+import functools
+import unittest
+
+from pwm.ffi.xcb import xcb, Cookie, COOKIE_FUNCTIONS
+import test.util as util
+
+
+class TestXcb(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+
+    def tearDown(self):
+        util.tear_down()
+
+    def test_cookie_functions(self):
+        self.assertIn("xcb_get_property", COOKIE_FUNCTIONS)
+        self.assertIn("xcb_intern_atom_unchecked", COOKIE_FUNCTIONS)
+        self.assertIn("xcb_map_window", COOKIE_FUNCTIONS)
+        self.assertNotIn("xcb_get_property_reply", COOKIE_FUNCTIONS)
+        self.assertNotIn("xcb_generate_id", COOKIE_FUNCTIONS)
+
+    def test_cookie(self):
+        cookie = xcb.core.get_geometry(xcb.screen.root)
+        self.assertIsInstance(cookie, Cookie)
+        self.assertEqual(cookie.name, "get_geometry")
+        cookie.discard()
+
+    def test_no_cookie(self):
+        self.assertNotIsInstance(xcb.core.generate_id(), Cookie)
+
+    def test_core_bound_once(self):
+        func = xcb.core.generate_id
+        self.assertIs(xcb.core.generate_id, func)
+        self.assertIn("generate_id", vars(xcb.core))
+
+    def test_constant(self):
+        self.assertEqual(xcb.CW_BACK_PIXEL, xcb.lib.XCB_CW_BACK_PIXEL)
+
+
+@util.benchmark
+class TestXcbBenchmark(unittest.TestCase):
+    def setUp(self):
+        util.setup()
+
+    def tearDown(self):
+        util.tear_down()
+
+    def test_calls(self):
+        number = 100000
+
+        # What every call through core used to cost: a lookup creating two
+        # partials and a check of the return type.
+        def _unbound():
+            func = functools.partial(getattr(xcb.lib, "xcb_generate_id"),
+                                     xcb.conn)
+            retval = func()
+            xcb.ffi.getctype(xcb.ffi.typeof(retval)).rstrip(" *")
+
+        for name, func in [("unbound", _unbound),
+                           ("bound", lambda: xcb.core.generate_id())]:
+            seconds = util.measure(func, number)
+            util.report("xcb calls per second ({})".format(name),
+                        1 / seconds, "calls/s")
@@ -3,17 +3,28 @@
 
 import os
 import glob
+import shutil
+import tempfile
+import time
 import unittest
+from unittest.mock import patch
 
 import pwm.xdg
+import test.util as util
 
 
 class TestXdg(unittest.TestCase):
     def setUp(self):
-        pass
+        # Don't write the application cache of the user.
+        self.tmp = tempfile.mkdtemp()
+        self.patcher = patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp})
+        self.patcher.start()
+        pwm.xdg._cache = None
 
     def tearDown(self):
-        pass
+        self.patcher.stop()
+        pwm.xdg._cache = None
+        shutil.rmtree(self.tmp)
 
     def test_desktop_file_dirs_home(self):
         self.assertIn(os.environ["HOME"] + "/.local/share/applications",
@@ -37,3 +48,245 @@ class TestXdg(unittest.TestCase):
     def test_applications(self):
         self.assertEqual(len(pwm.xdg.applications()),
                          len(pwm.xdg.find_desktop_files()))
+
+
+class CacheTestCase(unittest.TestCase):
+    """Base class for tests using .desktop files in a temporary directory."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.apps = self.tmp + "/data/applications"
+        os.makedirs(self.apps)
+
+        self.patcher = patch.dict(os.environ, {
+            "XDG_DATA_HOME": self.tmp + "/data",
+            "XDG_DATA_DIRS": self.tmp + "/missing",
+            "XDG_CACHE_HOME": self.tmp + "/cache"})
+        self.patcher.start()
+        pwm.xdg._cache = None
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        self.patcher.stop()
+        pwm.xdg._cache = None
+        shutil.rmtree(self.tmp)
+
+    def _touch(self, path):
+        """Give path a new mtime, independent of the file system resolution."""
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+
+    def _write(self, name, app):
+        path = os.path.join(self.apps, name + ".desktop")
+        with open(path, "w") as f:
+            f.write("[Desktop Entry]\nName={}\nExec={}\n".format(app, app))
+        self._touch(path)
+        self._touch(self.apps)
+        return path
+
+    def _applications(self):
+        """Return the applications and the number of parsed files."""
+        with patch.object(pwm.xdg, "parse_desktop_file",
+                          wraps=pwm.xdg.parse_desktop_file) as parse:
+            apps = pwm.xdg.applications()
+        return sorted(app["name"] for app in apps), parse.call_count
+
+
+class TestApplicationCache(CacheTestCase):
+    def test_applications(self):
+        self._write("a", "A")
+        self._write("b", "B")
+        self.assertEqual(self._applications(), (["A", "B"], 2))
+        self.assertTrue(os.path.isfile(pwm.xdg.cache_file()))
+
+    def test_unchanged(self):
+        self._write("a", "A")
+        self._applications()
+        self.assertEqual(self._applications(), (["A"], 0))
+
+    def test_load_cache(self):
+        self._write("a", "A")
+        self._applications()
+
+        pwm.xdg._cache = None
+        with patch.object(pwm.xdg, "_save_cache") as save_cache:
+            self.assertEqual(self._applications(), (["A"], 0))
+        self.assertFalse(save_cache.called)
+
+    def test_invalid_cache(self):
+        self._write("a", "A")
+        os.makedirs(os.path.dirname(pwm.xdg.cache_file()))
+        with open(pwm.xdg.cache_file(), "w") as f:
+            f.write("invalid")
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(self._applications(), (["A"], 1))
+
+    def test_added(self):
+        self._write("a", "A")
+        self._applications()
+
+        self._write("b", "B")
+        self.assertEqual(self._applications(), (["A", "B"], 1))
+
+    def test_changed(self):
+        self._write("a", "A")
+        self._write("b", "B")
+        self._applications()
+
+        self._write("b", "C")
+        self.assertEqual(self._applications(), (["A", "C"], 1))
+
+    def test_changed_in_place(self):
+        path = self._write("a", "A")
+        self._applications()
+
+        # The mtime of the directory stays the same.
+        with open(path, "w") as f:
+            f.write("[Desktop Entry]\nName=B\nExec=b\n")
+        self._touch(path)
+        self.assertEqual(self._applications(), (["B"], 1))
+
+    def test_removed(self):
+        self._write("a", "A")
+        path = self._write("b", "B")
+        self._applications()
+
+        os.remove(path)
+        self._touch(self.apps)
+        self.assertEqual(self._applications(), (["A"], 0))
+
+    def test_removed_directory(self):
+        self._write("a", "A")
+        self._applications()
+
+        # Like after an inotify queue overflow.
+        shutil.rmtree(self.apps)
+        pwm.xdg._invalidate()
+        self.assertEqual(self._applications(), ([], 0))
+        self.assertEqual(pwm.xdg._cache[self.apps], (None, {}))
+
+    def test_invalid_file(self):
+        path = os.path.join(self.apps, "invalid.desktop")
+        with open(path, "w") as f:
+            f.write("[Desktop Entry]\n")
+        self._write("a", "A")
+
+        self.assertEqual(self._applications(), (["A"], 2))
+        self.assertEqual(self._applications(), (["A"], 0))
+
+
+class TestApplicationIndex(CacheTestCase):
+    def tearDown(self):
+        if pwm.xdg.index:
+            pwm.xdg.stop_index()
+        super().tearDown()
+
+    def _wait(self, names):
+        """Wait until the index contains the applications with names."""
+        for _ in range(200):
+            found = sorted(app["name"] for app in pwm.xdg.snapshot())
+            if found == names:
+                break
+            time.sleep(0.01)
+        self.assertEqual(found, names)
+
+    def _converge(self, poll_interval):
+        self._write("a", "A")
+        pwm.xdg.start_index(poll_interval)
+        self._wait(["A"])
+
+        self._write("b", "B")
+        self._wait(["A", "B"])
+
+        # Edited in place, the directory does not change.
+        with open(os.path.join(self.apps, "a.desktop"), "w") as f:
+            f.write("[Desktop Entry]\nName=C\nExec=c\n")
+        self._touch(os.path.join(self.apps, "a.desktop"))
+        self._wait(["B", "C"])
+
+        os.remove(os.path.join(self.apps, "b.desktop"))
+        self._wait(["C"])
+
+    def test_inotify(self):
+        if not pwm.xdg._inotify():
+            self.skipTest("inotify is not available")
+        self._converge(60)
+
+    def test_polling(self):
+        with patch.object(pwm.xdg, "_inotify", return_value=None):
+            self._converge(0.01)
+
+    def test_new_directory(self):
+        pwm.xdg.start_index(0.01)
+        self._wait([])
+
+        self.apps = self.tmp + "/missing/applications"
+        os.makedirs(self.apps)
+        self._write("a", "A")
+        self._wait(["A"])
+
+        # Changes in the new directory are found as well.
+        self._write("b", "B")
+        self._wait(["A", "B"])
+
+    def test_new_directory_inotify(self):
+        if not pwm.xdg._inotify():
+            self.skipTest("inotify is not available")
+
+        # Only the parent is watched, the next poll is far away.
+        os.rmdir(self.apps)
+        pwm.xdg.start_index(60)
+        self._wait([])
+
+        os.makedirs(self.apps)
+        self._write("a", "A")
+        self._wait(["A"])
+        self.assertIn(self.apps, pwm.xdg.index.watches.values())
+        self.assertNotIn(self.tmp + "/data", pwm.xdg.index.parents.values())
+
+    def test_inotify_no_polling(self):
+        if not pwm.xdg._inotify():
+            self.skipTest("inotify is not available")
+
+        # The missing directory has a parent which can be watched.
+        os.makedirs(self.tmp + "/missing")
+        self._write("a", "A")
+        pwm.xdg.start_index(0.01)
+        self._wait(["A"])
+        self.assertTrue(pwm.xdg.index.parents)
+
+        with patch.object(pwm.xdg.index, "update") as update:
+            time.sleep(0.1)
+        self.assertFalse(update.called)
+
+    def test_unchanged(self):
+        self._write("a", "A")
+        with patch.object(pwm.xdg, "_inotify", return_value=None):
+            pwm.xdg.start_index(0.01)
+            self._wait(["A"])
+            applications = pwm.xdg.snapshot()
+
+            with patch.object(pwm.xdg, "_save_cache") as save_cache:
+                time.sleep(0.1)
+            self.assertFalse(save_cache.called)
+            self.assertEqual(pwm.xdg.snapshot(), applications)
+
+    def test_snapshot_without_index(self):
+        self._write("a", "A")
+        self.assertEqual([app["name"] for app in pwm.xdg.snapshot()], ["A"])
+
+
+@util.benchmark
+class TestApplicationCacheBenchmark(CacheTestCase):
+    def test_menu_open(self):
+        for i in range(1500):
+            self._write("app{}".format(i), "App {}".format(i))
+
+        def _uncached():
+            pwm.xdg._cache = {}
+            pwm.xdg.applications()
+
+        util.report("1500 applications, no cache", util.measure(_uncached, 5))
+        util.report("1500 applications, cached",
+                    util.measure(pwm.xdg.applications, 100))
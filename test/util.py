@@ -1,12 +1,18 @@
 # Copyright (c) 2013 Michael Bitzi
 # Licensed under the MIT license http://opensource.org/licenses/MIT
 
+import os
+import sys
+import time
+import unittest
 from unittest.mock import patch
 
 from pwm.config import config
 from pwm.ffi.xcb import xcb
 import pwm.root
 import pwm.bar
+import pwm.scheduler
+import pwm.worker
 import pwm.workspaces
 
 connected = False
@@ -29,6 +35,9 @@ def setup():
 
 def tear_down():
     destroy_created_windows()
+    # Finish the work deferred by the test, e.g. throttled bar renders.
+    pwm.scheduler.destroy()
+    pwm.worker.run_pending()
     pwm.bar.destroy()
     pwm.workspaces.destroy()
     pwm.windows.managed = {}
@@ -65,3 +74,33 @@ def destroy_created_windows():
             pwm.windows.unmanage(wid)
         pwm.windows.destroy(wid)
     created_windows = []
+
+
+def benchmark(obj):
+    """Decorator for benchmark tests.
+
+    Benchmarks take some time, they are only run if the PWM_BENCHMARK
+    environment variable is set.
+    """
+    return unittest.skipUnless(os.environ.get("PWM_BENCHMARK"),
+                               "set PWM_BENCHMARK=1 to run benchmarks")(obj)
+
+
+def measure(func, number=1):
+    """Call func number times and return the average time in seconds."""
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+def report(name, value, unit="s"):
+    """Print the result of a benchmark.
+
+    Times are given in seconds and printed in a readable unit.
+    """
+    if unit == "s" and value < 0.001:
+        value, unit = value * 1000000, "us"
+    elif unit == "s":
+        value, unit = value * 1000, "ms"
+    print("\n{}: {:.3f} {}".format(name, value, unit), file=sys.stderr)